@@ -0,0 +1,90 @@
+# LSystemAnalysis.py
+#   Predicts the size of an expanded L-system without expanding it. Every
+#   production maps one symbol to a fixed multiset of symbols, so the symbol
+#   counts of level n+1 are the counts of level n multiplied by the grammar's
+#   growth matrix. The matrix is sparse (one row per production), so applying
+#   it is a few dictionary operations per symbol and iteration, and the counts
+#   are exact Python integers however large they get.
+#   For stochastic grammars the rows are the weighted averages of the
+#   alternatives, so the counts are expected values. Conditions of parametric
+#   productions are not evaluated, so every production of a symbol is assumed
+#   to apply equally often in proportion to its weight. The counts of such
+#   grammars are marked as estimates: the real size can be above or below.
+
+import LSystemGrammar
+
+# Predicted size of one level of the expansion
+class Counts(object):
+    def __init__(self, symbols, branches, flowers, estimate=False):
+        self.symbols = symbols
+        self.branches = branches
+        self.flowers = flowers
+        self.estimate = estimate
+
+    # number of instances the node would output
+    def instances(self):
+        return self.branches + self.flowers
+
+# occurrences of every symbol in a string
+def symbolCounts(string):
+    counts = {}
+    for symbol in string:
+        counts[symbol] = counts.get(symbol, 0) + 1
+    return counts
+
+# sparse growth matrix: for every symbol with a production, the symbol counts
+# of its successor. Symbols without a production map to themselves.
+def growthMatrix(grammar):
+    growth = dict((symbol, symbolCounts(successor)) for symbol, successor in grammar.rules.items())
+    for symbol, alternatives in grammar.productions.items():
+        total = sum(production.weight for production in alternatives) or 1.0
+        row = {}
+        for production in alternatives:
+            for produced, times in symbolCounts(production.symbols).items():
+                row[produced] = row.get(produced, 0) + times * production.weight / total
+        growth[symbol] = row
+    return growth
+
+# true if the predicted counts of a grammar are estimates: a symbol with
+# alternatives, conditions or parameters may not be rewritten as predicted
+def predictsEstimates(grammar):
+    return any(len(alternatives) > 1 or production.condition or production.parameters is not None
+               for alternatives in grammar.productions.values() for production in alternatives)
+
+# returns the predicted Counts of every level from 0 (the axiom) to iterations
+def predictCounts(grammar, iterations):
+    growth = growthMatrix(grammar)
+    estimate = predictsEstimates(grammar)
+    counts = symbolCounts(LSystemGrammar.moduleSymbols(grammar.axiom))
+    levels = [countsOf(counts, estimate)]
+    for level in range(iterations):
+        rewritten = {}
+        for symbol, count in counts.items():
+            row = growth.get(symbol)
+            if (row is None):
+                rewritten[symbol] = rewritten.get(symbol, 0) + count
+                continue
+            for produced, times in row.items():
+                rewritten[produced] = rewritten.get(produced, 0) + count * times
+        counts = rewritten
+        levels.append(countsOf(counts, estimate))
+    return levels
+
+def countsOf(counts, estimate=False):
+    return Counts(whole(sum(counts.values())), whole(counts.get(u'F', 0)), whole(counts.get(u'*', 0)), estimate)
+
+# expected counts are rounded, exact ones kept as they are
+def whole(count):
+    return int(round(count)) if isinstance(count, float) else count
+
+# the highest level that stays within the budgets (0 means no limit), or None
+# if even the axiom does not
+def levelWithinBudget(levels, maxInstances, maxSymbols):
+    fitting = None
+    for level, counts in enumerate(levels):
+        if (maxInstances > 0 and counts.instances() > maxInstances):
+            break
+        if (maxSymbols > 0 and counts.symbols > maxSymbols):
+            break
+        fitting = level
+    return fitting
@@ -0,0 +1,169 @@
+# LSystemArrays.py
+#   Converts the branches and flowers produced by the L-system into the
+#   position / scale / aimDirection arrays used by the Maya instancer, for the
+#   whole tree at once. The L-system works with z up, so y and z are swapped,
+#   either here or by the engine as it produces the rows (see mayaArrays).
+
+import ctypes
+
+import numpy as np
+
+try:
+    import maya.OpenMaya as OpenMaya
+except ImportError:
+    OpenMaya = None
+
+# zero-copy N x columns view of the rows of an LSystemPy.FloatBuffer
+def bufferArray(buffer):
+    if (len(buffer.data) == 0):
+        return np.zeros((0, buffer.columns), dtype=np.float32)
+    return np.frombuffer(buffer.data, dtype=np.float32).reshape(-1, buffer.columns)
+
+# the branches and flowers of the engine as N x 6 and N x 3 arrays in Maya's
+# coordinates. Buffers filled with swapYZ are wrapped as they are, anything
+# else is converted and swapped.
+def mayaArrays(branches, flowers):
+    if (getattr(branches, 'swapYZ', False) and getattr(flowers, 'swapYZ', False)):
+        return bufferArray(branches), bufferArray(flowers)
+    branches = np.asarray(list(branches), dtype=np.float64).reshape(-1, 6)[:, [0, 2, 1, 3, 5, 4]]
+    flowers = [flower[:3] for flower in flowers]
+    flowers = np.asarray(flowers, dtype=np.float64).reshape(-1, 3)[:, [0, 2, 1]]
+    return branches, flowers
+
+# turns a sequence of branches (start x, y, z, end x, y, z) into instancer
+# positions (midpoints), scales (length, radius, radius) and aim directions.
+# swapYZ converts from the L-system's coordinates, for branches that are not
+# in Maya's yet.
+def branchArrays(branches, step, swapYZ=True):
+    branches = np.asarray(branches, dtype=np.float64).reshape(-1, 6)
+    start, end = branches[:, :3], branches[:, 3:]
+    if (swapYZ):
+        start, end = start[:, [0, 2, 1]], end[:, [0, 2, 1]]
+
+    positions = (start + end) * 0.5
+    aims = end - start
+    scales = np.empty_like(aims)
+    scales[:, 0] = np.sqrt(np.einsum('ij,ij->i', aims, aims))
+    scales[:, 1:] = step * 0.1
+    return positions, scales, aims
+
+# turns a sequence of flowers (x, y, z, ...) into instancer positions and scales
+def flowerArrays(flowers, step, swapYZ=True):
+    flowers = np.asarray(flowers, dtype=np.float64)
+    if (flowers.size == 0):
+        flowers = np.zeros((0, 3))
+    else:
+        flowers = flowers.reshape(len(flowers), -1)
+    positions = flowers[:, [0, 2, 1]] if swapYZ else flowers[:, :3]
+    scales = np.full_like(positions, step * 0.2)
+    return positions, scales
+
+# every instancer array of a tree: branch positions, scales and aim directions,
+# then flower positions and scales
+def instancerArrays(branches, flowers, step, swapYZ=True):
+    return branchArrays(branches, step, swapYZ) + flowerArrays(flowers, step, swapYZ)
+
+# an MScriptUtil holding a copy of a contiguous array, zero-filled by
+# createFromList and then overwritten with the bytes of the array in one
+# memmove, instead of converting every value to a Python object. getPointer
+# is the MScriptUtil accessor of the C type of the array.
+def scriptUtil(values, zero, getPointer):
+    util = OpenMaya.MScriptUtil()
+    util.createFromList([zero] * values.size, values.size)
+    pointer = getPointer(util)
+    ctypes.memmove(int(pointer), values.ctypes.data, values.nbytes)
+    return util, pointer
+
+# replaces the contents of an MVectorArray with an N x 3 array in one copy
+def fillVectorArray(vectorArray, values):
+    values = np.ascontiguousarray(values, dtype=np.float64).reshape(-1, 3)
+    if (len(values) == 0):
+        vectorArray.clear()
+        return
+    util, pointer = scriptUtil(values, 0.0, OpenMaya.MScriptUtil.asDouble3Ptr)
+    vectorArray.copy(OpenMaya.MVectorArray(pointer, len(values)))
+
+# replaces the contents of an MPointArray with an N x 3 array in one copy
+def fillPointArray(pointArray, values):
+    values = np.ascontiguousarray(values, dtype=np.float64).reshape(-1, 3)
+    if (len(values) == 0):
+        pointArray.clear()
+        return
+    points = np.ones((len(values), 4))
+    points[:, :3] = values
+    util, pointer = scriptUtil(points, 0.0, OpenMaya.MScriptUtil.asDouble4Ptr)
+    pointArray.copy(OpenMaya.MPointArray(pointer, len(points)))
+
+# replaces the contents of an MIntArray with a sequence of integers in one copy
+def fillIntArray(intArray, values):
+    values = np.ascontiguousarray(values, dtype=np.intc).ravel()
+    if (len(values) == 0):
+        intArray.clear()
+        return
+    util, pointer = scriptUtil(values, 0, OpenMaya.MScriptUtil.asIntPtr)
+    intArray.copy(OpenMaya.MIntArray(pointer, len(values)))
+
+# replaces the contents of an MDoubleArray with a sequence of numbers in one copy
+def fillDoubleArray(doubleArray, values):
+    values = np.ascontiguousarray(values, dtype=np.float64).ravel()
+    if (len(values) == 0):
+        doubleArray.clear()
+        return
+    util, pointer = scriptUtil(values, 0.0, OpenMaya.MScriptUtil.asDoublePtr)
+    doubleArray.copy(OpenMaya.MDoubleArray(pointer, len(values)))
+
+# copy of count values of a C type at the address of a SWIG pointer, such as
+# the ones MScriptUtil hands out
+def pointerValues(pointer, cType, count):
+    return np.ctypeslib.as_array((cType * count).from_address(int(pointer))).copy()
+
+# the contents of an MPointArray as an N x 3 array, in one copy
+def pointArrayValues(pointArray):
+    length = pointArray.length()
+    if (length == 0):
+        return np.zeros((0, 3))
+    util = OpenMaya.MScriptUtil()
+    util.createFromList([0.0] * (4 * length), 4 * length)
+    pointer = util.asDouble4Ptr()
+    pointArray.get(pointer)
+    return pointerValues(pointer, ctypes.c_double, 4 * length).reshape(-1, 4)[:, :3]
+
+# the contents of an MIntArray as an array of integers, in one copy
+def intArrayValues(intArray):
+    length = intArray.length()
+    if (length == 0):
+        return np.zeros(0, dtype=np.int64)
+    util = OpenMaya.MScriptUtil()
+    util.createFromList([0] * length, length)
+    pointer = util.asIntPtr()
+    intArray.get(pointer)
+    return pointerValues(pointer, ctypes.c_int, length).astype(np.int64)
+
+# the contents of an MFloatVectorArray as an N x 3 array, in one copy
+def floatVectorArrayValues(vectorArray):
+    length = vectorArray.length()
+    if (length == 0):
+        return np.zeros((0, 3))
+    util = OpenMaya.MScriptUtil()
+    util.createFromList([0.0] * (3 * length), 3 * length)
+    pointer = util.asFloat3Ptr()
+    vectorArray.get(pointer)
+    return pointerValues(pointer, ctypes.c_float, 3 * length).reshape(-1, 3).astype(np.float64)
+
+# an MFloatPointArray of an N x 3 array, in one copy
+def floatPointArray(values):
+    values = np.asarray(values, dtype=np.float64).reshape(-1, 3)
+    if (len(values) == 0):
+        return OpenMaya.MFloatPointArray()
+    points = np.ones((len(values), 4), dtype=np.float32)
+    points[:, :3] = values
+    util, pointer = scriptUtil(points, 0.0, OpenMaya.MScriptUtil.asFloat4Ptr)
+    return OpenMaya.MFloatPointArray(pointer, len(points))
+
+# an MFloatArray of a sequence of numbers, in one copy
+def floatArray(values):
+    values = np.ascontiguousarray(values, dtype=np.float32).ravel()
+    if (len(values) == 0):
+        return OpenMaya.MFloatArray()
+    util, pointer = scriptUtil(values, 0.0, OpenMaya.MScriptUtil.asFloatPtr)
+    return OpenMaya.MFloatArray(pointer, len(values))
@@ -0,0 +1,82 @@
+# LSystemBackground.py
+#   Runs L-system evaluations on a worker thread so that compute can return
+#   straight away. Only the most recent request matters: a request replaces
+#   any request that has not started yet, and a finished result is dropped if
+#   a newer request arrived while it was being computed. stop() drops the
+#   pending request and ends the worker once its current run returns, a later
+#   request starts a new worker.
+
+import threading
+import traceback
+
+class BackgroundEvaluator(object):
+    # function(*arguments) does the work on the worker thread, and ready() is
+    # called from the worker thread whenever a result is available
+    def __init__(self, function, ready):
+        self.function = function
+        self.ready = ready
+        self.condition = threading.Condition()
+        self.latest = None
+        self.pending = None
+        self.running = None
+        self.finished = None
+        self.thread = None
+        self.stopped = False
+
+    # asks for the result of a parameter set, identified by key
+    def request(self, key, arguments):
+        with self.condition:
+            self.latest = key
+            self.stopped = False
+            if (key == self.running or (self.finished is not None and self.finished[0] == key)):
+                # an older request waiting behind it is not wanted anymore
+                self.pending = None
+                return
+            self.pending = (key, arguments)
+            if (self.thread is None):
+                self.thread = threading.Thread(target=self.work)
+                self.thread.daemon = True
+                self.thread.start()
+            self.condition.notify()
+
+    # the finished result for key, or None if it is not ready
+    def take(self, key):
+        with self.condition:
+            if (self.finished is not None and self.finished[0] == key):
+                return self.finished[1]
+            return None
+
+    # drops the pending request and lets the worker thread end, ready() is not
+    # called for the run in progress
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.pending = None
+            self.latest = None
+            self.condition.notify()
+
+    def work(self):
+        while (True):
+            with self.condition:
+                while (self.pending is None and not self.stopped):
+                    self.condition.wait()
+                if (self.stopped):
+                    self.thread = None
+                    return
+                key, arguments = self.pending
+                self.pending = None
+                self.running = key
+
+            try:
+                value = self.function(*arguments)
+            except Exception:
+                traceback.print_exc()
+                value = None
+
+            with self.condition:
+                self.running = None
+                # superseded or stopped while it was running
+                if (value is None or key != self.latest or self.stopped):
+                    continue
+                self.finished = (key, value)
+            self.ready()
@@ -0,0 +1,172 @@
+# LSystemBaked.py
+#   Compact on-disk format for computed L-system arrays. A file starts with the
+#   magic "LSYB", a version and the length of a JSON header, followed by the
+#   header and then little-endian float32 blocks, each aligned to 16 bytes.
+#   The header holds free-form information (grammar, angle, step, ...) and the
+#   name, shape and offset of every block, so that blocks can be memory-mapped
+#   straight from the file without reading it. BakedCache keeps such files in
+#   a directory as a persistent cache of evaluations.
+
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+MAGIC = b'LSYB'
+VERSION = 1
+ALIGNMENT = 16
+EXTENSION = '.lsyb'
+TEMPORARY = '.lsyb.tmp'
+
+# age in seconds after which a temporary file is assumed to be abandoned
+STALE = 3600
+
+# The contents of a baked file: its header information and its blocks
+class Baked(object):
+    def __init__(self, info, blocks):
+        self.info = info
+        self.blocks = blocks
+
+def align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+# writes named 2D arrays (a sequence of (name, array) pairs) and a dictionary
+# of information. The file is written next to the target and then moved over
+# it, so readers never see a partly written file.
+def write(path, blocks, info):
+    arrays = [(name, np.ascontiguousarray(values, dtype='<f4')) for name, values in blocks]
+    arrays = [(name, values.reshape(len(values), -1) if values.ndim != 2 else values) for name, values in arrays]
+
+    # the offsets depend on the header length, which depends on the offsets
+    header = b''
+    while (True):
+        offset = align(len(MAGIC) + 8 + len(header))
+        layout = []
+        for name, values in arrays:
+            layout.append([name, values.shape[0], values.shape[1], offset])
+            offset = align(offset + values.nbytes)
+        encoded = json.dumps({u'info': info, u'blocks': layout}, sort_keys=True).encode('utf-8')
+        if (encoded == header):
+            break
+        header = encoded
+
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temporary = tempfile.mkstemp(suffix=TEMPORARY, dir=directory)
+    try:
+        with os.fdopen(handle, 'wb') as bakedFile:
+            bakedFile.write(MAGIC + struct.pack('<II', VERSION, len(header)) + header)
+            for (name, values), (_, rows, columns, offset) in zip(arrays, layout):
+                bakedFile.write(b'\0' * (offset - bakedFile.tell()))
+                bakedFile.write(values.tobytes())
+        replaceFile(temporary, path)
+    except:
+        if (os.path.exists(temporary)):
+            os.remove(temporary)
+        raise
+
+# moves a file over another one in a single step
+def replaceFile(source, target):
+    if (hasattr(os, 'replace')):
+        os.replace(source, target)
+        return
+    # Python 2 cannot rename over an existing file on Windows
+    if (os.name == 'nt' and os.path.exists(target)):
+        os.remove(target)
+    os.rename(source, target)
+
+# reads the header of a baked file: (info, layout)
+def readHeader(path):
+    with open(path, 'rb') as bakedFile:
+        start = bakedFile.read(len(MAGIC) + 8)
+        if (len(start) < len(MAGIC) + 8 or start[:len(MAGIC)] != MAGIC):
+            raise ValueError('%s is not a baked L-system file' % path)
+        version, length = struct.unpack('<II', start[len(MAGIC):])
+        if (version != VERSION):
+            raise ValueError('%s has unsupported version %d' % (path, version))
+        header = json.loads(bakedFile.read(length).decode('utf-8'))
+    return header[u'info'], header[u'blocks']
+
+# opens a baked file, with every block memory-mapped read only
+def read(path):
+    info, layout = readHeader(path)
+    size = os.path.getsize(path)
+    blocks = OrderedDict()
+    for name, rows, columns, offset in layout:
+        if (offset + rows * columns * 4 > size):
+            raise ValueError('%s is truncated' % path)
+        if (rows * columns == 0):
+            blocks[name] = np.zeros((rows, columns), dtype='<f4')
+        else:
+            blocks[name] = np.memmap(path, dtype='<f4', mode='r', offset=offset, shape=(rows, columns))
+    return Baked(info, blocks)
+
+# name of a cache entry: a hash of the grammar text and of the parameters that
+# change the result
+def cacheName(text, parameters):
+    digest = hashlib.sha1(text.encode('utf-8'))
+    digest.update(json.dumps([VERSION] + list(parameters)).encode('utf-8'))
+    return digest.hexdigest()
+
+# Baked files kept in a directory that several Maya sessions or farm jobs may
+# share. Files are only ever replaced in one step, so readers see either a
+# whole file or none. A hit touches the file, and once the files take more
+# than `limit` bytes the least recently touched ones are deleted. A process
+# that finds a file gone (or, on Windows, cannot delete a file another process
+# has mapped) just treats it as a miss or skips it.
+class BakedCache(object):
+    def __init__(self, directory, limit):
+        self.directory = directory
+        self.limit = limit
+
+    def path(self, name):
+        return os.path.join(self.directory, name + EXTENSION)
+
+    # the Baked for name, or None
+    def get(self, name):
+        path = self.path(name)
+        try:
+            baked = read(path)
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return baked
+
+    def put(self, name, blocks, info):
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            # it already exists, or was just created by another process
+            pass
+        write(self.path(name), blocks, info)
+        self.evict()
+
+    # deletes the least recently used files until the cache fits in its limit,
+    # and temporary files left behind by writers that crashed
+    def evict(self):
+        files = []
+        now = time.time()
+        for entry in os.listdir(self.directory):
+            path = os.path.join(self.directory, entry)
+            try:
+                stat = os.stat(path)
+                if (entry.endswith(EXTENSION)):
+                    files.append((stat.st_mtime, stat.st_size, path))
+                elif (entry.endswith(TEMPORARY) and now - stat.st_mtime > STALE):
+                    os.remove(path)
+            except OSError:
+                continue
+
+        used = sum(size for mtime, size, path in files)
+        for mtime, size, path in sorted(files):
+            if (used <= self.limit):
+                break
+            try:
+                os.remove(path)
+                used -= size
+            except OSError:
+                continue
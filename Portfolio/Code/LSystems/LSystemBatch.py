@@ -0,0 +1,126 @@
+# LSystemBatch.py
+#   Generates many variants of one grammar without Maya, on a process pool, and
+#   bakes each one to a file that LSystemInstanceNode loads through its
+#   bakedFile attribute. Every parameter takes a list and/or ranges, and every
+#   combination is generated:
+#
+#       mayapy LSystemBatch.py tree.txt -o forest --angle 18:28:2 --step 1
+#           --iterations 4,5 --seed 0:9
+#
+#   A range is start:stop[:increment] and includes stop. The files are named
+#   after the grammar and the parameters, and hold the branches (start x, y, z,
+#   end x, y, z) and flowers (x, y, z) in the L-system's coordinates. The seed
+#   picks the alternatives of stochastic grammars.
+
+import argparse
+import hashlib
+import io
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+try:
+    import LSystem
+except ImportError:
+    # the compiled engine is not built, use the pure-Python one
+    import LSystemPy as LSystem
+import LSystemAnalysis
+import LSystemBaked
+import LSystemGrammar
+import LSystemPy
+
+# parses "a,b,start:stop[:increment],..." into a list of numbers
+def parseValues(text, kind):
+    values = []
+    for item in text.split(u','):
+        parts = [kind(part) for part in item.split(u':')]
+        if (len(parts) == 1):
+            values.append(parts[0])
+            continue
+        start, stop = parts[0], parts[1]
+        increment = parts[2] if len(parts) > 2 else kind(1)
+        if (increment <= 0):
+            raise ValueError('the increment of %s must be positive' % item)
+        count = int((stop - start) / float(increment) + 1e-9) + 1
+        values.extend(start + increment * i for i in range(max(count, 0)))
+    return values
+
+# file name of one variant
+def variantName(name, angle, step, iterations, seed):
+    return '%s_a%g_s%g_i%d_r%d.lsyb' % (name, angle, step, iterations, seed)
+
+# runs in a pool process: generates and bakes one variant
+def bakeVariant(job):
+    text, angle, step, iterations, seed, path = job
+    grammar = LSystemGrammar.parseGrammar(text)
+    # stochastic and parametric grammars are only run by the Python engine
+    engine = LSystemPy if grammar.extended else LSystem
+    lsystem = engine.LSystem()
+    lsystem.setDefaultAngle(angle)
+    lsystem.setDefaultStep(step)
+    LSystemPy.loadProgramText(lsystem, text)
+    if (grammar.extended):
+        lsystem.setSeed(seed)
+    branches = engine.VectorPyBranch()
+    flowers = engine.VectorPyBranch()
+    lsystem.processPy(iterations, branches, flowers)
+
+    info = {u'grammar': hashlib.sha1(text.encode('utf-8')).hexdigest(), u'angle': angle, u'step': step,
+            u'iterations': iterations, u'seed': seed,
+            u'symbols': LSystemAnalysis.predictCounts(grammar, iterations)[-1].symbols}
+    # shaped explicitly, so that a tree without flowers still has a 0 x 3 block
+    branchArray = np.array(list(branches), dtype=np.float32).reshape(-1, 6)
+    flowerArray = np.array([flower[:3] for flower in flowers], dtype=np.float32).reshape(-1, 3)
+    LSystemBaked.write(path, [(u'branches', branchArray), (u'flowers', flowerArray)], info)
+    return len(branches), len(flowers)
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Bake variants of an L-system grammar for LSystemInstanceNode.')
+    parser.add_argument('grammar', help='grammar file')
+    parser.add_argument('-o', '--output', default='.', help='directory for the baked files')
+    parser.add_argument('--angle', default='22.5', help='angles in degrees')
+    parser.add_argument('--step', default='1', help='step lengths')
+    parser.add_argument('--iterations', default='1', help='iteration counts')
+    parser.add_argument('--seed', default='0', help='random seeds')
+    parser.add_argument('-p', '--processes', type=int, default=multiprocessing.cpu_count(),
+                        help='number of processes (default: one per core)')
+    options = parser.parse_args(arguments)
+
+    with io.open(options.grammar, encoding='utf-8') as grammarFile:
+        text = grammarFile.read()
+    name = os.path.splitext(os.path.basename(options.grammar))[0]
+    if (not os.path.isdir(options.output)):
+        os.makedirs(options.output)
+
+    jobs = []
+    for angle, step, iterations, seed in itertools.product(parseValues(options.angle, float),
+                                                           parseValues(options.step, float),
+                                                           parseValues(options.iterations, int),
+                                                           parseValues(options.seed, int)):
+        path = os.path.join(options.output, variantName(name, angle, step, iterations, seed))
+        jobs.append((text, angle, step, iterations, seed, path))
+
+    start = time.time()
+    pool = multiprocessing.Pool(max(options.processes, 1))
+    try:
+        totals = [0, 0]
+        for done, (branches, flowers) in enumerate(pool.imap_unordered(bakeVariant, jobs), 1):
+            totals[0] += branches
+            totals[1] += flowers
+            sys.stdout.write('\r%d / %d trees' % (done, len(jobs)))
+            sys.stdout.flush()
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    elapsed = time.time() - start
+
+    sys.stdout.write('\n%d trees (%d branches, %d flowers) in %.2f s: %.2f trees/s on %d processes\n' %
+                     (len(jobs), totals[0], totals[1], elapsed, len(jobs) / max(elapsed, 1e-9), options.processes))
+
+if __name__ == '__main__':
+    main()
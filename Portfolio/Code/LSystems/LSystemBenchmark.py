@@ -0,0 +1,261 @@
+# LSystemBenchmark.py
+#   Measures the L-system path of LSystemInstanceNode without Maya, so that
+#   performance changes can be tracked from one version to the next. Every
+#   grammar of a small corpus from The Algorithmic Beauty of Plants is run at
+#   increasing iteration counts through the stages of an evaluation:
+#
+#       parse     reading the grammar text
+#       expand    rewriting the axiom level by level
+#       turtle    interpreting the expanded string into branches and flowers
+#       convert   building the instancer arrays, as the node does with numpy
+#       loop      the same with one MVector at a time, as without numpy (--loop)
+#
+#   For every stage it reports the best time over the repeats, the throughput
+#   (symbols/s for parse and expand, segments/s for the others) and the peak
+#   allocation per segment, measured in a separate traced run. The Maya
+#   arrays are replaced by OpenMayaStandIn, which only stores what it is
+#   given, so convert and loop time the Python side of the conversion. The
+#   results are written as JSON:
+#
+#       python LSystemBenchmark.py -o results.json --repeat 5 --limit 5000000
+
+from __future__ import division
+
+import argparse
+import ctypes
+import io
+import json
+import math
+import platform
+import sys
+import time
+
+import numpy as np
+
+try:
+    import LSystem
+except ImportError:
+    # the compiled engine is not built, use the pure-Python one
+    import LSystemPy as LSystem
+import LSystemAnalysis
+import LSystemArrays
+import LSystemGrammar
+import LSystemProfile
+import LSystemPy
+
+# (name, grammar, angle, iteration counts), after the figures of the book
+CORPUS = [
+    (u'fig1.24a', u'F\nF->F[+F]F[-F]F', 25.7, (3, 4, 5, 6)),
+    (u'fig1.24b', u'F\nF->F[+F]F[-F][F]', 20.0, (3, 4, 5, 6)),
+    (u'fig1.24c', u'F\nF->FF-[-F+F+F]+[+F-F-F]', 22.5, (2, 3, 4, 5)),
+    (u'fig1.24d', u'X\nX->F[+X]F[-X]+X\nF->FF', 20.0, (5, 6, 7, 8)),
+    (u'fig1.24e', u'X\nX->F[+X][-X]FX\nF->FF', 25.7, (5, 6, 7, 8)),
+    (u'fig1.24f', u'X\nX->F-[[X]+X]+F[+FX]-X\nF->FF', 22.5, (3, 4, 5, 6)),
+    (u'fig1.9', u'F-F-F-F\nF->F-F+F+FF-F-F+F', 90.0, (2, 3, 4)),
+    # the bush of fig. 1.25, with flowers in place of its leaves and no colors
+    (u'fig1.25', u'A\nA->[&FA*]/////[&FA*]///////[&FA*]\nF->S/////F\nS->F', 22.5, (4, 5, 6, 7)),
+    (u'fig1.27', u'F\nF->(1)F[+F]F[-F]F\nF->(1)F[+F]F\nF->(1)F[-F]F', 25.7, (4, 5, 6, 7)),
+    # a parametric tree in the style of chapter 2
+    (u'parametric', u'A(1,10)\nA(l,w):l>0.01->F(l)[&(30)A(l*0.6,w*0.7)]/(137.5)[&(30)A(l*0.6,w*0.7)]'
+                u'/(137.5)A(l*0.9,w*0.7)', 30.0, (4, 5, 6, 7)),
+]
+
+# Stand-ins for the OpenMaya classes the conversion uses. They keep what they
+# are given as Python objects, so they cost no more than the real ones do on
+# the Python side.
+class MVector(object):
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x, self.y, self.z = x, y, z
+
+    def length(self):
+        return math.sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
+
+class MArray(object):
+    def __init__(self, values=None, length=0):
+        self.values = [] if values is None else values
+
+    def append(self, value):
+        self.values.append(value)
+
+    def clear(self):
+        self.values = []
+
+    def copy(self, other):
+        self.values = other.values
+
+    def length(self):
+        return len(self.values)
+
+# the buffer of an MScriptUtil, whose address int() gives as for a SWIG pointer
+class Pointer(object):
+    def __init__(self, buffer):
+        self.values = buffer
+
+    def __int__(self):
+        return ctypes.addressof(self.values)
+
+class MScriptUtil(object):
+    def createFromList(self, values, length):
+        cType = ctypes.c_int if length and isinstance(values[0], int) else ctypes.c_double
+        self.buffer = (cType * length)()
+
+    def asDouble3Ptr(self):
+        return Pointer(self.buffer)
+
+    asDouble4Ptr = asDoublePtr = asIntPtr = asDouble3Ptr
+
+class MFnArrayAttrsData(object):
+    def create(self):
+        self.arrays = {}
+        return self
+
+    def vectorArray(self, name):
+        return self.arrays.setdefault(name, MArray())
+
+    doubleArray = vectorArray
+
+class OpenMayaStandIn(object):
+    MVector = MVector
+    MVectorArray = MArray
+    MPointArray = MArray
+    MDoubleArray = MArray
+    MIntArray = MArray
+    MScriptUtil = MScriptUtil
+    MFnArrayAttrsData = MFnArrayAttrsData
+
+# the branches and flowers output objects with numpy, as createOutputs builds them
+def convert(branches, flowers, step):
+    outputs = []
+    for names in ((u'position', u'scale', u'aimDirection'), (u'position', u'scale')):
+        data = MFnArrayAttrsData()
+        data.create()
+        outputs.append([data.vectorArray(name) for name in names])
+    arrays = LSystemArrays.instancerArrays(branches, flowers, step, swapYZ=False)
+    for vectorArray, values in zip(outputs[0] + outputs[1], arrays):
+        LSystemArrays.fillVectorArray(vectorArray, values)
+    return outputs
+
+# the same without numpy, one MVector at a time from the engine's rows
+def convertLoop(branches, flowers, step):
+    positions, scales, aims = MArray(), MArray(), MArray()
+    radius = step * 0.1
+    for branch in branches:
+        positions.append(MVector((branch[0] + branch[3]) / 2, (branch[2] + branch[5]) / 2,
+                                 (branch[4] + branch[1]) / 2))
+        vector = MVector(branch[3] - branch[0], branch[5] - branch[2], branch[4] - branch[1])
+        scales.append(MVector(vector.length(), radius, radius))
+        aims.append(MVector(vector.x, vector.y, vector.z))
+    flowerPositions, flowerScales = MArray(), MArray()
+    scale = step * 0.2
+    for flower in flowers:
+        flowerPositions.append(MVector(flower[0], flower[2], flower[1]))
+        flowerScales.append(MVector(scale, scale, scale))
+    return (positions, scales, aims), (flowerPositions, flowerScales)
+
+def expand(grammar, iterations, seed):
+    string = grammar.axiom
+    for level in range(iterations):
+        string = grammar.rewrite(string, level, seed)
+    return string
+
+# runs the expanded string through the engine the node would use, into rows
+# in Maya's coordinates (or the L-system's, for the loop conversion)
+def turtle(grammar, expanded, angle, step, seed, swapYZ=True):
+    engine = LSystemPy if grammar.extended else LSystem
+    lsystem = engine.LSystem()
+    lsystem.setDefaultAngle(angle)
+    lsystem.setDefaultStep(step)
+    if (grammar.extended):
+        lsystem.setSeed(seed)
+    if (hasattr(engine, 'FloatBuffer')):
+        branches, flowers = engine.FloatBuffer(6, swapYZ=swapYZ), engine.FloatBuffer(3, swapYZ=swapYZ)
+    else:
+        branches, flowers = engine.VectorPyBranch(), engine.VectorPyBranch()
+    LSystemPy.loadProgramText(lsystem, expanded)
+    lsystem.processPy(0, branches, flowers)
+    return branches, flowers
+
+# best time and traced peak of a function over a number of repeats
+def measure(function, repeat):
+    best = None
+    for i in range(repeat):
+        profile = LSystemProfile.Profile()
+        with profile.stage(u'timed'):
+            value = function()
+        best = profile.stages[0][1] if best is None else min(best, profile.stages[0][1])
+    traced = LSystemProfile.Profile(traceMemory=True)
+    with traced.stage(u'traced'):
+        function()
+    return value, best, traced.stages[0][2]
+
+# the peak is None where tracemalloc is not available
+def stageResult(seconds, peak, count, segments):
+    return {u'seconds': seconds, u'perSecond': count / max(seconds, 1e-12),
+            u'peakBytes': peak, u'bytesPerSegment': None if peak is None else peak / max(segments, 1)}
+
+# benchmarks one grammar at one iteration count
+def runCase(grammar, angle, step, iterations, seed, repeat, loop):
+    expanded, expandTime, expandPeak = measure(lambda: expand(grammar, iterations, seed), repeat)
+    (branches, flowers), turtleTime, turtlePeak = measure(
+        lambda: turtle(grammar, expanded, angle, step, seed), repeat)
+    branchArray, flowerArray = LSystemArrays.mayaArrays(branches, flowers)
+    segments = len(branchArray)
+    outputs, convertTime, convertPeak = measure(lambda: convert(branchArray, flowerArray, step), repeat)
+
+    stages = {u'expand': stageResult(expandTime, expandPeak, len(expanded), segments),
+              u'turtle': stageResult(turtleTime, turtlePeak, segments, segments),
+              u'convert': stageResult(convertTime, convertPeak, segments, segments)}
+    if (loop):
+        rows = turtle(grammar, expanded, angle, step, seed, swapYZ=False)
+        outputs, loopTime, loopPeak = measure(lambda: convertLoop(rows[0], rows[1], step), repeat)
+        stages[u'loop'] = stageResult(loopTime, loopPeak, segments, segments)
+    return {u'iterations': iterations, u'symbols': len(expanded), u'segments': segments,
+            u'flowers': len(flowerArray), u'stages': stages}
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmark the L-system stages of LSystemInstanceNode without Maya.')
+    parser.add_argument('-o', '--output', default='lsystem-benchmark.json', help='JSON file for the results')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage, the best one is kept')
+    parser.add_argument('--limit', type=int, default=2000000,
+                        help='skip cases predicted to expand to more symbols (0: no limit)')
+    parser.add_argument('--grammar', action='append', help='only run these corpus entries')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the stochastic grammars')
+    parser.add_argument('--loop', action='store_true', help='also time the conversion without numpy')
+    options = parser.parse_args(arguments)
+
+    LSystemArrays.OpenMaya = OpenMayaStandIn
+    repeat = max(options.repeat, 1)
+    step = 1.0
+    results = []
+    for name, text, angle, iterationCounts in CORPUS:
+        if (options.grammar and name not in options.grammar):
+            continue
+        grammar, parseTime, parsePeak = measure(lambda: LSystemGrammar.parseGrammar(text), repeat)
+        cases = []
+        levels = LSystemAnalysis.predictCounts(grammar, max(iterationCounts))
+        for iterations in iterationCounts:
+            if (options.limit > 0 and levels[iterations].symbols > options.limit):
+                continue
+            case = runCase(grammar, angle, step, iterations, options.seed, repeat, options.loop)
+            cases.append(case)
+            sys.stdout.write('%-10s %2d  %10d symbols %9d segments  ' % (name, iterations, case[u'symbols'],
+                                                                        case[u'segments']))
+            sys.stdout.write('  '.join('%s %.3g/s %s B/seg' % (stage, values[u'perSecond'],
+                                                              u'-' if values[u'bytesPerSegment'] is None else
+                                                              u'%.0f' % values[u'bytesPerSegment'])
+                                       for stage, values in sorted(case[u'stages'].items())))
+            sys.stdout.write('\n')
+        results.append({u'grammar': name, u'angle': angle, u'extended': grammar.extended,
+                        u'parse': stageResult(parseTime, parsePeak, len(text), 1), u'cases': cases})
+
+    report = {u'time': time.time(), u'python': platform.python_version(), u'numpy': np.__version__,
+              u'platform': platform.platform(), u'engine': LSystem.__name__, u'repeat': repeat,
+              u'results': results}
+    with io.open(options.output, 'w', encoding='utf-8') as outputFile:
+        outputFile.write(u'%s\n' % json.dumps(report, indent=1, sort_keys=True))
+    sys.stdout.write('results written to %s\n' % options.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+# LSystemCache.py
+#   Caches used by the LSystemInstanceNode so that repeated evaluations with
+#   the same parameters do not re-run the L-system.
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import LSystemGrammar
+
+# Identifies the current version of a grammar file. Editing the file changes
+# its modification time and/or size, which changes the key.
+def fileKey(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return (path, None, None)
+    return (path, stat.st_mtime, stat.st_size)
+
+# Parsed grammars keyed on file path, checked against the file's modification
+# time and size so that evaluations do not read or parse the file unless it
+# changed. invalidate() drops entries whose change the file system cannot show
+# (e.g. coarse mtimes on network drives). A file that cannot be loaded is
+# cached as an empty grammar. The cache is shared by all nodes, so it is
+# guarded by a lock.
+class GrammarCache(object):
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        key = fileKey(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if (entry is not None and entry[0] == key):
+                return entry[1]
+            if (key[1] is None):
+                # missing file: nothing to draw
+                grammar = LSystemGrammar.Grammar(u'', {})
+            else:
+                try:
+                    grammar = LSystemGrammar.loadGrammar(path)
+                except (IOError, OSError, UnicodeDecodeError, LSystemGrammar.GrammarError) as error:
+                    # kept until the file changes, so the error is reported once
+                    sys.stderr.write("cannot load the grammar %s: %s\n" % (path, error))
+                    grammar = LSystemGrammar.Grammar(u'', {})
+            self.entries[path] = (key, grammar)
+            return grammar
+
+    def invalidate(self, path=None):
+        with self.lock:
+            if (path is None):
+                self.entries.clear()
+            else:
+                self.entries.pop(path, None)
+
+# Least recently used cache of finished evaluations, keyed on the parameter set
+# that produced them. Hits and misses are counted so the cache can be checked
+# from the node's cacheHits / cacheMisses attributes.
+class ResultCache(object):
+    def __init__(self, size=8):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if (key not in self.entries):
+            self.misses += 1
+            return None
+        value = self.entries.pop(key)
+        self.entries[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        while (len(self.entries) > self.size):
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+# Expanded strings for every iteration level computed so far, so that moving
+# the iterations attribute from n to n+1 costs one rewrite pass and moving it
+# back down costs nothing. Levels are evicted least recently used first once
+# the stored strings exceed the memory budget (in bytes). The lock only covers
+# the bookkeeping, so a long rewrite does not block other lookups.
+class IterationCache(object):
+    def __init__(self, budget=256 * 1024 * 1024):
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.used = 0
+        self.lock = threading.Lock()
+
+    # returns the grammar expanded to the given level, or None if it would not
+    # fit in the budget. The seed only matters to stochastic grammars.
+    def expand(self, grammar, iterations, seed=0):
+        key = (grammar.key, seed) if grammar.stochastic else grammar.key
+        with self.lock:
+            level = iterations
+            while (level > 0 and (key, level) not in self.entries):
+                level -= 1
+            string = grammar.axiom if level == 0 else self.touch((key, level))
+
+        while (level < iterations):
+            charSize = (sys.getsizeof(string) - sys.getsizeof(string[:0])) // max(len(string), 1)
+            if (grammar.rewrittenLength(string) * max(charSize, 1) > self.budget):
+                return None
+            string = grammar.rewrite(string, level, seed)
+            level += 1
+            with self.lock:
+                self.put((key, level), string)
+        return string
+
+    def touch(self, key):
+        string = self.entries.pop(key)
+        self.entries[key] = string
+        return string
+
+    def put(self, key, string):
+        if (key in self.entries):
+            self.used -= sys.getsizeof(self.entries.pop(key))
+        self.entries[key] = string
+        self.used += sys.getsizeof(string)
+        while (self.used > self.budget and len(self.entries) > 1):
+            self.used -= sys.getsizeof(self.entries.popitem(last=False)[1])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.used = 0
@@ -0,0 +1,412 @@
+# LSystemGrammar.py
+#   Reads L-system grammar files. The first line that is not a production is
+#   the axiom, and every line of the form "X->successor" is a production for
+#   the symbol X. Whitespace is ignored and "#" starts a comment.
+#
+#   Productions can also be stochastic and parametric:
+#       X->(0.3)F[+X]       Weighted alternative: a symbol with several
+#       X->(0.7)F[-X]       productions picks one, in proportion to the weights.
+#   Without weights, a later production of a symbol replaces an earlier one
+#   (with the same parameter count and no condition), as it always has.
+#       A(l,w):l>1->F(l)[+A(l*0.7,w)]
+#                           Parametric production with an optional condition.
+#   Arguments and conditions are Python expressions over the parameters and
+#   the functions of the math module, with "^" for powers and "&&", "||" and
+#   "!" for and, or and not. They are checked to only hold numbers, names,
+#   arithmetic, comparisons and calls of those functions, and compiled into
+#   functions when the grammar is loaded. Expanded parametric strings hold the
+#   values of the arguments, e.g. "F(1.5)[+A(1.05,2.0)]". A grammar that
+#   cannot be compiled, or whose expressions fail while rewriting (e.g. a
+#   division by zero), raises GrammarError.
+#
+#   Stochastic choices only depend on the seed, the iteration and the index of
+#   the rewritten symbol among the symbols with productions at that iteration,
+#   so expanding level by level and depth first pick the same alternatives.
+
+from __future__ import division
+
+import ast
+import io
+import math
+import numbers
+import re
+import sys
+
+# the argument lists of an expanded string
+ARGUMENTS = re.compile(u'\\(([^()]*)\\)')
+# characters of the argument values that rewriting writes (repr of floats).
+# Symbols with productions that are none of these, nor in the arguments of
+# the axiom, can be found in an expanded string without splitting it into modules.
+VALUE_CHARACTERS = frozenset(u'0123456789.,+-einfa')
+
+# names available to arguments and conditions
+NAMESPACE = dict((name, getattr(math, name)) for name in
+                 ('sqrt', 'sin', 'cos', 'tan', 'asin', 'acos', 'atan', 'atan2', 'exp', 'log', 'floor', 'ceil',
+                  'radians', 'degrees', 'pi', 'e'))
+NAMESPACE.update({'abs': abs, 'min': min, 'max': max, 'float': float, '__builtins__': {}})
+
+# the syntax allowed in arguments and conditions
+EXPRESSION_NODES = frozenset(['Expression', 'Num', 'Constant', 'NameConstant', 'Name', 'Load', 'BinOp', 'UnaryOp',
+                              'BoolOp', 'Compare', 'IfExp', 'Call', 'Add', 'Sub', 'Mult', 'Div', 'FloorDiv', 'Mod',
+                              'Pow', 'UAdd', 'USub', 'Not', 'And', 'Or', 'Eq', 'NotEq', 'Lt', 'LtE', 'Gt', 'GtE'])
+
+# errors that arguments and conditions can raise when they are evaluated
+EXPRESSION_ERRORS = (ArithmeticError, ValueError, TypeError)
+
+# a grammar that cannot be compiled or rewritten
+class GrammarError(ValueError):
+    pass
+
+MASK = (1 << 64) - 1
+
+# uniform number in [0, 1) for one stochastic choice (splitmix64 of the inputs)
+def unitHash(seed, level, index):
+    z = (seed * 0x9E3779B97F4A7C15 + level * 0xBF58476D1CE4E5B9 + index * 0x94D049BB133111EB + 1) & MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK
+    z ^= z >> 31
+    return (z >> 11) / float(1 << 53)
+
+# splits "a,b(c,d)" at the commas outside parentheses
+def splitArguments(text):
+    parts = []
+    depth = 0
+    start = 0
+    for i, character in enumerate(text):
+        if (character == u'('):
+            depth += 1
+        elif (character == u')'):
+            depth -= 1
+        elif (character == u',' and depth == 0):
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+# the symbols of a successor, each with the expressions of its arguments (or None)
+def parseSuccessor(text):
+    modules = []
+    i = 0
+    while (i < len(text)):
+        symbol = text[i]
+        i += 1
+        arguments = None
+        if (i < len(text) and text[i] == u'('):
+            depth = 0
+            for end in range(i, len(text)):
+                depth += {u'(': 1, u')': -1}.get(text[end], 0)
+                if (depth == 0):
+                    break
+            arguments = splitArguments(text[i + 1:end])
+            i = end + 1
+        modules.append((symbol, arguments))
+    return modules
+
+# the symbols of a successor or expanded string, without their arguments
+def moduleSymbols(text):
+    return u''.join(symbol for symbol, arguments in parseSuccessor(text))
+
+# the argument values of a module of an expanded string
+def parseValues(text):
+    if (not text):
+        return ()
+    return tuple(map(float, text.split(u',')))
+
+# yields the (symbol, argument text or None) modules of an expanded string.
+# Splitting at the argument lists leaves runs of symbols without arguments,
+# where only the last one owns the following list.
+def splitModules(string):
+    parts = ARGUMENTS.split(string)
+    for i in range(0, len(parts) - 1, 2):
+        text = parts[i]
+        for symbol in text[:-1]:
+            yield (symbol, None)
+        yield (text[-1:], parts[i + 1])
+    for symbol in parts[-1]:
+        yield (symbol, None)
+
+# yields the (symbol, argument values) modules of an expanded string, as
+# splitModules does. The same argument texts come back often, so their
+# values are parsed once.
+def parseModules(string):
+    empty = ()
+    parsed = {}
+    parts = ARGUMENTS.split(string)
+    for i in range(0, len(parts) - 1, 2):
+        text = parts[i]
+        for symbol in text[:-1]:
+            yield (symbol, empty)
+        values = parsed.get(parts[i + 1])
+        if (values is None):
+            if (len(parsed) >= 65536):
+                parsed.clear()
+            values = parsed[parts[i + 1]] = parseValues(parts[i + 1])
+        yield (text[-1:], values)
+    for symbol in parts[-1]:
+        yield (symbol, empty)
+
+# turns the expression syntax of grammar files into Python
+def pythonExpression(text):
+    text = text.replace(u'^', u'**').replace(u'&&', u' and ').replace(u'||', u' or ')
+    return re.sub(u'!(?!=)', u' not ', text)
+
+# an argument or condition in Python, after checking that it only uses the
+# allowed syntax, the parameters and the names of NAMESPACE
+def checkedExpression(text, parameters):
+    expression = pythonExpression(text).strip()
+    if (not expression):
+        return expression
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError as error:
+        raise GrammarError(u'invalid expression "%s": %s' % (text, error.msg))
+    for node in ast.walk(tree):
+        kind = type(node).__name__
+        if (kind not in EXPRESSION_NODES):
+            raise GrammarError(u'%s is not allowed in "%s"' % (kind, text))
+        if (kind == 'Name' and node.id not in parameters and (node.id.startswith('_') or node.id not in NAMESPACE)):
+            raise GrammarError(u'unknown name "%s" in "%s"' % (node.id, text))
+        if (kind == 'Call' and (not isinstance(node.func, ast.Name) or node.keywords or
+                                getattr(node, 'starargs', None) or getattr(node, 'kwargs', None))):
+            raise GrammarError(u'only plain calls of functions are allowed in "%s"' % text)
+        if (kind in ('Num', 'Constant') and not isinstance(getattr(node, 'n', getattr(node, 'value', None)),
+                                                          numbers.Real)):
+            raise GrammarError(u'only numbers are allowed in "%s"' % text)
+    return expression
+
+def compileFunction(parameters, body):
+    source = u'lambda %s: %s' % (u','.join(parameters), body)
+    try:
+        code = compile(source, '<grammar>', 'eval', division.compiler_flag, True)
+    except SyntaxError as error:
+        raise GrammarError(u'invalid production parameters (%s): %s' % (u','.join(parameters), error.msg))
+    return eval(code, dict(NAMESPACE))
+
+# One production of an extended grammar. parameters is None for a production
+# without a parameter list, which applies to its symbol whatever its arguments.
+class Production(object):
+    def __init__(self, symbol, parameters, condition, weight, successor):
+        self.symbol = symbol
+        self.parameters = parameters
+        self.condition = condition
+        self.weight = weight
+        self.successor = successor
+        self.source = (symbol, parameters and tuple(parameters), condition, weight, successor)
+
+        names = parameters or []
+        modules = parseSuccessor(successor)
+        self.symbols = u''.join(symbol for symbol, arguments in modules)
+        self.parametric = any(arguments is not None for symbol, arguments in modules)
+
+        # the condition, the successor as a string and the successor as
+        # (symbol, arguments) modules, compiled into functions of the parameters
+        self.test = None if not condition else compileFunction(names, u'(%s)' % checkedExpression(condition, names))
+        format = u''.join(symbol.replace(u'%', u'%%') + (u'' if arguments is None else
+                          u'(' + u','.join([u'%r'] * len(arguments)) + u')') for symbol, arguments in modules)
+        values = [u'float(%s)' % checkedExpression(argument, names) for symbol, arguments in modules
+                  for argument in (arguments or [])]
+        self.expand = compileFunction(names, u'%r %% (%s,)' % (format, u','.join(values)) if values else
+                                      u'%r' % format)
+        self.modules = compileFunction(names, u'(%s,)' % u','.join(
+            u'(%r, (%s))' % (symbol, u''.join(u'float(%s),' % checkedExpression(argument, names)
+                                                for argument in (arguments or [])))
+            for symbol, arguments in modules) if modules else u'()')
+
+    # true if the production applies to a module with these arguments
+    def matches(self, values):
+        if (self.parameters is None):
+            return True
+        if (len(values) != len(self.parameters)):
+            return False
+        return self.test is None or self.test(*values)
+
+    def arguments(self, values):
+        return () if self.parameters is None else values
+
+# A parsed grammar. Deterministic grammars only have rules (symbol ->
+# successor); stochastic and parametric ones have their productions in
+# productions (symbol -> list of Production) instead.
+class Grammar(object):
+    def __init__(self, axiom, rules, text=u'', productions=None):
+        self.text = text
+        self.axiom = axiom
+        self.rules = rules
+        self.productions = productions or {}
+        self.key = (axiom, tuple(sorted(rules.items())),
+                    tuple(sorted((symbol, tuple(production.source for production in alternatives))
+                                 for symbol, alternatives in self.productions.items())))
+        self.table = dict((ord(symbol), successor) for symbol, successor in rules.items())
+
+        self.parametric = u'(' in axiom or any(production.parametric or production.parameters is not None
+                                               for alternatives in self.productions.values()
+                                               for production in alternatives)
+        self.stochastic = any(len(alternatives) > 1 for alternatives in self.productions.values())
+        self.extended = bool(self.productions) or self.parametric
+        # the symbols with productions, or nothing, with their arguments if any
+        symbols = u''.join(re.escape(symbol) for symbol in self.productions)
+        self.pattern = re.compile(u'[%s]' % symbols if symbols else u'(?!)')
+        self.modulePattern = re.compile(u'([%s])(?:\\(([^()]*)\\))?' % symbols if symbols else u'(?!)')
+        # the symbols with productions can be found in parametric strings directly
+        axiomValues = u''.join(ARGUMENTS.findall(axiom))
+        self.separable = not any(symbol in VALUE_CHARACTERS or symbol in axiomValues for symbol in self.productions)
+
+    # the axiom as modules: characters, or (symbol, arguments) for parametric grammars
+    def axiomModules(self):
+        if (not self.parametric):
+            return self.axiom
+        return list(parseModules(self.axiom))
+
+    # the production that rewrites a symbol with the given arguments, or None
+    # if none applies. index counts the symbols with productions rewritten so
+    # far at this level.
+    def choose(self, alternatives, values, seed, level, index):
+        if (len(alternatives) == 1):
+            production = alternatives[0]
+            return production if production.matches(values) else None
+        candidates = [production for production in alternatives if production.matches(values)]
+        if (len(candidates) < 2):
+            return candidates[0] if candidates else None
+        target = unitHash(seed, level, index) * sum(production.weight for production in candidates)
+        for production in candidates:
+            target -= production.weight
+            if (target < 0.0):
+                return production
+        return candidates[-1]
+
+    # applies every production to the string once. level is the iteration the
+    # string was produced by and seed picks the stochastic alternatives.
+    def rewrite(self, string, level=0, seed=0):
+        try:
+            return self.rewriteString(string, level, seed)
+        except EXPRESSION_ERRORS as error:
+            raise GrammarError(u'cannot rewrite iteration %d: %s' % (level + 1, error))
+
+    def rewriteString(self, string, level, seed):
+        if (not self.extended):
+            return string.translate(self.table)
+        productions = self.productions
+
+        if (not self.parametric):
+            # only the symbols with productions are visited
+            counter = [0]
+            def replace(match):
+                symbol = match.group()
+                production = self.choose(productions[symbol], (), seed, level, counter[0])
+                counter[0] += 1
+                return symbol if production is None else production.symbols
+            return self.pattern.sub(replace, string)
+
+        if (self.separable):
+            # the same for parametric strings, with the arguments of the visited
+            # symbols. A symbol with one production always rewrites the same
+            # module the same way, and modules are often repeated.
+            counter = [0]
+            rewritten = {}
+            def replaceModule(match):
+                module = match.group()
+                successor = rewritten.get(module)
+                if (successor is None):
+                    symbol, text = match.groups()
+                    values = () if text is None else parseValues(text)
+                    alternatives = productions[symbol]
+                    production = self.choose(alternatives, values, seed, level, counter[0])
+                    successor = module if production is None else production.expand(*production.arguments(values))
+                    if (len(alternatives) == 1 and len(rewritten) < 65536):
+                        rewritten[module] = successor
+                counter[0] += 1
+                return successor
+            return self.modulePattern.sub(replaceModule, string)
+
+        parts = []
+        index = 0
+        for symbol, text in splitModules(string):
+            alternatives = productions.get(symbol)
+            if (alternatives is not None):
+                values = () if text is None else parseValues(text)
+                production = self.choose(alternatives, values, seed, level, index)
+                index += 1
+                if (production is not None):
+                    parts.append(production.expand(*production.arguments(values)))
+                    continue
+            parts.append(symbol if text is None else u'%s(%s)' % (symbol, text))
+        return u''.join(parts)
+
+    # length of the string after one more rewrite, without building it. For
+    # extended grammars this is an estimate from the longest alternative.
+    def rewrittenLength(self, string):
+        length = len(string)
+        for symbol, successor in self.rules.items():
+            length += string.count(symbol) * (len(successor) - 1)
+        for symbol, alternatives in self.productions.items():
+            longest = max(len(production.successor) for production in alternatives)
+            length += string.count(symbol) * (2 * longest - 1)
+        return length
+
+# parses the text of a grammar file
+def parseGrammar(text):
+    axiom = u''
+    rules = {}
+    productions = {}
+    weighted = set()
+    for line in text.splitlines():
+        line = u''.join(line.split(u'#', 1)[0].split())
+        if (not line):
+            continue
+        if (u'->' in line):
+            predecessor, successor = line.split(u'->', 1)
+            production = parseProduction(predecessor, successor)
+            if (production is not None):
+                productions.setdefault(production.symbol, []).append(production)
+                if (WEIGHT.match(successor)):
+                    weighted.add(production.symbol)
+        elif (not axiom):
+            axiom = line
+
+    # only weighted alternatives are stochastic: of the unweighted, unconditional
+    # productions of a symbol with the same parameter count, the last one wins
+    for symbol, alternatives in productions.items():
+        if (symbol in weighted):
+            continue
+        last = {}
+        for production in alternatives:
+            if (production.condition is None):
+                last[None if production.parameters is None else len(production.parameters)] = production
+        kept = [production for production in alternatives
+                if production.condition is not None or production in last.values()]
+        if (len(kept) < len(alternatives)):
+            sys.stderr.write("the grammar has several unweighted productions for %s, using the last one\n" %
+                             symbol)
+            productions[symbol] = kept
+
+    # grammars with one plain production per symbol keep the fast string rewriting
+    plain = all(len(alternatives) == 1 and alternatives[0].parameters is None and
+                alternatives[0].condition is None and not alternatives[0].parametric
+                for alternatives in productions.values())
+    if (plain and u'(' not in axiom):
+        for symbol, alternatives in productions.items():
+            rules[symbol] = alternatives[0].successor
+        productions = {}
+    return Grammar(axiom, rules, text, productions)
+
+PREDECESSOR = re.compile(u'^(.)(?:\\(([^()]*)\\))?(?::(.+))?$', re.DOTALL)
+WEIGHT = re.compile(u'^\\(([0-9.eE+-]+)\\)')
+
+# parses one production, or returns None if it cannot be used
+def parseProduction(predecessor, successor):
+    # the turtle rewrites one symbol at a time, so longer predecessors never match
+    match = PREDECESSOR.match(predecessor)
+    if (match is None):
+        return None
+    symbol, parameters, condition = match.groups()
+    weight = 1.0
+    weightMatch = WEIGHT.match(successor)
+    if (weightMatch is not None):
+        weight = float(weightMatch.group(1))
+        successor = successor[weightMatch.end():]
+    return Production(symbol, None if parameters is None else [name for name in parameters.split(u',') if name],
+                      condition, weight, successor)
+
+# reads and parses a grammar file
+def loadGrammar(path):
+    with io.open(path, encoding='utf-8') as grammarFile:
+        return parseGrammar(grammarFile.read())
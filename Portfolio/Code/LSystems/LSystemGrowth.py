@@ -0,0 +1,78 @@
+# LSystemGrowth.py
+#   Animated growth for LSystemInstanceNode. Every segment gets a birth time
+#   once, when the tree is evaluated: the number of segments on the path from
+#   the root to its start, so the trunk grows first and every branch grows out
+#   of its parent at the same speed. A flower's birth time is the length of
+#   the path to it, so it opens when the segment below it is fully grown.
+#   Every frame then only filters and scales the cached segments for the
+#   current growth value, without running the L-system again.
+
+import numpy as np
+
+# number of segments ("F") on the path from the root to every position of an
+# expanded program: the segments before it, minus those inside brackets that
+# closed before it
+def pathCounts(program):
+    codes = np.frombuffer(program.encode('utf-8'), dtype=np.uint8)
+    isSegment = codes == ord('F')
+    before = np.cumsum(isSegment) - isSegment
+
+    # match brackets: at every nesting level, opens and closes alternate. As
+    # in the turtle, a "]" with nothing to pop is ignored: those are the ones
+    # that take the raw nesting to a new low below 0.
+    isOpen = codes == ord('[')
+    isClose = codes == ord(']')
+    raw = np.cumsum(isOpen.astype(np.int64) - isClose)
+    lowest = np.minimum.accumulate(np.minimum(raw, 0))
+    isClose &= lowest == np.concatenate(([0], lowest[:-1]))
+    nesting = np.cumsum(isOpen.astype(np.int64) - isClose)
+    opens = np.flatnonzero(isOpen)
+    closes = np.flatnonzero(isClose)
+    openKeys = levelRankKeys(nesting[opens], len(codes))
+    closeKeys = levelRankKeys(nesting[closes] + 1, len(codes))
+    order = np.argsort(openKeys)
+    found = np.minimum(np.searchsorted(openKeys, closeKeys, sorter=order), max(len(opens) - 1, 0))
+    matched = openKeys[order[found]] == closeKeys if len(opens) else np.zeros(len(closes), dtype=bool)
+
+    # from its closing "]" on, a bracket skips the segments directly inside
+    # it, the ones nested deeper being skipped by the inner brackets
+    pairOpens, pairCloses = opens[order[found[matched]]], closes[matched]
+    segments = np.flatnonzero(isSegment)
+    segmentKeys = np.sort(nesting[segments] * (len(codes) + 1) + segments)
+    pairLevels = nesting[pairOpens] * (len(codes) + 1)
+    skipped = np.zeros(len(codes), dtype=np.int64)
+    skipped[pairCloses] = (np.searchsorted(segmentKeys, pairLevels + pairCloses) -
+                           np.searchsorted(segmentKeys, pairLevels + pairOpens))
+    return before - np.cumsum(skipped)
+
+# keys (level, rank of the bracket among the brackets of its level), unique
+# among the opening (or the closing) brackets
+def levelRankKeys(levels, length):
+    levels = levels.astype(np.int64)
+    order = np.argsort(levels, kind='mergesort')
+    sortedLevels = levels[order]
+    ranks = np.empty(len(levels), dtype=np.int64)
+    ranks[order] = np.arange(len(levels)) - np.searchsorted(sortedLevels, sortedLevels, side='left')
+    return levels * (length + 1) + ranks
+
+# birth times of the segments (N x 2: start and end) and of the flowers of an
+# expanded program, in the order the turtle draws them
+def birthTimes(program):
+    counts = pathCounts(program)
+    codes = np.frombuffer(program.encode('utf-8'), dtype=np.uint8)
+    starts = counts[codes == ord('F')].astype(np.float64)
+    return np.column_stack((starts, starts + 1.0)), counts[codes == ord('*')].astype(np.float64)
+
+# the branches (N x 6) and flowers (N x 3) grown to growth, from 0 (nothing)
+# to 1 (the whole tree). Growing segments are shortened from their start.
+def grow(branches, flowers, branchBirths, flowerBirths, growth):
+    branches = np.asarray(branches, dtype=np.float64).reshape(-1, 6)
+    flowers = np.asarray(flowers, dtype=np.float64).reshape(-1, 3)
+    total = max([0.0] + [births.max() for births in (branchBirths[:, 1], flowerBirths) if len(births)])
+    time = min(max(growth, 0.0), 1.0) * total
+
+    fractions = np.clip((time - branchBirths[:, 0]) / (branchBirths[:, 1] - branchBirths[:, 0]), 0.0, 1.0)
+    keep = fractions > 0.0
+    grown = branches[keep]
+    grown[:, 3:] = grown[:, :3] + (grown[:, 3:] - grown[:, :3]) * fractions[keep, np.newaxis]
+    return grown, flowers[flowerBirths <= time] if growth > 0.0 else flowers[:0]
@@ -1,13 +1,43 @@
 # LSystemInstanceNode.py
 #   Produces random locations to be used with the Maya instancer node.
 
+import math
 import sys
-import LSystem
+import threading
+try:
+    import LSystem
+except ImportError:
+    # the compiled engine is not built, use the pure-Python one
+    import LSystemPy as LSystem
+import LSystemAnalysis
+import LSystemBackground
+import LSystemCache
+import LSystemGrammar
+import LSystemInstancing
+import LSystemParallel
+import LSystemProfile
+import LSystemPy
+
+try:
+    import numpy as np
+    import LSystemArrays
+    import LSystemBaked
+    import LSystemGrowth
+    import LSystemMesh
+    import LSystemOptimize
+except ImportError:
+    # numpy is not available, convert one branch at a time and skip the optimizations
+    LSystemArrays = None
+    LSystemBaked = None
+    LSystemGrowth = None
+    LSystemMesh = None
+    LSystemOptimize = None
 
 import maya.OpenMaya as OpenMaya
 import maya.OpenMayaAnim as OpenMayaAnim
 import maya.OpenMayaMPx as OpenMayaMPx
 import maya.cmds as cmds
+import maya.utils
 
 # Useful functions for declaring attributes as inputs or outputs.
 def MAKE_INPUT(attr):
@@ -24,6 +54,20 @@ def MAKE_OUTPUT(attr):
 # Define the name of the node
 kPluginNodeTypeName = "LSystemInstanceNode"
 
+# Output modes: one instance per segment, prototype subtrees and their placements,
+# or one tube mesh for all the branches
+kFlat = 0
+kSubtrees = 1
+kMesh = 2
+
+# Profiling: off, time per stage, or time and traced peak allocation per stage
+kProfileOff = 0
+kProfileTime = 1
+kProfileMemory = 2
+
+# blocks of a disk cache file, in the order of LSystemArrays.instancerArrays
+kInstancerBlocks = (u'branchPositions', u'branchScales', u'branchAims', u'flowerPositions', u'flowerScales')
+
 # Give the node a unique ID. Make sure this ID is different from all of your
 # other nodes!
 LSystemInstanceNodeId = OpenMaya.MTypeId(0x8718)
@@ -37,88 +81,622 @@ class LSystemInstanceNode(OpenMayaMPx.MPxNode):
     iterations = OpenMaya.MObject()
     branches = OpenMaya.MObject()
     flowers = OpenMaya.MObject()
-    lsystem = LSystem.LSystem()
+    cacheHits = OpenMaya.MObject()
+    cacheMisses = OpenMaya.MObject()
+    maxInstances = OpenMaya.MObject()
+    maxSymbols = OpenMaya.MObject()
+    clampIterations = OpenMaya.MObject()
+    predictedSymbols = OpenMaya.MObject()
+    predictedBranches = OpenMaya.MObject()
+    predictedFlowers = OpenMaya.MObject()
+    predictionEstimated = OpenMaya.MObject()
+    evaluatedIterations = OpenMaya.MObject()
+    clampedIterations = OpenMaya.MObject()
+    outputMode = OpenMaya.MObject()
+    placements = OpenMaya.MObject()
+    mesh = OpenMaya.MObject()
+    taper = OpenMaya.MObject()
+    sides = OpenMaya.MObject()
+    mergeCollinear = OpenMaya.MObject()
+    minLength = OpenMaya.MObject()
+    maxDepth = OpenMaya.MObject()
+    background = OpenMaya.MObject()
+    previewIterations = OpenMaya.MObject()
+    processes = OpenMaya.MObject()
+    bakedFile = OpenMaya.MObject()
+    cacheDirectory = OpenMaya.MObject()
+    cacheSize = OpenMaya.MObject()
+    seed = OpenMaya.MObject()
+    profile = OpenMaya.MObject()
+    profileLog = OpenMaya.MObject()
+    profileStages = OpenMaya.MObject()
+    profileTimes = OpenMaya.MObject()
+    profilePeaks = OpenMaya.MObject()
+    profileSymbols = OpenMaya.MObject()
+    profileBranches = OpenMaya.MObject()
+    profileFlowers = OpenMaya.MObject()
+    animateGrowth = OpenMaya.MObject()
+    growth = OpenMaya.MObject()
+    grammars = LSystemCache.GrammarCache()
+    # node removal callbacks of every node, removed when the plug-in is unloaded
+    callbacks = []
 
     # constructor
     def __init__(self):
         OpenMayaMPx.MPxNode.__init__(self)
+        # every node has its own engine and caches, so nodes do not undo each
+        # other's state and can be evaluated at the same time
+        self.lsystem = LSystem.LSystem()
+        self.results = LSystemCache.ResultCache()
+        self.levels = LSystemCache.IterationCache()
+        self.lock = threading.Lock()
+
+        # in growth mode: the evaluated trees with the birth times of their
+        # segments, filtered again for every growth value
+        self.growthSources = LSystemCache.ResultCache(2)
+
+        # background mode runs on a worker thread with its own engine and keeps
+        # showing the last finished result until the new one is ready
+        self.workerLSystem = LSystem.LSystem()
+        self.worker = LSystemBackground.BackgroundEvaluator(self.runOnWorker, self.workerReady)
+        self.lastResult = None
+        self.handle = None
+
+    # stop the worker when the node is removed, so it does not dirty a node that is gone
+    def postConstructor(self):
+        self.handle = OpenMaya.MObjectHandle(self.thisMObject())
+        LSystemInstanceNode.callbacks.append(
+            OpenMaya.MNodeMessage.addNodePreRemovalCallback(self.thisMObject(), self.nodeRemoved))
+
+    def nodeRemoved(self, node, clientData):
+        self.worker.stop()
+
+    # allow the evaluation manager to compute several L-system nodes in parallel
+    def schedulingType(self):
+        return OpenMayaMPx.MPxNode.kParallel
 
     # compute
     def compute(self,plug,data):
-        if (plug == LSystemInstanceNode.branches or plug == LSystemInstanceNode.flowers):
+        if (any(plug == output for output in LSystemInstanceNode.outputs())):
             # get parameters
             iterations = data.inputValue(LSystemInstanceNode.iterations).asInt()
             angle = data.inputValue(LSystemInstanceNode.angle).asFloat()
             step = data.inputValue(LSystemInstanceNode.step).asFloat()
             file = data.inputValue(LSystemInstanceNode.file).asString()
+            maxInstances = data.inputValue(LSystemInstanceNode.maxInstances).asInt()
+            maxSymbols = data.inputValue(LSystemInstanceNode.maxSymbols).asInt()
+            clamp = data.inputValue(LSystemInstanceNode.clampIterations).asBool()
+            mode = data.inputValue(LSystemInstanceNode.outputMode).asShort()
+            merge = data.inputValue(LSystemInstanceNode.mergeCollinear).asBool()
+            minLength = data.inputValue(LSystemInstanceNode.minLength).asFloat()
+            maxDepth = data.inputValue(LSystemInstanceNode.maxDepth).asInt()
+            background = data.inputValue(LSystemInstanceNode.background).asBool()
+            previewIterations = data.inputValue(LSystemInstanceNode.previewIterations).asInt()
+            processes = data.inputValue(LSystemInstanceNode.processes).asInt()
+            bakedFile = data.inputValue(LSystemInstanceNode.bakedFile).asString()
+            cacheDirectory = data.inputValue(LSystemInstanceNode.cacheDirectory).asString()
+            cacheSize = data.inputValue(LSystemInstanceNode.cacheSize).asInt()
+            taper = data.inputValue(LSystemInstanceNode.taper).asFloat()
+            sides = data.inputValue(LSystemInstanceNode.sides).asInt()
+            seed = data.inputValue(LSystemInstanceNode.seed).asInt()
+            profiling = data.inputValue(LSystemInstanceNode.profile).asShort()
+            profileLog = data.inputValue(LSystemInstanceNode.profileLog).asString()
+            animateGrowth = data.inputValue(LSystemInstanceNode.animateGrowth).asBool()
+            growth = data.inputValue(LSystemInstanceNode.growth).asFloat()
+            profile = LSystemProfile.DISABLED
+            if (profiling != kProfileOff):
+                profile = LSystemProfile.Profile(traceMemory=profiling == kProfileMemory)
+
+            # a tree baked by LSystemBatch is loaded instead of evaluating the grammar
+            if (bakedFile and LSystemBaked is not None):
+                with self.lock:
+                    with profile.stage(u'load'):
+                        result, counts, iterations = self.bakedResult(bakedFile)
+                    hits, misses = self.results.hits, self.results.misses
+                profile.setCounts(counts.symbols, counts.branches, counts.flowers)
+                self.setOutputs(data, result, hits, misses, counts, iterations, profile=profile)
+                self.logProfile(profile, profileLog, bakedFile=bakedFile)
+                return
+
+            # predict the size of the tree before expanding anything, and stay within the budgets
+            with profile.stage(u'grammar'):
+                grammar = LSystemInstanceNode.grammars.get(file)
+            iterations = max(iterations, 0)
+            with profile.stage(u'predict'):
+                levels = LSystemAnalysis.predictCounts(grammar, iterations)
+                fitting = LSystemAnalysis.levelWithinBudget(levels, maxInstances, maxSymbols)
+            profile.setCounts(levels[-1].symbols, levels[-1].branches, levels[-1].flowers)
+            # subtrees are never expanded, so only the flat and mesh outputs need the budgets.
+            # An estimated prediction can be far off, so it only warns.
+            clamped = -1
+            if (mode != kSubtrees and fitting != iterations):
+                sys.stderr.write("%s: %d iterations would produce %s%d instances and %d symbols, over budget\n" %
+                                 (kPluginNodeTypeName, iterations, u'about ' if levels[-1].estimate else u'',
+                                  levels[-1].instances(), levels[-1].symbols))
+                if (not levels[-1].estimate):
+                    iterations = fitting if clamp else None
+                    clamped = -1 if iterations is None else iterations
+
+            # reuse the outputs of an earlier evaluation with the same parameters
+            with self.lock:
+                if (iterations is None):
+                    result = self.emptyResult()
+                else:
+                    settings = (grammar, angle, step, iterations, mode, merge, minLength, maxDepth, taper, sides, seed,
+                                processes)
+                    key = (grammar.key,) + LSystemInstanceNode.resultSettings(settings)
+                    disk = self.diskEntry(cacheDirectory, cacheSize, settings)
+                    growing = animateGrowth and mode == kFlat and LSystemGrowth is not None
+                    with profile.stage(u'cache'):
+                        result = None if growing else self.results.get(key)
+                        if (result is None and disk is not None and not growing):
+                            result = self.diskResult(key, disk)
+                    if (growing):
+                        result = self.growthResult(key, settings, growth, profile)
+                    elif (result is None and background):
+                        result = self.backgroundResult(key, settings, previewIterations, disk)
+                    elif (result is None):
+                        result = self.evaluate(*settings, disk=disk, profile=profile)
+                        self.results.put(key, result)
+                        self.lastResult = result
+                    else:
+                        self.lastResult = result
+                    hits, misses = self.results.hits, self.results.misses
+            self.setOutputs(data, result, hits, misses, levels[-1], iterations, clamped, profile)
+            self.logProfile(profile, profileLog, file=file, iterations=iterations)
+
+    # in growth mode: the tree grown to growth (0 to 1). The tree and the birth
+    # times of its segments are only evaluated when the settings change, every
+    # other growth value just filters them.
+    def growthResult(self, key, settings, growth, profile):
+        output = self.growthSources.get(key)
+        if (output is None):
+            output = self.run(self.lsystem, *settings, profile=profile, growing=True)
+            self.growthSources.put(key, output)
+        hierarchy, branches, flowers, tube, births = output
+        with profile.stage(u'growth'):
+            if (births is not None):
+                branches, flowers = LSystemGrowth.grow(branches, flowers, births[0], births[1], growth)
+                profile.setCounts(branches=len(branches), flowers=len(flowers))
+        with profile.stage(u'outputs'):
+            result = self.createResult((hierarchy, branches, flowers, tube, None), settings[2])
+        self.lastResult = result
+        return result
+
+    # appends an enabled profile to the log file, if there is one
+    def logProfile(self, profile, path, **info):
+        if (not profile.enabled or not path):
+            return
+        try:
+            profile.write(path, node=OpenMaya.MFnDependencyNode(self.thisMObject()).name(), **info)
+        except (IOError, OSError) as error:
+            sys.stderr.write("%s: cannot write the profile to %s: %s\n" % (kPluginNodeTypeName, path, error))
+
+    # one evaluation fills every output, so they are all set and cleaned together
+    def setOutputs(self, data, result, hits, misses, counts, iterations, clamped=-1, profile=LSystemProfile.DISABLED):
+        branchesObject, flowersObject, placementsObject, meshObject = result
+        data.outputValue(LSystemInstanceNode.branches).setMObject(branchesObject)
+        data.outputValue(LSystemInstanceNode.flowers).setMObject(flowersObject)
+        data.outputValue(LSystemInstanceNode.placements).setMObject(placementsObject)
+        data.outputValue(LSystemInstanceNode.mesh).setMObject(meshObject)
+        data.outputValue(LSystemInstanceNode.cacheHits).setInt(hits)
+        data.outputValue(LSystemInstanceNode.cacheMisses).setInt(misses)
+        data.outputValue(LSystemInstanceNode.predictedSymbols).setDouble(counts.symbols)
+        data.outputValue(LSystemInstanceNode.predictedBranches).setDouble(counts.branches)
+        data.outputValue(LSystemInstanceNode.predictedFlowers).setDouble(counts.flowers)
+        data.outputValue(LSystemInstanceNode.predictionEstimated).setBool(counts.estimate)
+        data.outputValue(LSystemInstanceNode.evaluatedIterations).setInt(-1 if iterations is None else iterations)
+        data.outputValue(LSystemInstanceNode.clampedIterations).setInt(clamped)
+
+        # the stages of this compute, empty when profiling is off
+        names = OpenMaya.MStringArray()
+        for name in profile.names():
+            names.append(name)
+        seconds = OpenMaya.MDoubleArray()
+        peaks = OpenMaya.MDoubleArray()
+        self.setDoubles(seconds, profile.seconds())
+        self.setDoubles(peaks, [-1 if peak is None else peak for peak in profile.peaks()])
+        data.outputValue(LSystemInstanceNode.profileStages).setMObject(OpenMaya.MFnStringArrayData().create(names))
+        data.outputValue(LSystemInstanceNode.profileTimes).setMObject(OpenMaya.MFnDoubleArrayData().create(seconds))
+        data.outputValue(LSystemInstanceNode.profilePeaks).setMObject(OpenMaya.MFnDoubleArrayData().create(peaks))
+        data.outputValue(LSystemInstanceNode.profileSymbols).setDouble(profile.symbols)
+        data.outputValue(LSystemInstanceNode.profileBranches).setDouble(profile.branches)
+        data.outputValue(LSystemInstanceNode.profileFlowers).setDouble(profile.flowers)
+
+        for output in LSystemInstanceNode.outputs():
+            data.setClean(output)
+
+    # every output attribute, all computed by the same evaluation
+    @staticmethod
+    def outputs():
+        return (LSystemInstanceNode.branches, LSystemInstanceNode.flowers,
+                LSystemInstanceNode.cacheHits, LSystemInstanceNode.cacheMisses,
+                LSystemInstanceNode.predictedSymbols, LSystemInstanceNode.predictedBranches,
+                LSystemInstanceNode.predictedFlowers, LSystemInstanceNode.predictionEstimated,
+                LSystemInstanceNode.evaluatedIterations, LSystemInstanceNode.clampedIterations,
+                LSystemInstanceNode.placements, LSystemInstanceNode.mesh,
+                LSystemInstanceNode.profileStages, LSystemInstanceNode.profileTimes,
+                LSystemInstanceNode.profilePeaks, LSystemInstanceNode.profileSymbols,
+                LSystemInstanceNode.profileBranches, LSystemInstanceNode.profileFlowers)
+
+    # returns empty branches, flowers, placements and mesh output objects
+    def emptyResult(self):
+        return (OpenMaya.MFnArrayAttrsData().create(), OpenMaya.MFnArrayAttrsData().create(),
+                OpenMaya.MFnArrayAttrsData().create(), self.createMesh(None))
+
+    # the outputs, counts and iterations of a baked file, cached like evaluations
+    # and keyed on the file's modification time and size
+    def bakedResult(self, path):
+        key = (u'baked',) + LSystemCache.fileKey(path)
+        entry = self.results.get(key)
+        if (entry is None):
+            try:
+                baked = LSystemBaked.read(path)
+            except (IOError, OSError, ValueError) as error:
+                sys.stderr.write("%s: cannot load %s: %s\n" % (kPluginNodeTypeName, path, error))
+                return (self.emptyResult(), LSystemAnalysis.Counts(0, 0, 0), None)
+            branches, flowers = baked.blocks[u'branches'], baked.blocks[u'flowers']
+            result = self.createOutputs(branches, flowers, baked.info[u'step']) + (OpenMaya.MFnArrayAttrsData().create(),
+                                                                                   self.createMesh(None))
+            counts = LSystemAnalysis.Counts(baked.info.get(u'symbols', 0), len(branches), len(flowers))
+            entry = (result, counts, baked.info.get(u'iterations'))
+            self.results.put(key, entry)
+        self.lastResult = entry[0]
+        return entry
+
+    # the settings after the grammar that change the result, for the cache keys:
+    # the process count never does, and the seed only for stochastic grammars
+    @staticmethod
+    def resultSettings(settings):
+        seed = settings[-2] if settings[0].stochastic else 0
+        return settings[1:-2] + (seed,)
+
+    # (cache, name) of the disk cache entry for a parameter set, or None when
+    # the disk cache is off (no directory, or a size of 0 or less). Only the
+    # instancer arrays of the flat output are stored.
+    def diskEntry(self, directory, size, settings):
+        if (not directory or size <= 0 or LSystemBaked is None or settings[4] != kFlat):
+            return None
+        cache = LSystemBaked.BakedCache(directory, size * 1024 * 1024)
+        return (cache, LSystemBaked.cacheName(settings[0].text, LSystemInstanceNode.resultSettings(settings)))
+
+    # the outputs stored in the disk cache for key, read from the memory-mapped
+    # file, or None
+    def diskResult(self, key, disk):
+        cache, name = disk
+        baked = cache.get(name)
+        if (baked is None):
+            return None
+        arrays = tuple(baked.blocks[block] for block in kInstancerBlocks)
+        result = self.createOutputs(None, None, 0.0, arrays=arrays) + (OpenMaya.MFnArrayAttrsData().create(),
+                                                                       self.createMesh(None))
+        self.results.put(key, result)
+        self.lastResult = result
+        return result
+
+    # in background mode: the worker's result for key if it is ready. Otherwise
+    # the worker is started and compute returns a preview with fewer iterations
+    # (previewIterations >= 0) or the last finished result.
+    def backgroundResult(self, key, settings, previewIterations, disk=None):
+        output = self.worker.take(key)
+        if (output is not None):
+            result = self.createResult(output, settings[2], disk)
+            self.results.put(key, result)
+            self.lastResult = result
+            return result
+
+        self.worker.request(key, settings)
+        if (previewIterations >= 0):
+            preview = settings[:3] + (min(settings[3], previewIterations),) + settings[4:]
+            previewKey = (preview[0].key,) + LSystemInstanceNode.resultSettings(preview)
+            result = self.results.get(previewKey)
+            if (result is None):
+                result = self.evaluate(*preview)
+                self.results.put(previewKey, result)
+            return result
+        if (self.lastResult is not None):
+            return self.lastResult
+        return self.emptyResult()
+
+    # runs on the worker thread
+    def runOnWorker(self, *settings):
+        return self.run(self.workerLSystem, *settings)
+
+    # called on the worker thread when a result is ready: dirty the node on the
+    # main thread so that its outputs are pulled again
+    def workerReady(self):
+        maya.utils.executeDeferred(self.dirtyOutputs)
+
+    def dirtyOutputs(self):
+        # the node may have been removed since the result was queued
+        if (self.worker.stopped or self.handle is None or not self.handle.isValid()):
+            return
+        cmds.dgdirty(OpenMaya.MFnDependencyNode(self.thisMObject()).name())
+
+    # forgets the cached grammar for one file (or all files) and re-evaluates every node
+    @staticmethod
+    def invalidateGrammar(path=None):
+        LSystemInstanceNode.grammars.invalidate(path)
+        for node in cmds.ls(type=kPluginNodeTypeName):
+            cmds.dgdirty(node)
+
+    # runs the L-system and returns the branches, flowers, placements and mesh output
+    # objects and, given a disk cache entry, stores the flat result in it
+    def evaluate(self, grammar, angle, step, iterations, mode, merge, minLength, maxDepth, taper, sides, seed,
+                 processes, disk=None, profile=LSystemProfile.DISABLED):
+        output = self.run(self.lsystem, grammar, angle, step, iterations, mode, merge, minLength, maxDepth, taper,
+                          sides, seed, processes, profile)
+        with profile.stage(u'outputs'):
+            return self.createResult(output, step, disk)
+
+    # runs the L-system on an engine and returns (hierarchy, None, None, None, None)
+    # for subtree output, (None, branches, flowers, None, births) for flat output or
+    # (None, branches, flowers, tube, None) for mesh output. births holds the birth
+    # times of the branches and flowers when growing, and is None otherwise (or
+    # when they are unknown). Nothing here touches Maya, so it can run on the
+    # worker thread.
+    def run(self, lsystem, grammar, angle, step, iterations, mode, merge, minLength, maxDepth, taper, sides, seed,
+            processes, profile=LSystemProfile.DISABLED, growing=False):
+        if (mode == kSubtrees):
+            with profile.stage(u'subtrees'):
+                hierarchy = LSystemInstancing.buildHierarchy(grammar, iterations, angle, step)
+            if (hierarchy is not None):
+                return (hierarchy, None, None, None, None)
+            sys.stderr.write("%s: the grammar cannot be split into subtrees, using flat output\n" %
+                             kPluginNodeTypeName)
+
+        # stochastic and parametric grammars are only run by the Python engine
+        engine = LSystem
+        if (grammar.extended and not hasattr(lsystem, 'setSeed')):
+            engine = LSystemPy
+            lsystem = LSystemPy.LSystem()
+        if (grammar.extended):
+            lsystem.setSeed(seed)
 
-            # update lsystem
-            if (angle != LSystemInstanceNode.lsystem.getDefaultAngle()):
-                LSystemInstanceNode.lsystem.setDefaultAngle(angle)
-            if (step != LSystemInstanceNode.lsystem.getDefaultStep()):
-                LSystemInstanceNode.lsystem.setDefaultStep(step)
-
-            LSystemInstanceNode.lsystem.loadProgram(file.encode())
-
-            # instantiate branches output object
-            branches = data.outputValue(LSystemInstanceNode.branches)
-            branchesAAD = OpenMaya.MFnArrayAttrsData()
-            branchesObject = branchesAAD.create()
-            branchesPosArray = branchesAAD.vectorArray("position")
-            branchesIdArray = branchesAAD.doubleArray("id")
-            branchesScaleArray = branchesAAD.vectorArray("scale")
-            branchesOrientArray = branchesAAD.vectorArray("aimDirection")
-
-            # instantiate flowers output object
-            flowers = data.outputValue(LSystemInstanceNode.flowers)
-            flowersAAD = OpenMaya.MFnArrayAttrsData()
-            flowersObject = flowersAAD.create()
-            flowersPosArray = flowersAAD.vectorArray("position")
-            flowersIdArray = flowersAAD.doubleArray("id")
-            flowersScaleArray = flowersAAD.vectorArray("scale")
-
-            # execute LSystem
-            branchesVec = LSystem.VectorPyBranch()
-            flowersVec = LSystem.VectorPyBranch()
-
-            LSystemInstanceNode.lsystem.processPy(iterations, branchesVec, flowersVec)
-
-            # branches output
-            for branch in branchesVec:
-                midX = (branch[0] + branch[3]) / 2
-                midY = (branch[2] + branch[5]) / 2
-                midZ = (branch[4] + branch[1]) / 2
-                branchesPosArray.append(OpenMaya.MVector(midX, midY, midZ))
-                vecX = branch[3] - branch[0]
-                vecZ = branch[4] - branch[1]
-                vecY = branch[5] - branch[2]
-                vecBranch = OpenMaya.MVector(vecX, vecY, vecZ)
-                radius = LSystemInstanceNode.lsystem.getDefaultStep() * 0.1
-                branchesScaleArray.append(OpenMaya.MVector(vecBranch.length(), radius, radius))
-                branchesOrientArray.append(OpenMaya.MVector(vecX, vecY, vecZ))
-
-            # flowers output
-            for flower in flowersVec:
-                flowersPosArray.append(OpenMaya.MVector(flower[0], flower[2], flower[1]))
-                scale = LSystemInstanceNode.lsystem.getDefaultStep() * 0.2
-                flowersScaleArray.append(OpenMaya.MVector(scale, scale, scale))
-
-            branches.setMObject(branchesObject)
-            flowers.setMObject(flowersObject)
-
-            data.setClean(plug)
+        # update lsystem
+        if (angle != lsystem.getDefaultAngle()):
+            lsystem.setDefaultAngle(angle)
+        if (step != lsystem.getDefaultStep()):
+            lsystem.setDefaultStep(step)
+
+        # execute LSystem, into float32 rows already in Maya's coordinates when the engine can
+        if (LSystemArrays is not None and hasattr(engine, 'FloatBuffer')):
+            branchesVec = engine.FloatBuffer(6, swapYZ=True)
+            flowersVec = engine.FloatBuffer(3, swapYZ=True)
+        else:
+            branchesVec = engine.VectorPyBranch()
+            flowersVec = engine.VectorPyBranch()
+
+        # expand the grammar from the closest cached level, then only run the turtle
+        try:
+            with profile.stage(u'expand'):
+                expanded = self.levels.expand(grammar, iterations, seed)
+            with profile.stage(u'turtle'):
+                if (expanded is None):
+                    # too large to keep in memory, let the engine expand it from the axiom
+                    LSystemPy.loadProgramText(lsystem, grammar.text)
+                    lsystem.processPy(iterations, branchesVec, flowersVec)
+                elif (processes > 1 and engine is LSystemPy):
+                    # split the turtle work over a process pool, cutting the program between brackets;
+                    # the chunks run the Python turtle, so only when the serial run would too
+                    LSystemParallel.interpret(expanded, angle, step, processes, branchesVec, flowersVec)
+                else:
+                    LSystemPy.loadProgramText(lsystem, expanded)
+                    lsystem.processPy(0, branchesVec, flowersVec)
+        except LSystemGrammar.GrammarError as error:
+            # the expressions of the grammar failed on these arguments: output nothing
+            sys.stderr.write("%s: %s\n" % (kPluginNodeTypeName, error))
+            branchesVec, flowersVec = engine.VectorPyBranch(), engine.VectorPyBranch()
+            if (LSystemArrays is not None):
+                branchesVec, flowersVec = LSystemArrays.mayaArrays(branchesVec, flowersVec)
+            return (None, branchesVec, flowersVec, None, None)
+        if (expanded is not None):
+            profile.setCounts(symbols=len(expanded))
+
+        # with numpy, flat output is always returned as arrays in Maya's coordinates
+        if (LSystemArrays is not None):
+            with profile.stage(u'arrays'):
+                branchesVec, flowersVec = LSystemArrays.mayaArrays(branchesVec, flowersVec)
+
+        # birth times of the segments and flowers, read from the expanded program
+        births = None
+        if (growing and expanded is not None):
+            with profile.stage(u'births'):
+                births = LSystemGrowth.birthTimes(expanded)
+            if (len(births[0]) != len(branchesVec) or len(births[1]) != len(flowersVec)):
+                births = None
+        if (growing and births is None):
+            sys.stderr.write("%s: cannot find the birth times of the segments, showing the whole tree\n" % kPluginNodeTypeName)
+
+        # merge collinear segments and apply the level of detail
+        depths = None
+        if (LSystemOptimize is not None and (merge or minLength > 0.0 or maxDepth >= 0 or mode == kMesh)):
+            with profile.stage(u'optimize'):
+                branchesVec, flowersVec, depths, births = self.optimize(branchesVec, flowersVec, expanded, merge,
+                                                                        minLength, maxDepth, births)
+        profile.setCounts(branches=len(branchesVec), flowers=len(flowersVec))
+
+        # one tube mesh around all the branches, thinner with every bracket depth
+        tube = None
+        if (mode == kMesh):
+            if (LSystemMesh is not None):
+                with profile.stage(u'mesh'):
+                    tube = LSystemMesh.tubeMesh(branchesVec, depths, step * 0.1, taper, sides)
+            else:
+                sys.stderr.write("%s: mesh output needs numpy, using flat output\n" % kPluginNodeTypeName)
+
+        return (None, branchesVec, flowersVec, tube, births)
+
+    # builds the output objects from the data returned by run
+    def createResult(self, output, step, disk=None):
+        hierarchy, branchesVec, flowersVec, tube, births = output
+        if (hierarchy is not None):
+            return self.createSubtreeOutputs(hierarchy, step)
+        if (tube is not None):
+            # the mesh replaces the branch instances, flowers are still instanced
+            branchesObject, flowersObject = self.createOutputs(branchesVec[:0], flowersVec, step, swapYZ=False)
+            return (branchesObject, flowersObject, OpenMaya.MFnArrayAttrsData().create(), self.createMesh(tube))
+        arrays = None
+        if (disk is not None and LSystemArrays is not None):
+            cache, name = disk
+            arrays = LSystemArrays.instancerArrays(branchesVec, flowersVec, step, swapYZ=False)
+            try:
+                cache.put(name, zip(kInstancerBlocks, arrays), {u'step': step})
+            except (IOError, OSError) as error:
+                sys.stderr.write("%s: cannot write to the disk cache: %s\n" % (kPluginNodeTypeName, error))
+        branchesObject, flowersObject = self.createOutputs(branchesVec, flowersVec, step, arrays=arrays, swapYZ=False)
+        return (branchesObject, flowersObject, OpenMaya.MFnArrayAttrsData().create(), self.createMesh(None))
+
+    # creates a mesh data object from the (vertices, polygon counts, polygon
+    # vertices) of a tube mesh, or an empty one
+    def createMesh(self, tube):
+        meshData = OpenMaya.MFnMeshData()
+        meshObject = meshData.create()
+        points = OpenMaya.MPointArray()
+        counts = OpenMaya.MIntArray()
+        connects = OpenMaya.MIntArray()
+        if (tube is not None):
+            vertices, polygonCounts, polygonConnects = tube
+            LSystemArrays.fillPointArray(points, vertices)
+            LSystemArrays.fillIntArray(counts, polygonCounts)
+            LSystemArrays.fillIntArray(connects, polygonConnects)
+        OpenMaya.MFnMesh().create(points.length(), counts.length(), points, counts, connects, meshObject)
+        return meshObject
+
+    # reduces the number of branches (and flowers, for the depth limit) to output,
+    # and returns them with the bracket depth of every branch (or None) and
+    # their birth times, if given (a merged branch grows for as long as the
+    # segments it replaces)
+    def optimize(self, branchesVec, flowersVec, expanded, merge, minLength, maxDepth, births=None):
+        branches = np.asarray(branchesVec, dtype=np.float64).reshape(-1, 6)
+        flowers = np.asarray(flowersVec, dtype=np.float64)
+        branchBirths, flowerBirths = (None, None) if births is None else births
+
+        # nesting depths are read from the expanded program, when it was kept
+        branchDepths = None
+        if (expanded is not None):
+            branchDepths = LSystemOptimize.symbolDepths(expanded, u'F')
+            if (len(branchDepths) != len(branches)):
+                branchDepths = None
+            elif (maxDepth >= 0 and len(flowers) > 0):
+                flowerDepths = LSystemOptimize.symbolDepths(expanded, u'*')
+                if (len(flowerDepths) == len(flowers)):
+                    flowers = flowers[flowerDepths <= maxDepth]
+                    if (flowerBirths is not None):
+                        flowerBirths = flowerBirths[flowerDepths <= maxDepth]
+
+        if (merge and len(branches) > 1):
+            starts, ends = LSystemOptimize.collinearRuns(branches, branchDepths)
+            branches = np.hstack((branches[starts, :3], branches[ends, 3:]))
+            branchDepths = None if branchDepths is None else branchDepths[starts]
+            if (branchBirths is not None):
+                branchBirths = np.column_stack((branchBirths[starts, 0], branchBirths[ends, 1]))
+        keep = LSystemOptimize.detailMask(branches, branchDepths, minLength, maxDepth)
+        branches = branches[keep]
+        branchDepths = None if branchDepths is None else branchDepths[keep]
+        births = None if branchBirths is None else (branchBirths[keep], flowerBirths)
+        return (branches, flowers, branchDepths, births)
+
+    # one instance per prototype segment and flower (tagged with its prototypeId),
+    # plus one placement per subtree
+    def createSubtreeOutputs(self, hierarchy, step):
+        branches, branchIds, flowers, flowerIds = LSystemInstancing.prototypeGeometry(hierarchy)
+        branchesObject, flowersObject = self.createOutputs(branches, flowers, step, branchIds, flowerIds)
+
+        parents, children, positions, rotations = LSystemInstancing.placements(hierarchy)
+        placementsAAD = OpenMaya.MFnArrayAttrsData()
+        placementsObject = placementsAAD.create()
+        self.setVectors(placementsAAD.vectorArray("position"), positions)
+        self.setVectors(placementsAAD.vectorArray("rotation"), rotations)
+        self.setDoubles(placementsAAD.doubleArray("parentId"), parents)
+        self.setDoubles(placementsAAD.doubleArray("prototypeId"), children)
+        return (branchesObject, flowersObject, placementsObject, self.createMesh(None))
+
+    # converts branches and flowers (or the instancer arrays made from them)
+    # into instancer output objects. swapYZ=False is for numpy arrays that are
+    # already in Maya's coordinates.
+    def createOutputs(self, branchesVec, flowersVec, step, branchIds=None, flowerIds=None, arrays=None, swapYZ=True):
+        # instantiate branches output object
+        branchesAAD = OpenMaya.MFnArrayAttrsData()
+        branchesObject = branchesAAD.create()
+        branchesPosArray = branchesAAD.vectorArray("position")
+        branchesIdArray = branchesAAD.doubleArray("id")
+        branchesScaleArray = branchesAAD.vectorArray("scale")
+        branchesOrientArray = branchesAAD.vectorArray("aimDirection")
+
+        # instantiate flowers output object
+        flowersAAD = OpenMaya.MFnArrayAttrsData()
+        flowersObject = flowersAAD.create()
+        flowersPosArray = flowersAAD.vectorArray("position")
+        flowersIdArray = flowersAAD.doubleArray("id")
+        flowersScaleArray = flowersAAD.vectorArray("scale")
+
+        if (branchIds is not None):
+            self.setDoubles(branchesAAD.doubleArray("prototypeId"), branchIds)
+            self.setDoubles(flowersAAD.doubleArray("prototypeId"), flowerIds)
+
+        if (LSystemArrays is not None):
+            # branches and flowers output, converted for the whole tree at once
+            if (arrays is None):
+                arrays = LSystemArrays.instancerArrays(branchesVec, flowersVec, step, swapYZ)
+            for vectorArray, values in zip((branchesPosArray, branchesScaleArray, branchesOrientArray,
+                                            flowersPosArray, flowersScaleArray), arrays):
+                LSystemArrays.fillVectorArray(vectorArray, values)
+            return (branchesObject, flowersObject)
+
+        # branches output
+        radius = step * 0.1
+        for branch in branchesVec:
+            midX = (branch[0] + branch[3]) / 2
+            midY = (branch[2] + branch[5]) / 2
+            midZ = (branch[4] + branch[1]) / 2
+            branchesPosArray.append(OpenMaya.MVector(midX, midY, midZ))
+            vecX = branch[3] - branch[0]
+            vecZ = branch[4] - branch[1]
+            vecY = branch[5] - branch[2]
+            vecBranch = OpenMaya.MVector(vecX, vecY, vecZ)
+            branchesScaleArray.append(OpenMaya.MVector(vecBranch.length(), radius, radius))
+            branchesOrientArray.append(OpenMaya.MVector(vecX, vecY, vecZ))
+
+        # flowers output
+        scale = step * 0.2
+        for flower in flowersVec:
+            flowersPosArray.append(OpenMaya.MVector(flower[0], flower[2], flower[1]))
+            flowersScaleArray.append(OpenMaya.MVector(scale, scale, scale))
+
+        return (branchesObject, flowersObject)
+
+    # replaces the contents of an MVectorArray with a sequence of (x, y, z)
+    def setVectors(self, vectorArray, values):
+        if (LSystemArrays is not None):
+            LSystemArrays.fillVectorArray(vectorArray, values)
+            return
+        vectorArray.clear()
+        for value in values:
+            vectorArray.append(OpenMaya.MVector(value[0], value[1], value[2]))
+
+    # replaces the contents of an MDoubleArray with a sequence of numbers
+    def setDoubles(self, doubleArray, values):
+        if (LSystemArrays is not None):
+            LSystemArrays.fillDoubleArray(doubleArray, values)
+            return
+        doubleArray.clear()
+        for value in values:
+            doubleArray.append(value)
 
 # initializer
 def nodeInitializer():
     tAttr = OpenMaya.MFnTypedAttribute()
     nAttr = OpenMaya.MFnNumericAttribute()
+    eAttr = OpenMaya.MFnEnumAttribute()
+    defaults = LSystem.LSystem()
 
     LSystemInstanceNode.angle = nAttr.create('angle', 'a', OpenMaya.MFnNumericData.kFloat,
-                                             LSystemInstanceNode.lsystem.getDefaultAngle())
+                                             defaults.getDefaultAngle())
     MAKE_INPUT(nAttr)
 
     LSystemInstanceNode.step = nAttr.create('step', 's', OpenMaya.MFnNumericData.kFloat,
-                                            LSystemInstanceNode.lsystem.getDefaultStep())
+                                            defaults.getDefaultStep())
     MAKE_INPUT(nAttr)
 
     LSystemInstanceNode.file = tAttr.create('file', 'g', OpenMaya.MFnData.kString)
@@ -133,28 +711,297 @@ def nodeInitializer():
     LSystemInstanceNode.flowers = tAttr.create('flowers', 'f', OpenMaya.MFnArrayAttrsData.kDynArrayAttrs)
     MAKE_OUTPUT(tAttr)
 
+    LSystemInstanceNode.cacheHits = nAttr.create('cacheHits', 'ch', OpenMaya.MFnNumericData.kInt, 0)
+    MAKE_OUTPUT(nAttr)
+
+    LSystemInstanceNode.cacheMisses = nAttr.create('cacheMisses', 'cm', OpenMaya.MFnNumericData.kInt, 0)
+    MAKE_OUTPUT(nAttr)
+
+    # budgets checked against the predicted size before evaluating (0 means no limit).
+    # With stochastic or parametric productions the prediction is an estimate
+    # (predictionEstimated): going over the budgets only warns, nothing is clamped.
+    LSystemInstanceNode.maxInstances = nAttr.create('maxInstances', 'mxi', OpenMaya.MFnNumericData.kInt, 2000000)
+    MAKE_INPUT(nAttr)
+
+    LSystemInstanceNode.maxSymbols = nAttr.create('maxSymbols', 'mxs', OpenMaya.MFnNumericData.kInt, 100000000)
+    MAKE_INPUT(nAttr)
+
+    # lower the iterations to fit the budgets instead of outputting nothing (exact predictions only)
+    LSystemInstanceNode.clampIterations = nAttr.create('clampIterations', 'ci', OpenMaya.MFnNumericData.kBoolean, True)
+    MAKE_INPUT(nAttr)
+
+    LSystemInstanceNode.predictedSymbols = nAttr.create('predictedSymbols', 'ps', OpenMaya.MFnNumericData.kDouble, 0.0)
+    MAKE_OUTPUT(nAttr)
+
+    LSystemInstanceNode.predictedBranches = nAttr.create('predictedBranches', 'pb', OpenMaya.MFnNumericData.kDouble, 0.0)
+    MAKE_OUTPUT(nAttr)
+
+    LSystemInstanceNode.predictedFlowers = nAttr.create('predictedFlowers', 'pf', OpenMaya.MFnNumericData.kDouble, 0.0)
+    MAKE_OUTPUT(nAttr)
+
+    # the predicted counts are estimates, not bounds
+    LSystemInstanceNode.predictionEstimated = nAttr.create('predictionEstimated', 'pe', OpenMaya.MFnNumericData.kBoolean, False)
+    MAKE_OUTPUT(nAttr)
+
+    # the iterations actually expanded (-1 when nothing was)
+    LSystemInstanceNode.evaluatedIterations = nAttr.create('evaluatedIterations', 'ei', OpenMaya.MFnNumericData.kInt, 0)
+    MAKE_OUTPUT(nAttr)
+
+    # the level the iterations were lowered to by clampIterations (-1 when not clamped)
+    LSystemInstanceNode.clampedIterations = nAttr.create('clampedIterations', 'cli', OpenMaya.MFnNumericData.kInt, -1)
+    MAKE_OUTPUT(nAttr)
+
+    # flat: one branches instance per segment. subtrees: branches and flowers hold every
+    # prototype subtree once (tagged with prototypeId) and placements positions them
+    LSystemInstanceNode.outputMode = eAttr.create('outputMode', 'om', kFlat)
+    eAttr.addField('flat', kFlat)
+    eAttr.addField('subtrees', kSubtrees)
+    eAttr.addField('mesh', kMesh)
+    MAKE_INPUT(eAttr)
+
+    LSystemInstanceNode.placements = tAttr.create('placements', 'pl', OpenMaya.MFnArrayAttrsData.kDynArrayAttrs)
+    MAKE_OUTPUT(tAttr)
+
+    # mesh output: radius factor per bracket depth, and number of sides of the tubes
+    LSystemInstanceNode.mesh = tAttr.create('mesh', 'me', OpenMaya.MFnData.kMesh)
+    MAKE_OUTPUT(tAttr)
+
+    LSystemInstanceNode.taper = nAttr.create('taper', 'tp', OpenMaya.MFnNumericData.kFloat, 0.7)
+    MAKE_INPUT(nAttr)
+
+    LSystemInstanceNode.sides = nAttr.create('sides', 'sd', OpenMaya.MFnNumericData.kInt, 6)
+    MAKE_INPUT(nAttr)
+
+    # merge chains of collinear segments into one longer instance. Off by default: it
+    # changes instance counts and ids, and stretches custom branch geometry.
+    LSystemInstanceNode.mergeCollinear = nAttr.create('mergeCollinear', 'mc', OpenMaya.MFnNumericData.kBoolean, False)
+    MAKE_INPUT(nAttr)
+
+    # level of detail: drop segments shorter than minLength (0 keeps all) and
+    # segments nested deeper than maxDepth brackets (-1 keeps all). minLength is
+    # the length of the segment in world units, not its projected length on screen.
+    LSystemInstanceNode.minLength = nAttr.create('minLength', 'mnl', OpenMaya.MFnNumericData.kFloat, 0.0)
+    MAKE_INPUT(nAttr)
+
+    LSystemInstanceNode.maxDepth = nAttr.create('maxDepth', 'mxd', OpenMaya.MFnNumericData.kInt, -1)
+    MAKE_INPUT(nAttr)
+
+    # evaluate on a worker thread, showing a preview with previewIterations
+    # (-1: the last finished result) until the new result is ready
+    LSystemInstanceNode.background = nAttr.create('background', 'bg', OpenMaya.MFnNumericData.kBoolean, False)
+    MAKE_INPUT(nAttr)
+
+    LSystemInstanceNode.previewIterations = nAttr.create('previewIterations', 'pi', OpenMaya.MFnNumericData.kInt, -1)
+    MAKE_INPUT(nAttr)
+
+    # number of processes the turtle is split over (1 runs it in the node)
+    LSystemInstanceNode.processes = nAttr.create('processes', 'pr', OpenMaya.MFnNumericData.kInt, 1)
+    MAKE_INPUT(nAttr)
+
+    # file written by LSystemBatch; when set, it is loaded instead of evaluating the grammar
+    LSystemInstanceNode.bakedFile = tAttr.create('bakedFile', 'bf', OpenMaya.MFnData.kString)
+    MAKE_INPUT(tAttr)
+
+    # directory of the disk cache shared between sessions, and its size limit in
+    # megabytes. An empty directory or a size of 0 or less turns it off.
+    LSystemInstanceNode.cacheDirectory = tAttr.create('cacheDirectory', 'cd', OpenMaya.MFnData.kString)
+    MAKE_INPUT(tAttr)
+
+    LSystemInstanceNode.cacheSize = nAttr.create('cacheSize', 'cs', OpenMaya.MFnNumericData.kInt, 4096)
+    MAKE_INPUT(nAttr)
+
+    # picks the alternatives of stochastic grammars
+    LSystemInstanceNode.seed = nAttr.create('seed', 'sed', OpenMaya.MFnNumericData.kInt, 0)
+    MAKE_INPUT(nAttr)
+
+    # per-stage wall time (seconds) and peak allocation (bytes) of the last compute,
+    # and the counts of its tree. Peaks are only measured in memory mode, which
+    # traces allocations exactly but slows the Python stages down; in time mode,
+    # or in a Maya whose Python has no tracemalloc (2.7), profilePeaks holds -1
+    # and the log null for every stage. With profileLog set, every profile is
+    # also appended to that file as a line of JSON.
+    LSystemInstanceNode.profile = eAttr.create('profile', 'prf', kProfileOff)
+    eAttr.addField('off', kProfileOff)
+    eAttr.addField('time', kProfileTime)
+    eAttr.addField('memory', kProfileMemory)
+    MAKE_INPUT(eAttr)
+
+    LSystemInstanceNode.profileLog = tAttr.create('profileLog', 'plg', OpenMaya.MFnData.kString)
+    MAKE_INPUT(tAttr)
+
+    LSystemInstanceNode.profileStages = tAttr.create('profileStages', 'pst', OpenMaya.MFnData.kStringArray)
+    MAKE_OUTPUT(tAttr)
+
+    LSystemInstanceNode.profileTimes = tAttr.create('profileTimes', 'ptm', OpenMaya.MFnData.kDoubleArray)
+    MAKE_OUTPUT(tAttr)
+
+    LSystemInstanceNode.profilePeaks = tAttr.create('profilePeaks', 'ppk', OpenMaya.MFnData.kDoubleArray)
+    MAKE_OUTPUT(tAttr)
+
+    LSystemInstanceNode.profileSymbols = nAttr.create('profileSymbols', 'psy', OpenMaya.MFnNumericData.kDouble, 0.0)
+    MAKE_OUTPUT(nAttr)
+
+    LSystemInstanceNode.profileBranches = nAttr.create('profileBranches', 'pbr', OpenMaya.MFnNumericData.kDouble, 0.0)
+    MAKE_OUTPUT(nAttr)
+
+    LSystemInstanceNode.profileFlowers = nAttr.create('profileFlowers', 'pfl', OpenMaya.MFnNumericData.kDouble, 0.0)
+    MAKE_OUTPUT(nAttr)
+
+    # flat output only: show the tree grown to growth (0: nothing, 1: all of it),
+    # segment by segment from the root. Keying growth does not run the L-system
+    # again, only keying the other inputs does.
+    LSystemInstanceNode.animateGrowth = nAttr.create('animateGrowth', 'ag', OpenMaya.MFnNumericData.kBoolean, False)
+    MAKE_INPUT(nAttr)
+
+    LSystemInstanceNode.growth = nAttr.create('growth', 'gr', OpenMaya.MFnNumericData.kFloat, 1.0)
+    nAttr.setMin(0.0)
+    nAttr.setMax(1.0)
+    MAKE_INPUT(nAttr)
+
     try: # add attributes and attribute affects
         LSystemInstanceNode.addAttribute(LSystemInstanceNode.angle)
         LSystemInstanceNode.addAttribute(LSystemInstanceNode.step)
         LSystemInstanceNode.addAttribute(LSystemInstanceNode.file)
         LSystemInstanceNode.addAttribute(LSystemInstanceNode.iterations)
-        LSystemInstanceNode.addAttribute(LSystemInstanceNode.branches)
-        LSystemInstanceNode.addAttribute(LSystemInstanceNode.flowers)
-
-        LSystemInstanceNode.attributeAffects(LSystemInstanceNode.angle, LSystemInstanceNode.branches)
-        LSystemInstanceNode.attributeAffects(LSystemInstanceNode.step, LSystemInstanceNode.branches)
-        LSystemInstanceNode.attributeAffects(LSystemInstanceNode.file, LSystemInstanceNode.branches)
-        LSystemInstanceNode.attributeAffects(LSystemInstanceNode.iterations, LSystemInstanceNode.branches)
-        LSystemInstanceNode.attributeAffects(LSystemInstanceNode.angle, LSystemInstanceNode.flowers)
-        LSystemInstanceNode.attributeAffects(LSystemInstanceNode.step, LSystemInstanceNode.flowers)
-        LSystemInstanceNode.attributeAffects(LSystemInstanceNode.file, LSystemInstanceNode.flowers)
-        LSystemInstanceNode.attributeAffects(LSystemInstanceNode.iterations, LSystemInstanceNode.flowers)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.maxInstances)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.maxSymbols)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.clampIterations)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.outputMode)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.taper)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.sides)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.mergeCollinear)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.minLength)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.maxDepth)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.background)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.previewIterations)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.processes)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.bakedFile)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.cacheDirectory)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.cacheSize)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.seed)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.profile)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.profileLog)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.animateGrowth)
+        LSystemInstanceNode.addAttribute(LSystemInstanceNode.growth)
+        for output in LSystemInstanceNode.outputs():
+            LSystemInstanceNode.addAttribute(output)
+
+        for output in LSystemInstanceNode.outputs():
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.angle, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.step, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.file, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.iterations, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.maxInstances, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.maxSymbols, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.clampIterations, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.outputMode, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.taper, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.sides, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.mergeCollinear, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.minLength, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.maxDepth, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.background, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.previewIterations, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.processes, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.bakedFile, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.cacheDirectory, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.cacheSize, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.seed, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.profile, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.profileLog, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.animateGrowth, output)
+            LSystemInstanceNode.attributeAffects(LSystemInstanceNode.growth, output)
 
         print "Initialization!\n"
 
     except:
         sys.stderr.write( ("Failed to create attributes of %s node\n", kPluginNodeTypeName) )
 
+# Euler XYZ rotation in degrees that turns the x axis along an aim direction,
+# as the instancer does with aimDirection
+def aimRotation(aim):
+    x, y, z = aim
+    return (0.0, math.degrees(math.atan2(-z, math.sqrt(x * x + y * y))), math.degrees(math.atan2(y, x)))
+
+def vectorTuple(vector):
+    return (vector.x, vector.y, vector.z)
+
+# a transform under parent with the given translate, rotate and scale, that
+# instances nodes (shapes with shape=True): every transform made for the same
+# nodes shares them
+def placeInstance(parent, nodes, position, rotation=(0.0, 0.0, 0.0), scale=(1.0, 1.0, 1.0), shape=False):
+    transform = cmds.createNode('transform', parent=parent, skipSelect=True)
+    cmds.setAttr(transform + '.translate', *position, type='double3')
+    cmds.setAttr(transform + '.rotate', *rotation, type='double3')
+    cmds.setAttr(transform + '.scale', *scale, type='double3')
+    if (nodes):
+        cmds.parent(*(list(nodes) + [transform]), addObject=True, relative=True, shape=shape)
+    return transform
+
+# builds the subtrees output of an LSystemInstanceNode into a Maya hierarchy.
+# A hidden group holds one group per prototype with instances of the shapes
+# of the branch and flower objects (their own transforms are not used), and
+# every placement is a transform instancing the group of its prototype under
+# the group of its parent. Each prototype is in the scene once however often
+# it is placed, so the hierarchy grows with the number of prototypes, not
+# with the size of the tree.
+def buildSubtrees(node, branchObject, flowerObject):
+    cmds.setAttr(node + '.outputMode', kSubtrees)
+    selection = OpenMaya.MSelectionList()
+    selection.add(node)
+    nodeObject = OpenMaya.MObject()
+    selection.getDependNode(0, nodeObject)
+    nodeFn = OpenMaya.MFnDependencyNode(nodeObject)
+    outputs = dict((name, OpenMaya.MFnArrayAttrsData(nodeFn.findPlug(name).asMObject()))
+                   for name in ('branches', 'flowers', 'placements'))
+    try:
+        placementParents = outputs['placements'].getDoubleData('parentId')
+    except RuntimeError:
+        cmds.error("%s: the grammar of %s cannot be split into subtrees" % (kPluginNodeTypeName, node))
+
+    library = cmds.group(empty=True, name=node + 'Prototypes')
+    cmds.setAttr(library + '.visibility', False)
+    groups = {}
+    # the group of a prototype, by its full path so that it stays unique once instanced
+    def prototypeGroup(id):
+        if (id not in groups):
+            group = cmds.group(empty=True, parent=library, name='%sPrototype%d' % (node, id))
+            groups[id] = cmds.ls(group, long=True)[0]
+        return groups[id]
+
+    branchShapes = cmds.listRelatives(branchObject, shapes=True, fullPath=True) or []
+    flowerShapes = cmds.listRelatives(flowerObject, shapes=True, fullPath=True) or []
+    branches = outputs['branches']
+    positions, scales = branches.getVectorData('position'), branches.getVectorData('scale')
+    aims, ids = branches.getVectorData('aimDirection'), branches.getDoubleData('prototypeId')
+    for i in range(positions.length()):
+        placeInstance(prototypeGroup(int(ids[i])), branchShapes, vectorTuple(positions[i]),
+                      aimRotation(vectorTuple(aims[i])), vectorTuple(scales[i]), shape=True)
+    flowers = outputs['flowers']
+    positions, scales = flowers.getVectorData('position'), flowers.getVectorData('scale')
+    ids = flowers.getDoubleData('prototypeId')
+    for i in range(positions.length()):
+        placeInstance(prototypeGroup(int(ids[i])), flowerShapes, vectorTuple(positions[i]),
+                      scale=vectorTuple(scales[i]), shape=True)
+
+    # the root is placed first, with a parent id of -1
+    tree = cmds.group(empty=True, name=node + 'Tree')
+    placements = outputs['placements']
+    positions, rotations = placements.getVectorData('position'), placements.getVectorData('rotation')
+    ids = placements.getDoubleData('prototypeId')
+    for i in range(positions.length()):
+        parent = tree if placementParents[i] < 0 else prototypeGroup(int(placementParents[i]))
+        placeInstance(parent, [prototypeGroup(int(ids[i]))], vectorTuple(positions[i]), vectorTuple(rotations[i]))
+    cmds.hide(branchObject, flowerObject)
+    return tree
+
+# buildSubtrees for the selected LSystemInstanceNode, branch object and flower object
+def buildSelectedSubtrees(*args):
+    selection = cmds.ls(selection=True)
+    if (len(selection) != 3 or cmds.nodeType(selection[0]) != kPluginNodeTypeName):
+        cmds.error("Select an LSystemInstanceNode, then the branch and flower objects")
+    cmds.select(buildSubtrees(*selection))
+
 # creator
 def nodeCreator():
     return OpenMayaMPx.asMPxPtr( LSystemInstanceNode() )
@@ -174,3 +1021,12 @@ def uninitializePlugin(mobject):
         mplugin.deregisterNode( LSystemInstanceNodeId )
     except:
         sys.stderr.write( "Failed to unregister node: %s\n" % kPluginNodeTypeName )
+
+    for callback in LSystemInstanceNode.callbacks:
+        try:
+            OpenMaya.MMessage.removeCallback(callback)
+        except RuntimeError:
+            # already removed with its node
+            pass
+    del LSystemInstanceNode.callbacks[:]
+    LSystemParallel.closePool()
@@ -0,0 +1,202 @@
+# LSystemInstancing.py
+#   Builds a compact, hierarchical version of an L-system. Every expansion of
+#   a symbol with a given number of remaining iterations draws the same
+#   geometry relative to the turtle state it starts from, so each
+#   (symbol, remaining iterations) pair is interpreted once as a prototype and
+#   then placed wherever it occurs. The number of prototypes grows with the
+#   number of iterations instead of with the size of the tree.
+#
+#   Turtle frames are 3x3 rotation matrices stored row-major as 9-tuples, with
+#   the heading, left and up vectors as columns, and positions are 3-tuples.
+#   Coordinates are the L-system's (z up) unless noted otherwise.
+
+import math
+
+IDENTITY = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0)
+
+# frame of the turtle at the start of the L-system: heading up the z axis
+START = (0.0, 1.0, 0.0, 0.0, 0.0, 1.0, 1.0, 0.0, 0.0)
+
+# A subtree drawn once, in the frame of the turtle that starts it
+class Prototype(object):
+    def __init__(self, id, symbol, depth):
+        self.id = id
+        self.symbol = symbol
+        self.depth = depth
+        self.branches = []
+        self.flowers = []
+        # (prototype, position, frame) for every subtree placed in this one
+        self.children = []
+        # turtle position and frame after the subtree, relative to its start
+        self.exitPosition = (0.0, 0.0, 0.0)
+        self.exitFrame = IDENTITY
+        self.empty = True
+
+# The prototypes of one L-system and the one the whole tree starts from
+class Hierarchy(object):
+    def __init__(self, prototypes, root):
+        self.prototypes = prototypes
+        self.root = root
+
+    # number of instances needed to draw the hierarchy: the geometry of every
+    # prototype once, plus one per placement
+    def instanceCount(self):
+        count = 1
+        for prototype in self.prototypes:
+            count += len(prototype.branches) + len(prototype.flowers) + len(prototype.children)
+        return count
+
+# product of two frames
+def multiply(a, b):
+    return (a[0] * b[0] + a[1] * b[3] + a[2] * b[6],
+            a[0] * b[1] + a[1] * b[4] + a[2] * b[7],
+            a[0] * b[2] + a[1] * b[5] + a[2] * b[8],
+            a[3] * b[0] + a[4] * b[3] + a[5] * b[6],
+            a[3] * b[1] + a[4] * b[4] + a[5] * b[7],
+            a[3] * b[2] + a[4] * b[5] + a[5] * b[8],
+            a[6] * b[0] + a[7] * b[3] + a[8] * b[6],
+            a[6] * b[1] + a[7] * b[4] + a[8] * b[7],
+            a[6] * b[2] + a[7] * b[5] + a[8] * b[8])
+
+# position p given in a frame placed at origin
+def transform(origin, frame, p):
+    return (origin[0] + frame[0] * p[0] + frame[1] * p[1] + frame[2] * p[2],
+            origin[1] + frame[3] * p[0] + frame[4] * p[1] + frame[5] * p[2],
+            origin[2] + frame[6] * p[0] + frame[7] * p[1] + frame[8] * p[2])
+
+# rotation applied to the turtle frame by every turning command
+def rotationTable(angle):
+    c = math.cos(math.radians(angle))
+    s = math.sin(math.radians(angle))
+    return {
+        u'+': (c, -s, 0.0, s, c, 0.0, 0.0, 0.0, 1.0),
+        u'-': (c, s, 0.0, -s, c, 0.0, 0.0, 0.0, 1.0),
+        u'&': (c, 0.0, -s, 0.0, 1.0, 0.0, s, 0.0, c),
+        u'^': (c, 0.0, s, 0.0, 1.0, 0.0, -s, 0.0, c),
+        u'\\': (1.0, 0.0, 0.0, 0.0, c, -s, 0.0, s, c),
+        u'/': (1.0, 0.0, 0.0, 0.0, c, s, 0.0, -s, c),
+        u'_': (-1.0, 0.0, 0.0, 0.0, -1.0, 0.0, 0.0, 0.0, 1.0),
+    }
+
+# true if every "[" in the string is closed inside it
+def balanced(string):
+    depth = 0
+    for symbol in string:
+        if (symbol == u'['):
+            depth += 1
+        elif (symbol == u']'):
+            depth -= 1
+            if (depth < 0):
+                return False
+    return depth == 0
+
+# returns the Hierarchy of the grammar expanded `iterations` times, or None if
+# a successor has unmatched brackets (its subtrees would change the turtle
+# state of their parent) or the grammar is stochastic or parametric (copies
+# of a symbol do not expand to the same subtree)
+def buildHierarchy(grammar, iterations, angle, step):
+    if (grammar.extended):
+        return None
+    if (not all(balanced(successor) for successor in grammar.rules.values())):
+        return None
+
+    rotations = rotationTable(angle)
+    prototypes = []
+    memo = {}
+
+    # interprets a string whose symbols have `depth` iterations left
+    def interpret(prototype, string, depth):
+        position, frame = (0.0, 0.0, 0.0), IDENTITY
+        stack = []
+        for symbol in string:
+            if (depth > 0 and symbol in grammar.rules):
+                child = subtree(symbol, depth)
+                if (not child.empty):
+                    prototype.children.append((child, position, frame))
+                    prototype.empty = False
+                position = transform(position, frame, child.exitPosition)
+                frame = multiply(frame, child.exitFrame)
+            elif (symbol == u'F' or symbol == u'f'):
+                end = (position[0] + frame[0] * step, position[1] + frame[3] * step, position[2] + frame[6] * step)
+                if (symbol == u'F'):
+                    prototype.branches.append(position + end)
+                    prototype.empty = False
+                position = end
+            elif (symbol in rotations):
+                frame = multiply(frame, rotations[symbol])
+            elif (symbol == u'['):
+                stack.append((position, frame))
+            elif (symbol == u']' and stack):
+                position, frame = stack.pop()
+            elif (symbol == u'*'):
+                prototype.flowers.append(position)
+                prototype.empty = False
+        prototype.exitPosition = position
+        prototype.exitFrame = frame
+
+    # the prototype of a symbol with `depth` iterations left
+    def subtree(symbol, depth):
+        key = (symbol, depth)
+        if (key not in memo):
+            prototype = Prototype(len(prototypes), symbol, depth)
+            prototypes.append(prototype)
+            memo[key] = prototype
+            interpret(prototype, grammar.rules[symbol], depth - 1)
+        return memo[key]
+
+    root = Prototype(len(prototypes), None, iterations)
+    prototypes.append(root)
+    interpret(root, grammar.axiom, iterations)
+    return Hierarchy(prototypes, root)
+
+# expands a hierarchy back into world-space branches and flowers
+def flatten(hierarchy, branches, flowers):
+    def place(prototype, origin, frame):
+        for branch in prototype.branches:
+            branches.append(transform(origin, frame, branch[:3]) + transform(origin, frame, branch[3:]))
+        for flower in prototype.flowers:
+            flowers.append(transform(origin, frame, flower))
+        for child, position, childFrame in prototype.children:
+            place(child, transform(origin, frame, position), multiply(frame, childFrame))
+    place(hierarchy.root, (0.0, 0.0, 0.0), START)
+
+# Euler XYZ rotation in degrees of a frame, after swapping y and z for Maya
+def mayaRotation(frame):
+    # swapping y and z on both sides keeps the result a proper rotation
+    m = (frame[0], frame[2], frame[1], frame[6], frame[8], frame[7], frame[3], frame[5], frame[4])
+    sy = -m[6]
+    y = math.asin(max(-1.0, min(1.0, sy)))
+    if (abs(sy) < 0.999999):
+        x = math.atan2(m[7], m[8])
+        z = math.atan2(m[3], m[0])
+    else:
+        x = 0.0
+        z = math.atan2(-m[1], m[4])
+    return (math.degrees(x), math.degrees(y), math.degrees(z))
+
+# the placement of every subtree, in Maya coordinates: parent prototype id,
+# child prototype id, position and XYZ rotation in the parent's frame. The
+# root is placed first, with a parent id of -1.
+def placements(hierarchy):
+    parents = [-1]
+    children = [hierarchy.root.id]
+    positions = [(0.0, 0.0, 0.0)]
+    rotations = [mayaRotation(START)]
+    for prototype in hierarchy.prototypes:
+        for child, position, frame in prototype.children:
+            parents.append(prototype.id)
+            children.append(child.id)
+            positions.append((position[0], position[2], position[1]))
+            rotations.append(mayaRotation(frame))
+    return parents, children, positions, rotations
+
+# the geometry of every prototype in its own frame, with the id of the
+# prototype each branch and flower belongs to
+def prototypeGeometry(hierarchy):
+    branches, branchIds, flowers, flowerIds = [], [], [], []
+    for prototype in hierarchy.prototypes:
+        branches.extend(prototype.branches)
+        branchIds.extend([prototype.id] * len(prototype.branches))
+        flowers.extend(prototype.flowers)
+        flowerIds.extend([prototype.id] * len(prototype.flowers))
+    return branches, branchIds, flowers, flowerIds
@@ -0,0 +1,83 @@
+# LSystemMesh.py
+#   Builds one combined mesh of tubes along the branches of an L-system, as an
+#   alternative to instancing a shape per segment. Every segment is a tube
+#   between two rings of vertices. A segment that starts where the previous
+#   one ended, at the same bracket depth, shares that ring instead of making
+#   its own, so chains of segments form one continuous tube. The radius
+#   shrinks by a taper factor with every level of bracket depth.
+#   Branches are N x 6 arrays (start x, y, z, end x, y, z) in Maya's
+#   coordinates, in the order the turtle drew them.
+
+import numpy as np
+
+# unit vectors perpendicular to every (unit) direction, and a second set
+# completing right-handed frames: u x v = direction
+def ringFrames(directions):
+    # world y unless the direction is close to it
+    reference = np.zeros_like(directions)
+    nearY = np.abs(directions[:, 1]) > 0.9
+    reference[~nearY, 1] = 1.0
+    reference[nearY, 0] = 1.0
+    u = np.cross(reference, directions)
+    u /= np.sqrt(np.einsum('ij,ij->i', u, u))[:, np.newaxis]
+    v = np.cross(directions, u)
+    return u, v
+
+def normalize(vectors):
+    lengths = np.sqrt(np.einsum('ij,ij->i', vectors, vectors))
+    return vectors / np.maximum(lengths, 1e-12)[:, np.newaxis]
+
+# returns the vertices (V x 3), polygon counts and polygon vertex indices of
+# the tubes around the branches. radius is the radius at depth 0, and taper
+# the factor applied per bracket depth (depths may be None: all at depth 0).
+def tubeMesh(branches, depths, radius, taper, sides, tolerance=1e-5):
+    branches = np.asarray(branches, dtype=np.float64).reshape(-1, 6)
+    sides = max(int(sides), 3)
+    count = len(branches)
+    if (count == 0):
+        return np.zeros((0, 3)), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+    depths = np.zeros(count, dtype=np.int32) if depths is None else np.asarray(depths)
+
+    starts, ends = branches[:, :3], branches[:, 3:]
+    directions = normalize(ends - starts)
+    radii = radius * np.power(taper, depths.astype(np.float64))
+
+    # segments that continue the previous one share its end ring
+    joined = np.zeros(count, dtype=bool)
+    joined[1:] = np.all(np.abs(starts[1:] - ends[:-1]) <= tolerance, axis=1) & (depths[1:] == depths[:-1])
+
+    # every segment adds its end ring, plus a start ring unless it is joined,
+    # so the start ring is always the ring just before the end ring
+    endRings = np.cumsum(np.where(joined, 1, 2)) - 1
+    startRings = endRings - 1
+    ringCount = endRings[-1] + 1
+
+    centers = np.empty((ringCount, 3))
+    ringDirections = np.empty((ringCount, 3))
+    ringRadii = np.empty(ringCount)
+    centers[endRings] = ends
+    centers[startRings[~joined]] = starts[~joined]
+    ringRadii[endRings] = radii
+    ringRadii[startRings] = radii
+
+    # a shared ring is tilted halfway between the two segments it joins
+    ringDirections[startRings] = directions
+    ringDirections[endRings] = directions
+    continued = np.flatnonzero(joined)
+    ringDirections[endRings[continued - 1]] = normalize(directions[continued - 1] + directions[continued])
+
+    u, v = ringFrames(ringDirections)
+    angles = np.linspace(0.0, 2.0 * np.pi, sides, endpoint=False)
+    offsets = (np.cos(angles)[np.newaxis, :, np.newaxis] * u[:, np.newaxis, :] +
+               np.sin(angles)[np.newaxis, :, np.newaxis] * v[:, np.newaxis, :])
+    vertices = centers[:, np.newaxis, :] + ringRadii[:, np.newaxis, np.newaxis] * offsets
+
+    # one quad per side of every segment, wound so that the normals face out
+    k = np.arange(sides)
+    nextK = (k + 1) % sides
+    first = startRings[:, np.newaxis] * sides
+    last = endRings[:, np.newaxis] * sides
+    quads = np.stack((first + k, first + nextK, last + nextK, last + k), axis=-1)
+
+    polygonCounts = np.full(count * sides, 4, dtype=np.int32)
+    return vertices.reshape(-1, 3), polygonCounts, quads.reshape(-1).astype(np.int32)
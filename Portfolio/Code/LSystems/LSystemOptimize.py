@@ -0,0 +1,69 @@
+# LSystemOptimize.py
+#   Reduces the number of branches sent to the instancer, between running the
+#   L-system and building the output arrays. Chains of collinear segments
+#   (e.g. from F -> FF) are merged into one longer segment, and an optional
+#   level of detail drops short segments and deeply nested branches.
+#   Branches are N x 6 arrays (start x, y, z, end x, y, z) in the L-system's
+#   coordinates, in the order the turtle drew them.
+
+import numpy as np
+
+# bracket nesting depth of every occurrence of a symbol in an expanded program
+def symbolDepths(program, symbol):
+    codes = np.frombuffer(program.encode('utf-8'), dtype=np.uint8)
+    nesting = np.cumsum((codes == ord('[')).astype(np.int32) - (codes == ord(']')))
+    return nesting[codes == ord(symbol)]
+
+# merges runs of consecutive segments where each one starts at the end of the
+# previous one and points the same way (and, if depths are given, has the same
+# nesting depth). Returns the merged branches and their depths.
+def mergeCollinear(branches, depths=None, tolerance=1e-5):
+    branches = np.asarray(branches, dtype=np.float64).reshape(-1, 6)
+    if (len(branches) < 2):
+        return branches, depths
+    starts, ends = collinearRuns(branches, depths, tolerance)
+    merged = np.hstack((branches[starts, :3], branches[ends, 3:]))
+    return merged, (None if depths is None else np.asarray(depths)[starts])
+
+# the first and last segment of every run that mergeCollinear merges
+def collinearRuns(branches, depths=None, tolerance=1e-5):
+    branches = np.asarray(branches, dtype=np.float64).reshape(-1, 6)
+    if (len(branches) < 2):
+        return np.arange(len(branches)), np.arange(len(branches))
+
+    directions = branches[:, 3:] - branches[:, :3]
+    previous, current = directions[:-1], directions[1:]
+    lengths = np.sqrt(np.einsum('ij,ij->i', directions, directions))
+    scale = lengths[:-1] * lengths[1:]
+
+    joined = np.all(np.abs(branches[1:, :3] - branches[:-1, 3:]) <= tolerance, axis=1)
+    cross = np.cross(previous, current)
+    parallel = np.sqrt(np.einsum('ij,ij->i', cross, cross)) <= tolerance * scale
+    sameWay = np.einsum('ij,ij->i', previous, current) > 0.0
+
+    continues = joined & parallel & sameWay
+    if (depths is not None):
+        depths = np.asarray(depths)
+        continues &= depths[1:] == depths[:-1]
+
+    starts = np.flatnonzero(np.concatenate(([True], ~continues)))
+    ends = np.append(starts[1:], len(branches)) - 1
+    return starts, ends
+
+# drops segments shorter than minLength and segments nested deeper than
+# maxDepth (a negative maxDepth or a minLength of 0 disables that test)
+def levelOfDetail(branches, depths=None, minLength=0.0, maxDepth=-1):
+    branches = np.asarray(branches, dtype=np.float64).reshape(-1, 6)
+    keep = detailMask(branches, depths, minLength, maxDepth)
+    return branches[keep], (None if depths is None else np.asarray(depths)[keep])
+
+# the segments that levelOfDetail keeps
+def detailMask(branches, depths=None, minLength=0.0, maxDepth=-1):
+    branches = np.asarray(branches, dtype=np.float64).reshape(-1, 6)
+    keep = np.ones(len(branches), dtype=bool)
+    if (minLength > 0.0):
+        directions = branches[:, 3:] - branches[:, :3]
+        keep &= np.einsum('ij,ij->i', directions, directions) >= minLength * minLength
+    if (maxDepth >= 0 and depths is not None):
+        keep &= np.asarray(depths) <= maxDepth
+    return keep
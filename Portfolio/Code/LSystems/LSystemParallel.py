@@ -0,0 +1,161 @@
+# LSystemParallel.py
+#   Interprets one large expanded L-system on several processes. A "[" ... "]"
+#   part restores the turtle state when it closes, so the turtle state at any
+#   position outside brackets only depends on the symbols outside brackets
+#   before it. The program is cut into chunks at such top-level positions,
+#   the state at every cut is found by running the turtle over the top-level
+#   symbols only, and the chunks are interpreted by a process pool. Results
+#   are joined in program order, so the output is the same as interpreting
+#   the whole program with LSystemPy on one process. Chunks come back as
+#   float32 buffers, so list outputs get float32 precision. Only use it when
+#   the serial run would use LSystemPy too, with LSystemPy containers.
+
+import bisect
+import multiprocessing
+import os
+import re
+import sys
+import threading
+
+import LSystemPy
+
+BRACKETS = re.compile(u'[\\[\\]]')
+
+# the pool is shared by every node. It is only replaced by a pool of another
+# size when no map runs on it, and users counts the maps that do.
+pool = None
+poolSize = 0
+users = 0
+poolsLock = threading.Condition()
+
+# output sink for the turtle runs that only need the final state
+class Discard(object):
+    def append(self, item):
+        pass
+
+# (start, end) of every top-level bracketed part: program[start] is the "["
+# and program[end] the matching "]" (or the end of an unclosed part)
+def topLevelSpans(program):
+    spans = []
+    depth = 0
+    start = 0
+    for match in BRACKETS.finditer(program):
+        if (match.group() == u'['):
+            if (depth == 0):
+                start = match.start()
+            depth += 1
+        elif (depth > 0):
+            depth -= 1
+            if (depth == 0):
+                spans.append((start, match.start()))
+    if (depth > 0):
+        spans.append((start, len(program)))
+    return spans
+
+# positions outside brackets that cut the program into about `count` chunks
+def chunkBoundaries(program, spans, count):
+    starts = [start for start, end in spans]
+    boundaries = [0]
+    for k in range(1, count):
+        position = len(program) * k // count
+        i = bisect.bisect_left(starts, position) - 1
+        if (i >= 0 and position <= spans[i][1]):
+            position = spans[i][1] + 1
+        # nor between a parametric symbol and the end of its arguments
+        if (program.rfind(u'(', 0, position + 1) > program.rfind(u')', 0, position)):
+            position = program.find(u')', position) + 1 or len(program)
+        if (boundaries[-1] < position < len(program)):
+            boundaries.append(position)
+    boundaries.append(len(program))
+    return boundaries
+
+# the symbols of program[begin:end] that are outside brackets
+def topLevelSymbols(program, spans, begin, end):
+    starts = [start for start, stop in spans]
+    parts = []
+    position = begin
+    for i in range(bisect.bisect_left(starts, begin), bisect.bisect_left(starts, end)):
+        parts.append(program[position:spans[i][0]])
+        position = spans[i][1] + 1
+    parts.append(program[position:end])
+    return u''.join(parts)
+
+# runs in a pool process: interprets one chunk from its starting state into
+# float32 buffers, which are also much cheaper to send back than tuples
+def interpretChunk(arguments):
+    chunk, state, angle, step, swapYZ = arguments
+    lsystem = LSystemPy.LSystem()
+    lsystem.setDefaultAngle(angle)
+    lsystem.setDefaultStep(step)
+    branches, flowers = LSystemPy.FloatBuffer(6, swapYZ), LSystemPy.FloatBuffer(3, swapYZ)
+    lsystem.interpret(chunk, branches, flowers, state)
+    return branches, flowers
+
+# the process pool with the given number of processes, for one map. A pool
+# of another size is closed and joined first, once the maps on it are done.
+# Every acquirePool is followed by a releasePool.
+def acquirePool(processes):
+    global pool, poolSize, users
+    with poolsLock:
+        while (pool is not None and poolSize != processes and users > 0):
+            poolsLock.wait()
+        if (pool is None or poolSize != processes):
+            closePoolLocked()
+            # inside Maya the worker processes have to be mayapy, not another Maya
+            if (os.path.basename(sys.executable).lower().startswith('maya')):
+                mayapy = 'mayapy.exe' if os.name == 'nt' else 'mayapy'
+                multiprocessing.set_executable(os.path.join(os.path.dirname(sys.executable), mayapy))
+            pool = multiprocessing.Pool(processes)
+            poolSize = processes
+        users += 1
+        return pool
+
+def releasePool():
+    global users
+    with poolsLock:
+        users -= 1
+        poolsLock.notify_all()
+
+def closePoolLocked():
+    global pool, poolSize
+    if (pool is not None):
+        pool.close()
+        pool.join()
+        pool = None
+        poolSize = 0
+
+# closes the pool when the plug-in is unloaded
+def closePool():
+    global pool, poolSize
+    with poolsLock:
+        if (pool is not None):
+            pool.terminate()
+            pool.join()
+            pool = None
+            poolSize = 0
+
+# interprets an expanded program on `processes` processes, appending to
+# branches and flowers in the same order as a serial run
+def interpret(program, angle, step, processes, branches, flowers):
+    spans = topLevelSpans(program)
+    boundaries = chunkBoundaries(program, spans, processes * 4)
+
+    # turtle state at the start of every chunk
+    lsystem = LSystemPy.LSystem()
+    lsystem.setDefaultAngle(angle)
+    lsystem.setDefaultStep(step)
+    states = [LSystemPy.START]
+    for begin, end in zip(boundaries[:-2], boundaries[1:-1]):
+        symbols = topLevelSymbols(program, spans, begin, end)
+        states.append(lsystem.interpret(symbols, Discard(), Discard(), states[-1]))
+
+    swapYZ = getattr(branches, 'swapYZ', False)
+    jobs = [(program[begin:end], state, angle, step, swapYZ)
+            for begin, end, state in zip(boundaries[:-1], boundaries[1:], states)]
+    try:
+        results = acquirePool(processes).map(interpretChunk, jobs)
+    finally:
+        releasePool()
+    for chunkBranches, chunkFlowers in results:
+        branches.extend(chunkBranches)
+        flowers.extend(chunkFlowers)
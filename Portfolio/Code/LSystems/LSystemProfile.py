@@ -0,0 +1,117 @@
+# LSystemProfile.py
+#   Per-stage timing of LSystemInstanceNode evaluations. A Profile records the
+#   wall time of every stage (grammar loading, expansion, turtle, conversion to
+#   the instancer arrays, ...) and the symbol, branch and flower counts of the
+#   tree. A Profile made with traceMemory also records the peak allocation of
+#   every stage with tracemalloc: exact Python and numpy allocations, but
+#   pure-Python stages run several times slower while it traces. Without
+#   traceMemory, or on a Python without tracemalloc (2.7), peaks are None:
+#   unavailable. When profiling is off the node uses DISABLED, whose stages do
+#   nothing.
+
+from __future__ import division
+
+import io
+import json
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# the most precise wall clock available
+clock = getattr(time, 'perf_counter', time.time)
+
+# Measures one stage of a Profile, as a context manager
+class Stage(object):
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        # tracemalloc is only started for the stage, and left alone if
+        # something else is already tracing
+        self.tracing = self.profile.traceMemory and tracemalloc is not None and not tracemalloc.is_tracing()
+        if (self.tracing):
+            tracemalloc.start()
+        self.start = clock()
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        seconds = clock() - self.start
+        peak = None
+        if (self.tracing):
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.profile.stages.append((self.name, seconds, peak))
+        return False
+
+# The stages and counts of one evaluation
+class Profile(object):
+    enabled = True
+
+    def __init__(self, traceMemory=False):
+        self.traceMemory = traceMemory
+        self.stages = []
+        self.symbols = 0
+        self.branches = 0
+        self.flowers = 0
+
+    def stage(self, name):
+        return Stage(self, name)
+
+    def setCounts(self, symbols=None, branches=None, flowers=None):
+        if (symbols is not None):
+            self.symbols = symbols
+        if (branches is not None):
+            self.branches = branches
+        if (flowers is not None):
+            self.flowers = flowers
+
+    def names(self):
+        return [name for name, seconds, peak in self.stages]
+
+    def seconds(self):
+        return [seconds for name, seconds, peak in self.stages]
+
+    def peaks(self):
+        return [peak for name, seconds, peak in self.stages]
+
+    def total(self):
+        return sum(self.seconds())
+
+    def record(self, **info):
+        entry = dict(info)
+        entry.update({u'time': time.time(), u'total': self.total(),
+                      u'symbols': self.symbols, u'branches': self.branches, u'flowers': self.flowers,
+                      u'stages': [{u'name': name, u'seconds': seconds, u'peakBytes': peak}
+                                  for name, seconds, peak in self.stages]})
+        return entry
+
+    # appends the profile as one JSON line to a log file
+    def write(self, path, **info):
+        line = json.dumps(self.record(**info), sort_keys=True)
+        with io.open(path, 'a', encoding='utf-8') as logFile:
+            logFile.write(u'%s\n' % line)
+
+# stage of the disabled profile: does nothing
+class NullStage(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        return False
+
+# Profile that records nothing, so instrumented code costs one call per stage
+class NullProfile(Profile):
+    enabled = False
+    nullStage = NullStage()
+
+    def stage(self, name):
+        return self.nullStage
+
+    def setCounts(self, symbols=None, branches=None, flowers=None):
+        pass
+
+DISABLED = NullProfile()
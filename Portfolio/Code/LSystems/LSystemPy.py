@@ -0,0 +1,482 @@
+# LSystemPy.py
+#   Pure-Python L-system engine with the same interface as the compiled
+#   LSystem module. Rules are expanded lazily, depth first, and the turtle
+#   consumes the symbols as they are produced, so the expanded string is never
+#   held in memory: memory grows with iterations times rule length instead of
+#   with the length of the output.
+#
+#   The L-system works with z up. The turtle starts at the origin heading up
+#   the z axis and understands the following commands:
+#       F       Move forward one step. Draw a segment.
+#       f       Move forward one step. Do not draw a segment.
+#       + -     Turn around the up axis.
+#       & ^     Pitch around the left axis.
+#       \ /     Roll around the heading.
+#       _       Turn around by 180 degrees.
+#       [ ]     Push / pop the turtle state.
+#       *       Draw a flower.
+#   In parametric grammars F(l) and f(l) move by l, and the turning commands
+#   with an argument turn by that many degrees.
+
+import array
+import math
+import operator
+import os
+import tempfile
+
+import LSystemGrammar
+
+# container used for branches and flowers, like the compiled module's
+VectorPyBranch = list
+
+# Contiguous float32 rows (6 per branch, 3 per flower) that the turtle appends
+# to like a VectorPyBranch, without a Python tuple per row. The rows live in an
+# array.array, so NumPy can wrap them without copying (see
+# LSystemArrays.bufferArray). With swapYZ the y and z of every point are
+# swapped as the row is stored, giving Maya's y up coordinates.
+class FloatBuffer(object):
+    def __init__(self, columns, swapYZ=False):
+        self.columns = columns
+        self.swapYZ = swapYZ
+        self.data = array.array('f')
+        self.setOrder()
+
+    def setOrder(self):
+        if (self.swapYZ):
+            order = [point + axis for point in range(0, self.columns, 3) for axis in (0, 2, 1)]
+        else:
+            order = range(self.columns)
+        self.pick = operator.itemgetter(*order)
+
+    def append(self, row):
+        self.data.extend(self.pick(row))
+
+    def extend(self, rows):
+        if (isinstance(rows, FloatBuffer) and (rows.columns, rows.swapYZ) == (self.columns, self.swapYZ)):
+            self.data.extend(rows.data)
+            return
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return len(self.data) // self.columns
+
+    # rows as tuples, in the order they are stored
+    def __iter__(self):
+        data, columns = self.data, self.columns
+        for start in range(0, len(data), columns):
+            yield tuple(data[start:start + columns])
+
+    # itemgetter cannot be pickled, so buffers sent between processes rebuild it
+    def __getstate__(self):
+        return (self.columns, self.swapYZ, self.data)
+
+    def __setstate__(self, state):
+        self.columns, self.swapYZ, self.data = state
+        self.setOrder()
+
+# turtle state at the start: position, heading, left and up
+START = (0.0, 0.0, 0.0, 0.0, 0.0, 1.0, 1.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+
+# rotation of every turning command: the two frame vectors (0 heading, 1 left,
+# 2 up) it turns into each other, and the cosine and sine of the turn. Tables
+# are computed once per angle.
+rotationTables = {}
+
+# the frame vectors every command turns, and the direction it turns them
+TURNS = {u'+': (0, 1, 1.0), u'-': (0, 1, -1.0), u'&': (0, 2, 1.0), u'^': (0, 2, -1.0),
+         u'\\': (1, 2, 1.0), u'/': (1, 2, -1.0)}
+
+def rotationTable(angle):
+    table = rotationTables.get(angle)
+    if (table is None):
+        c = math.cos(math.radians(angle))
+        s = math.sin(math.radians(angle))
+        table = dict((symbol, (a, b, c, s * sign)) for symbol, (a, b, sign) in TURNS.items())
+        table[u'_'] = (0, 1, -1.0, 0.0)
+        rotationTables[angle] = table
+    return table
+
+# a frame (heading, left and up as a 9-tuple) with vectors a and b turned into
+# each other by the given cosine and sine, renormalized
+def rotateFrame(frame, a, b, c, s):
+    vectors = [frame[0:3], frame[3:6], frame[6:9]]
+    va, vb = vectors[a], vectors[b]
+    vectors[a] = (va[0] * c + vb[0] * s, va[1] * c + vb[1] * s, va[2] * c + vb[2] * s)
+    vectors[b] = (vb[0] * c - va[0] * s, vb[1] * c - va[1] * s, vb[2] * c - va[2] * s)
+
+    # Gram-Schmidt on heading and left, and up = heading x left
+    (hx, hy, hz), (lx, ly, lz) = vectors[0], vectors[1]
+    length = math.sqrt(hx * hx + hy * hy + hz * hz)
+    hx, hy, hz = hx / length, hy / length, hz / length
+    dot = lx * hx + ly * hy + lz * hz
+    lx, ly, lz = lx - dot * hx, ly - dot * hy, lz - dot * hz
+    length = math.sqrt(lx * lx + ly * ly + lz * lz)
+    lx, ly, lz = lx / length, ly / length, lz / length
+    return (hx, hy, hz, lx, ly, lz, hy * lz - hz * ly, hz * lx - hx * lz, hx * ly - hy * lx)
+
+# The turtle frames (heading, left and up as a 9-tuple) met during one
+# interpretation, numbered as they are found. Turning a frame by a command is
+# computed once and then looked up, and moving forward adds the frame's
+# precomputed step. New frames are renormalized, and a frame within rounding
+# of an earlier one is the earlier one, so the frame does not drift and the
+# table stays small when turns cancel out. At most `limit` frames are kept.
+class FrameTable(object):
+    def __init__(self, angle, step, limit=256):
+        self.rotations = rotationTable(angle)
+        self.step = step
+        self.limit = limit
+        self.frames = []
+        self.moves = []
+        self.ids = {}
+        # for every command, the id of every frame turned by it (-1 if not known yet)
+        self.turns = dict((symbol, []) for symbol in self.rotations)
+        # (frame id, command, arguments) -> id of the frame turned by an explicit angle
+        self.explicitTurns = {}
+
+    # the id of a frame, or -1 if it is new and the table is full
+    def intern(self, frame):
+        key = tuple([round(value, 9) for value in frame])
+        id = self.ids.get(key)
+        if (id is None):
+            if (len(self.frames) >= self.limit):
+                return -1
+            id = len(self.frames)
+            self.ids[key] = id
+            self.frames.append(frame)
+            self.moves.append((frame[0] * self.step, frame[1] * self.step, frame[2] * self.step))
+            for turned in self.turns.values():
+                turned.append(-1)
+        return id
+
+    # frame turned by a command, renormalized, by the angle of its argument if it has one
+    def rotate(self, frame, symbol, values=()):
+        if (values and symbol in TURNS):
+            a, b, sign = TURNS[symbol]
+            angle = math.radians(values[0])
+            return rotateFrame(frame, a, b, math.cos(angle), math.sin(angle) * sign)
+        return rotateFrame(frame, *self.rotations[symbol])
+
+    # id of a frame turned by a command, or -1 if the table is full
+    def turn(self, id, symbol):
+        turned = self.intern(self.rotate(self.frames[id], symbol))
+        if (turned >= 0):
+            self.turns[symbol][id] = turned
+        return turned
+
+    # id of a frame turned by a command with arguments, or -1 if the table is full
+    def turnBy(self, id, symbol, values):
+        turned = self.intern(self.rotate(self.frames[id], symbol, values))
+        if (turned >= 0):
+            self.explicitTurns[(id, symbol, values)] = turned
+        return turned
+
+class LSystem(object):
+    def __init__(self):
+        self.angle = 22.5
+        self.step = 1.0
+        self.seed = 0
+        self.grammar = LSystemGrammar.Grammar(u'', {})
+
+    def getDefaultAngle(self):
+        return self.angle
+
+    def setDefaultAngle(self, angle):
+        self.angle = angle
+
+    def getDefaultStep(self):
+        return self.step
+
+    def setDefaultStep(self, step):
+        self.step = step
+
+    # seed of the stochastic productions
+    def getSeed(self):
+        return self.seed
+
+    def setSeed(self, seed):
+        self.seed = seed
+
+    def loadProgram(self, path):
+        if (isinstance(path, bytes)):
+            path = path.decode()
+        self.grammar = LSystemGrammar.loadGrammar(path)
+
+    def loadProgramFromString(self, program):
+        if (isinstance(program, bytes)):
+            program = program.decode()
+        self.grammar = LSystemGrammar.parseGrammar(program)
+
+    # yields the symbols of the axiom rewritten `iterations` times, depth first.
+    # The stack holds one iterator per level, over the successor being expanded.
+    def symbols(self, iterations):
+        rules = self.grammar.rules
+        stack = [(iter(self.grammar.axiom), iterations)]
+        while (stack):
+            successor, depth = stack[-1]
+            for symbol in successor:
+                if (depth > 0 and symbol in rules):
+                    stack.append((iter(rules[symbol]), depth - 1))
+                    break
+                yield symbol
+            else:
+                stack.pop()
+
+    # symbols() for stochastic and parametric grammars: yields characters, or
+    # (symbol, arguments) modules for parametric grammars. Like the level by
+    # level rewrite, every level counts the symbols it rewrites, so both pick
+    # the same stochastic alternatives.
+    def extendedSymbols(self, iterations):
+        grammar = self.grammar
+        productions = grammar.productions
+        parametric = grammar.parametric
+        counters = [0] * (iterations + 1)
+        try:
+            axiom = grammar.axiomModules()
+        except LSystemGrammar.EXPRESSION_ERRORS as error:
+            raise LSystemGrammar.GrammarError(u'invalid axiom: %s' % error)
+        stack = [(iter(axiom), iterations)]
+        while (stack):
+            successor, depth = stack[-1]
+            for module in successor:
+                symbol, values = module if parametric else (module, ())
+                if (depth > 0 and symbol in productions):
+                    level = iterations - depth
+                    try:
+                        production = grammar.choose(productions[symbol], values, self.seed, level, counters[level])
+                        if (production is None):
+                            # kept as it is, and rewritten again at the next level
+                            modules = (module,)
+                        elif (parametric):
+                            modules = production.modules(*production.arguments(values))
+                        else:
+                            modules = production.symbols
+                    except LSystemGrammar.EXPRESSION_ERRORS as error:
+                        raise LSystemGrammar.GrammarError(u'cannot rewrite iteration %d: %s' % (level + 1, error))
+                    counters[level] += 1
+                    stack.append((iter(modules), depth - 1))
+                    break
+                yield module
+            else:
+                stack.pop()
+
+    # expands the grammar and appends (start, end) branches and flower positions
+    def processPy(self, iterations, branches, flowers):
+        if (self.grammar.parametric and iterations == 0):
+            # an already expanded string, as the node runs it
+            self.interpretModules(LSystemGrammar.parseModules(self.grammar.axiom), branches, flowers)
+        elif (self.grammar.parametric):
+            self.interpretModules(self.extendedSymbols(iterations), branches, flowers)
+        elif (self.grammar.extended):
+            self.interpret(self.extendedSymbols(iterations), branches, flowers)
+        else:
+            self.interpret(self.symbols(iterations), branches, flowers)
+
+    # runs the turtle over a sequence of symbols, starting from a turtle state,
+    # and returns the state it ends in. Turning commands go through a
+    # FrameTable while its frames keep recurring, as they do in most grammars;
+    # if it fills up, the rest of the symbols are interpreted by rotating the
+    # frame directly.
+    def interpret(self, symbols, branches, flowers, state=START):
+        if (isinstance(symbols, type(u'')) and u'(' in symbols):
+            # an expanded parametric string
+            return self.interpretModules(LSystemGrammar.parseModules(symbols), branches, flowers, state)
+        symbols = iter(symbols)
+        table = FrameTable(self.angle, self.step)
+        state, stack = self.interpretFrames(symbols, branches, flowers, state, table)
+        if (stack is None):
+            return state
+        return self.interpretDirect(symbols, branches, flowers, state, stack)
+
+    # the turtle with frame ids: F and f add the precomputed move of the frame,
+    # and turning commands look the next frame up. Returns (state, None) when
+    # the symbols are done, or (state, stack) if the table filled up.
+    def interpretFrames(self, symbols, branches, flowers, state, table):
+        x, y, z = state[:3]
+        frame = table.intern(state[3:])
+        moves, turns = table.moves, table.turns
+        stack = []
+
+        for symbol in symbols:
+            if (symbol == u'F'):
+                dx, dy, dz = moves[frame]
+                nx, ny, nz = x + dx, y + dy, z + dz
+                branches.append((x, y, z, nx, ny, nz))
+                x, y, z = nx, ny, nz
+            elif (symbol in turns):
+                turned = turns[symbol][frame]
+                if (turned < 0):
+                    turned = table.turn(frame, symbol)
+                    if (turned < 0):
+                        # table full: hand the state over with full frames
+                        stack = [item[:3] + table.frames[item[3]] for item in stack]
+                        state = (x, y, z) + table.rotate(table.frames[frame], symbol)
+                        return state, stack
+                frame = turned
+            elif (symbol == u'f'):
+                dx, dy, dz = moves[frame]
+                x, y, z = x + dx, y + dy, z + dz
+            elif (symbol == u'['):
+                stack.append((x, y, z, frame))
+            elif (symbol == u']' and stack):
+                x, y, z, frame = stack.pop()
+            elif (symbol == u'*'):
+                flowers.append((x, y, z))
+
+        return (x, y, z) + table.frames[frame], None
+
+    # the turtle with the frame in local variables, rotated by every turning command
+    def interpretDirect(self, symbols, branches, flowers, state, stack):
+        step = self.step
+        c = math.cos(math.radians(self.angle))
+        s = math.sin(math.radians(self.angle))
+
+        # position, heading, left and up
+        x, y, z, hx, hy, hz, lx, ly, lz, ux, uy, uz = state
+
+        for symbol in symbols:
+            if (symbol == u'F'):
+                nx, ny, nz = x + hx * step, y + hy * step, z + hz * step
+                branches.append((x, y, z, nx, ny, nz))
+                x, y, z = nx, ny, nz
+            elif (symbol == u'f'):
+                x, y, z = x + hx * step, y + hy * step, z + hz * step
+            elif (symbol == u'+' or symbol == u'-'):
+                t = s if symbol == u'+' else -s
+                hx, hy, hz, lx, ly, lz = (hx * c + lx * t, hy * c + ly * t, hz * c + lz * t,
+                                          lx * c - hx * t, ly * c - hy * t, lz * c - hz * t)
+            elif (symbol == u'&' or symbol == u'^'):
+                t = s if symbol == u'&' else -s
+                hx, hy, hz, ux, uy, uz = (hx * c + ux * t, hy * c + uy * t, hz * c + uz * t,
+                                          ux * c - hx * t, uy * c - hy * t, uz * c - hz * t)
+            elif (symbol == u'\\' or symbol == u'/'):
+                t = s if symbol == u'\\' else -s
+                lx, ly, lz, ux, uy, uz = (lx * c + ux * t, ly * c + uy * t, lz * c + uz * t,
+                                          ux * c - lx * t, uy * c - ly * t, uz * c - lz * t)
+            elif (symbol == u'_'):
+                hx, hy, hz, lx, ly, lz = -hx, -hy, -hz, -lx, -ly, -lz
+            elif (symbol == u'['):
+                stack.append((x, y, z, hx, hy, hz, lx, ly, lz, ux, uy, uz))
+            elif (symbol == u']' and stack):
+                x, y, z, hx, hy, hz, lx, ly, lz, ux, uy, uz = stack.pop()
+            elif (symbol == u'*'):
+                flowers.append((x, y, z))
+
+        return (x, y, z, hx, hy, hz, lx, ly, lz, ux, uy, uz)
+
+    # the turtle for (symbol, arguments) modules: like interpret, through a
+    # FrameTable while the frames recur, then by rotating the frame directly
+    def interpretModules(self, modules, branches, flowers, state=START):
+        modules = iter(modules)
+        table = FrameTable(self.angle, self.step)
+        state, stack = self.interpretModuleFrames(modules, branches, flowers, state, table)
+        if (stack is None):
+            return state
+        return self.interpretModulesDirect(modules, branches, flowers, state, stack)
+
+    # interpretFrames for modules: F(l) and f(l) move by their argument, and
+    # turns by an explicit angle are looked up per (frame, command, angle)
+    def interpretModuleFrames(self, modules, branches, flowers, state, table):
+        x, y, z = state[:3]
+        frame = table.intern(state[3:])
+        frames, moves, turns, explicitTurns = table.frames, table.moves, table.turns, table.explicitTurns
+        stack = []
+
+        for symbol, values in modules:
+            if (symbol == u'F' or symbol == u'f'):
+                if (values):
+                    length = values[0]
+                    heading = frames[frame]
+                    nx, ny, nz = x + heading[0] * length, y + heading[1] * length, z + heading[2] * length
+                else:
+                    dx, dy, dz = moves[frame]
+                    nx, ny, nz = x + dx, y + dy, z + dz
+                if (symbol == u'F'):
+                    branches.append((x, y, z, nx, ny, nz))
+                x, y, z = nx, ny, nz
+            elif (symbol in turns):
+                if (values):
+                    turned = explicitTurns.get((frame, symbol, values))
+                    if (turned is None):
+                        turned = table.turnBy(frame, symbol, values)
+                else:
+                    turned = turns[symbol][frame]
+                    if (turned < 0):
+                        turned = table.turn(frame, symbol)
+                if (turned < 0):
+                    # table full: hand the state over with full frames
+                    stack = [item[:3] + frames[item[3]] for item in stack]
+                    state = (x, y, z) + table.rotate(frames[frame], symbol, values)
+                    return state, stack
+                frame = turned
+            elif (symbol == u'['):
+                stack.append((x, y, z, frame))
+            elif (symbol == u']' and stack):
+                x, y, z, frame = stack.pop()
+            elif (symbol == u'*'):
+                flowers.append((x, y, z))
+
+        return (x, y, z) + frames[frame], None
+
+    # interpretDirect for modules, with the cosine and sine of every explicit
+    # turning angle computed once
+    def interpretModulesDirect(self, modules, branches, flowers, state, stack):
+        step = self.step
+        default = (math.cos(math.radians(self.angle)), math.sin(math.radians(self.angle)))
+        angles = {(): default}
+
+        # position, heading, left and up
+        x, y, z, hx, hy, hz, lx, ly, lz, ux, uy, uz = state
+
+        for symbol, values in modules:
+            if (symbol == u'F' or symbol == u'f'):
+                length = values[0] if values else step
+                nx, ny, nz = x + hx * length, y + hy * length, z + hz * length
+                if (symbol == u'F'):
+                    branches.append((x, y, z, nx, ny, nz))
+                x, y, z = nx, ny, nz
+            elif (symbol in TURNS):
+                turn = angles.get(values)
+                if (turn is None):
+                    if (len(angles) >= 4096):
+                        angles = {(): default}
+                    angle = math.radians(values[0])
+                    turn = angles[values] = (math.cos(angle), math.sin(angle))
+                c, t = turn
+                if (symbol == u'+' or symbol == u'-'):
+                    t = t if symbol == u'+' else -t
+                    hx, hy, hz, lx, ly, lz = (hx * c + lx * t, hy * c + ly * t, hz * c + lz * t,
+                                              lx * c - hx * t, ly * c - hy * t, lz * c - hz * t)
+                elif (symbol == u'&' or symbol == u'^'):
+                    t = t if symbol == u'&' else -t
+                    hx, hy, hz, ux, uy, uz = (hx * c + ux * t, hy * c + uy * t, hz * c + uz * t,
+                                              ux * c - hx * t, uy * c - hy * t, uz * c - hz * t)
+                else:
+                    t = t if symbol == u'\\' else -t
+                    lx, ly, lz, ux, uy, uz = (lx * c + ux * t, ly * c + uy * t, lz * c + uz * t,
+                                              ux * c - lx * t, uy * c - ly * t, uz * c - lz * t)
+            elif (symbol == u'_'):
+                hx, hy, hz, lx, ly, lz = -hx, -hy, -hz, -lx, -ly, -lz
+            elif (symbol == u'['):
+                stack.append((x, y, z, hx, hy, hz, lx, ly, lz, ux, uy, uz))
+            elif (symbol == u']' and stack):
+                x, y, z, hx, hy, hz, lx, ly, lz, ux, uy, uz = stack.pop()
+            elif (symbol == u'*'):
+                flowers.append((x, y, z))
+
+        return (x, y, z, hx, hy, hz, lx, ly, lz, ux, uy, uz)
+
+# loads a program (grammar text or an expanded string) into an engine, this
+# one or the compiled one. Builds of the compiled engine without
+# loadProgramFromString read it from a temporary file with loadProgram.
+def loadProgramText(lsystem, program):
+    if (hasattr(lsystem, 'loadProgramFromString')):
+        lsystem.loadProgramFromString(program.encode('utf-8'))
+        return
+    handle, path = tempfile.mkstemp(suffix='.txt')
+    try:
+        with os.fdopen(handle, 'wb') as programFile:
+            programFile.write(program.encode('utf-8'))
+        lsystem.loadProgram(path.encode())
+    finally:
+        os.remove(path)
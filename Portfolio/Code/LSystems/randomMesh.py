@@ -0,0 +1,177 @@
+# randomMesh.py
+#   Generates the points of randomNode on the surface or inside the volume of
+#   a triangle mesh, with numpy. A MeshSampler is made once per mesh. For the
+#   surface it keeps the cumulative areas of the triangles, so a triangle is
+#   picked in proportion to its area with one binary search. For the volume
+#   it builds a bounding volume hierarchy (BVH) of the triangles the first
+#   time it is needed: a point is inside the mesh if a ray from it along +x
+#   crosses the surface an odd number of times, and the BVH only visits the
+#   triangles whose bounds the ray passes through. The mesh must be closed
+#   for the volume to be meaningful.
+#
+#   As in randomPoints, point i only depends on the seed and i, so both
+#   modes can be used with randomPoints.PointStream.
+
+from __future__ import division
+
+import numpy as np
+
+import randomPoints
+
+# triangles per leaf of the BVH
+kLeafSize = 8
+# volume candidates per point before it is given up, for meshes that fill
+# little of their bounding box
+kVolumeAttempts = 64
+# points tested against the BVH at a time, to bound the memory of the pairs
+kQueryBlock = 65536
+
+# 10 bits of every coordinate interleaved, for the Morton order of the BVH
+def mortonCodes(values):
+    codes = np.zeros(len(values), dtype=np.int64)
+    for bit in range(10):
+        for axis in range(values.shape[1]):
+            codes |= ((values[:, axis] >> bit) & 1) << (bit * values.shape[1] + axis)
+    return codes
+
+class MeshSampler(object):
+    def __init__(self, vertices, triangles):
+        vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+        triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+        # the three corners of every triangle, T x 3 each
+        self.corners = [vertices[triangles[:, corner]] for corner in range(3)]
+        a, b, c = self.corners
+        areas = 0.5 * np.sqrt((np.cross(b - a, c - a) ** 2).sum(axis=1))
+        self.cumulative = np.cumsum(areas)
+        self.area = self.cumulative[-1] if len(areas) else 0.0
+        self.low = vertices.min(axis=0) if len(vertices) else np.zeros(3)
+        self.high = vertices.max(axis=0) if len(vertices) else np.zeros(3)
+        self.hierarchy = None
+
+    # the triangles of the surface points with these indices
+    def surfaceTriangles(self, seed, indices):
+        picks = np.searchsorted(self.cumulative, randomPoints.unitHashes(seed, 0, indices) * self.area, side='right')
+        return np.minimum(picks, len(self.cumulative) - 1)
+
+    # points start to stop - 1 on the surface, as an N x 3 array
+    def surfacePoints(self, seed, start, stop):
+        indices = np.arange(start, max(stop, start), dtype=np.uint64)
+        if (not self.area > 0.0):
+            return np.full((len(indices), 3), np.nan)
+        picks = self.surfaceTriangles(seed, indices)
+        # uniform barycentric coordinates
+        root = np.sqrt(randomPoints.unitHashes(seed, 1, indices))[:, np.newaxis]
+        blend = randomPoints.unitHashes(seed, 2, indices)[:, np.newaxis]
+        a, b, c = [corners[picks] for corners in self.corners]
+        return a * (1.0 - root) + b * (root * (1.0 - blend)) + c * (root * blend)
+
+    # unit normals of the triangles under the surface points with these ids
+    def surfaceNormals(self, seed, ids):
+        if (not self.area > 0.0):
+            return np.zeros((len(ids), 3))
+        a, b, c = [corners[self.surfaceTriangles(seed, ids)] for corners in self.corners]
+        normals = np.cross(b - a, c - a)
+        return normals / np.maximum(np.sqrt((normals * normals).sum(axis=1)), 1e-30)[:, np.newaxis]
+
+    # points start to stop - 1 inside the volume, as an N x 3 array. Every
+    # point tries candidates in the bounding box of the mesh until one is
+    # inside, a point that finds none has NaN coordinates.
+    def volumePoints(self, seed, start, stop):
+        indices = np.arange(start, max(stop, start), dtype=np.uint64)
+        points = np.full((len(indices), 3), np.nan)
+        waiting = np.arange(len(indices))
+        for attempt in range(kVolumeAttempts if np.all(self.high > self.low) else 0):
+            candidates = self.low + (self.high - self.low) * np.column_stack(
+                [randomPoints.unitHashes(seed, 3 * attempt + axis, indices[waiting]) for axis in range(3)])
+            inside = self.contains(candidates)
+            points[waiting[inside]] = candidates[inside]
+            waiting = waiting[~inside]
+            if (not len(waiting)):
+                break
+        return points
+
+    # true for the points inside the mesh
+    def contains(self, points):
+        if (self.hierarchy is None):
+            self.hierarchy = self.buildHierarchy()
+        inside = np.zeros(len(points), dtype=bool)
+        for first in range(0, len(points), kQueryBlock):
+            block = points[first:first + kQueryBlock]
+            inside[first:first + kQueryBlock] = self.crossings(block) % 2 == 1
+        return inside
+
+    # The BVH over the triangles as seen along x: the triangles are sorted
+    # along a Morton curve of their centers in y and z and cut into leaves of
+    # kLeafSize, with a complete binary tree above them. levels holds the
+    # bounds (y min, z min, y max, z max, x max) of the nodes of every level,
+    # from the root down to the leaves. The bounds and the corners of the
+    # triangles are kept in the sorted order too, padded with triangles that
+    # nothing crosses, so the triangles of leaf n are the rows
+    # n * kLeafSize to (n + 1) * kLeafSize - 1.
+    def buildHierarchy(self):
+        a, b, c = self.corners
+        count = len(a)
+        leafCount = max(-(-count // kLeafSize), 1)
+        width = 1
+        while (width < leafCount):
+            width *= 2
+
+        centers = (a[:, 1:] + b[:, 1:] + c[:, 1:]) / 3.0
+        span = np.maximum(self.high[1:] - self.low[1:], 1e-30)
+        cells = np.clip(((centers - self.low[1:]) / span * 1023.0).astype(np.int64), 0, 1023)
+        order = np.argsort(mortonCodes(cells), kind='mergesort')
+        corners = np.full((width * kLeafSize, 9), np.nan)
+        corners[:count] = np.concatenate((a[order], b[order], c[order]), axis=1)
+
+        bounds = np.empty((width * kLeafSize, 5))
+        bounds[:, :2] = np.inf
+        bounds[:, 2:] = -np.inf
+        bounds[:count, 0:2] = np.minimum(np.minimum(a[order, 1:], b[order, 1:]), c[order, 1:])
+        bounds[:count, 2:4] = np.maximum(np.maximum(a[order, 1:], b[order, 1:]), c[order, 1:])
+        bounds[:count, 4] = np.maximum(np.maximum(a[order, 0], b[order, 0]), c[order, 0])
+        leaves = bounds.reshape(width, kLeafSize, 5)
+        level = np.concatenate((leaves[:, :, :2].min(axis=1), leaves[:, :, 2:].max(axis=1)), axis=1)
+        levels = [level]
+        while (len(level) > 1):
+            pairs = level.reshape(-1, 2, 5)
+            level = np.concatenate((pairs[:, :, :2].min(axis=1), pairs[:, :, 2:].max(axis=1)), axis=1)
+            levels.append(level)
+        levels.reverse()
+        return levels, bounds, corners
+
+    # number of triangles crossed by the rays from the points along +x
+    def crossings(self, points):
+        levels, bounds, corners = self.hierarchy
+        x, y, z = points[:, 0], points[:, 1], points[:, 2]
+
+        # (point, node) pairs whose node bounds the ray passes through, one
+        # level at a time down to the leaves, then down to their triangles
+        queries = np.arange(len(points))
+        nodes = np.zeros(len(points), dtype=np.int64)
+        for depth, boxes in enumerate(levels + [bounds]):
+            if (depth == len(levels)):
+                queries = np.repeat(queries, kLeafSize)
+                nodes = (kLeafSize * nodes[:, np.newaxis] + np.arange(kLeafSize)).ravel()
+            elif (depth > 0):
+                queries = np.repeat(queries, 2)
+                nodes = (2 * nodes[:, np.newaxis] + np.arange(2)).ravel()
+            box = boxes[nodes]
+            qy, qz = y[queries], z[queries]
+            hit = ((qy >= box[:, 0]) & (qy <= box[:, 2]) & (qz >= box[:, 1]) & (qz <= box[:, 3]) &
+                   (x[queries] <= box[:, 4]))
+            queries, nodes = queries[hit], nodes[hit]
+
+        # the ray crosses a triangle if the point is inside it seen along x,
+        # where the weights of its corners all have the same sign, and the
+        # crossing is in front of the point
+        ax, ay, az, bx, by, bz, cx, cy, cz = corners[nodes].T
+        qy, qz = y[queries], z[queries]
+        weightA = (cy - by) * (qz - bz) - (cz - bz) * (qy - by)
+        weightB = (ay - cy) * (qz - cz) - (az - cz) * (qy - cy)
+        weightC = (by - ay) * (qz - az) - (bz - az) * (qy - ay)
+        within = (((weightA > 0.0) & (weightB > 0.0) & (weightC > 0.0)) |
+                  ((weightA < 0.0) & (weightB < 0.0) & (weightC < 0.0)))
+        total = np.where(within, weightA + weightB + weightC, 1.0)
+        crossing = (weightA * ax + weightB * bx + weightC * cx) / total
+        ahead = within & (crossing > x[queries])
+        return np.bincount(queries[ahead], minlength=len(points))
@@ -2,11 +2,24 @@
 #   Produces random locations to be used with the Maya instancer node.
 
 import sys
-import random
+
+import LSystemGrammar
+
+try:
+    import numpy as np
+    import LSystemArrays
+    import randomMesh
+    import randomPoints
+except ImportError:
+    # numpy is not available, hash one point at a time
+    LSystemArrays = None
+    randomMesh = None
+    randomPoints = None
 
 import maya.OpenMaya as OpenMaya
 import maya.OpenMayaAnim as OpenMayaAnim
 import maya.OpenMayaMPx as OpenMayaMPx
+import maya.OpenMayaRender as OpenMayaRender
 import maya.cmds as cmds
 
 # Useful functions for declaring attributes as inputs or outputs.
@@ -28,12 +41,33 @@ kPluginNodeTypeName = "randomNode"
 # other nodes!
 randomNodeId = OpenMaya.MTypeId(0x8704)
 
+# Distributions of the points
+kUniform = 0
+kPoissonDisk = 1
+
+# Shapes the points fill
+kBox = 0
+kMeshSurface = 1
+kMeshVolume = 2
+
+# Rotations of the points
+kRotationNone = 0
+kRotationRandom = 1
+kRotationNormal = 2
+
 # Node definition
 class randomNode(OpenMayaMPx.MPxNode):
-    # Declare class variables:
-    # TODO:: declare the input and output class variables
-    #         i.e. inNumPoints = OpenMaya.MObject()
+    # Declare class variables
     inNumPoints = OpenMaya.MObject()
+    inSeed = OpenMaya.MObject()
+    inMode = OpenMaya.MObject()
+    inMinDistance = OpenMaya.MObject()
+    inShape = OpenMaya.MObject()
+    inMesh = OpenMaya.MObject()
+    inScaleMin = OpenMaya.MObject()
+    inScaleMax = OpenMaya.MObject()
+    inRotation = OpenMaya.MObject()
+    inDensityMap = OpenMaya.MObject()
     inXMax = OpenMaya.MObject()
     inYMax = OpenMaya.MObject()
     inZMax = OpenMaya.MObject()
@@ -43,20 +77,40 @@ class randomNode(OpenMayaMPx.MPxNode):
     inMax = OpenMaya.MObject()
     inMin = OpenMaya.MObject()
     outPoints = OpenMaya.MObject()
-    
+
     # constructor
     def __init__(self):
         OpenMayaMPx.MPxNode.__init__(self)
+        # the unit cube points generated so far, for the current seed
+        self.stream = None
+        # the Poisson-disk points of the box, with the inputs they were made for
+        self.poisson = None
+        # the randomMesh.MeshSampler of inMesh, None until it is read
+        self.sampler = None
 
     # compute
     def compute(self,plug,data):
-        # TODO:: create the main functionality of the node. Your node should 
-        #         take in three floats for max position (X,Y,Z), three floats 
-        #         for min position (X,Y,Z), and the number of random points to
-        #         be generated. Your node should output an MFnArrayAttrsData 
-        #         object containing the random points. Consult the homework
-        #         sheet for how to deal with creating the MFnArrayAttrsData.
         if (plug == randomNode.outPoints):
+            # the inputs are read once, not once per point
+            count = max(data.inputValue(randomNode.inNumPoints).asInt(), 0)
+            seed = data.inputValue(randomNode.inSeed).asInt()
+            mode = data.inputValue(randomNode.inMode).asShort()
+            distance = data.inputValue(randomNode.inMinDistance).asFloat()
+            shape = data.inputValue(randomNode.inShape).asShort()
+            scaleMin = data.inputValue(randomNode.inScaleMin).asFloat()
+            scaleMax = data.inputValue(randomNode.inScaleMax).asFloat()
+            rotation = data.inputValue(randomNode.inRotation).asShort()
+            # the value of inDensityMap is a constant density, unless a texture is connected
+            color = data.inputValue(randomNode.inDensityMap).asFloatVector()
+            density = (color.x + color.y + color.z) / 3.0
+            densityMap = self.densityMapSource()
+            minimum = (data.inputValue(randomNode.inXMin).asFloat(),
+                       data.inputValue(randomNode.inYMin).asFloat(),
+                       data.inputValue(randomNode.inZMin).asFloat())
+            maximum = (data.inputValue(randomNode.inXMax).asFloat(),
+                       data.inputValue(randomNode.inYMax).asFloat(),
+                       data.inputValue(randomNode.inZMax).asFloat())
+
             pointsData = data.outputValue(randomNode.outPoints)
             pointsAAD = OpenMaya.MFnArrayAttrsData()
             pointsObject = pointsAAD.create()
@@ -64,32 +118,198 @@ class randomNode(OpenMayaMPx.MPxNode):
             positionArray = pointsAAD.vectorArray("position")
             idArray = pointsAAD.doubleArray("id")
 
+            if (randomPoints is not None):
+                if (shape == kBox):
+                    points, ids = self.boxPoints(count, seed, mode, distance, minimum, maximum)
+                    low, high = minimum, maximum
+                else:
+                    points, ids = self.meshPoints(data, count, seed, mode, distance, shape)
+                    low, high = self.sampler.low, self.sampler.high
+                if (densityMap or density < 1.0):
+                    densities = (self.densities(densityMap, points, low, high) if densityMap else
+                                 np.full(len(points), density))
+                    keep = randomPoints.densityMask(seed, ids, densities)
+                    points, ids = points[keep], ids[keep]
 
-            for i in range(data.inputValue(randomNode.inNumPoints).asInt()):
-                x = random.uniform(data.inputValue(randomNode.inXMin).asFloat(),
-                                   data.inputValue(randomNode.inXMax).asFloat())
-                y = random.uniform(data.inputValue(randomNode.inYMin).asFloat(),
-                                   data.inputValue(randomNode.inYMax).asFloat())
-                z = random.uniform(data.inputValue(randomNode.inZMin).asFloat(),
-                                   data.inputValue(randomNode.inZMax).asFloat())
-                positionArray.append(OpenMaya.MVector(x, y, z))
-                idArray.append(i)
+                # every array is made for all the points at once and copied in bulk
+                LSystemArrays.fillVectorArray(positionArray, points)
+                LSystemArrays.fillDoubleArray(idArray, ids)
+                LSystemArrays.fillVectorArray(pointsAAD.vectorArray("scale"),
+                                              randomPoints.randomScales(seed, ids, scaleMin, scaleMax))
+                if (rotation == kRotationRandom):
+                    LSystemArrays.fillVectorArray(pointsAAD.vectorArray("rotation"),
+                                                  randomPoints.randomRotations(seed, ids))
+                elif (rotation == kRotationNormal and shape == kMeshSurface):
+                    LSystemArrays.fillVectorArray(pointsAAD.vectorArray("aimDirection"),
+                                                  self.sampler.surfaceNormals(seed, ids))
+            else:
+                if (mode == kPoissonDisk or shape != kBox or densityMap or density < 1.0 or scaleMin != 1.0 or
+                    scaleMax != 1.0 or rotation != kRotationNone):
+                    sys.stderr.write("%s: Poisson-disk points, mesh points and per-point attributes need numpy, "
+                                     "using uniform points in the box\n" % kPluginNodeTypeName)
+                # the same hashes as randomPoints, so both give the same points
+                for i in range(count):
+                    positionArray.append(OpenMaya.MVector(
+                        *[minimum[k] + (maximum[k] - minimum[k]) * LSystemGrammar.unitHash(seed, k, i)
+                          for k in range(3)]))
+                    idArray.append(i)
 
             pointsData.setMObject(pointsObject)
             data.setClean(plug)
 
-    
+    # a new mesh is only read at the next compute that needs it
+    def setDependentsDirty(self, plug, plugArray):
+        if (plug == randomNode.inMesh):
+            self.sampler = None
+            self.poisson = None
+        return OpenMayaMPx.MPxNode.setDependentsDirty(self, plug, plugArray)
+
+    # the points in the box and their ids
+    def boxPoints(self, count, seed, mode, distance, minimum, maximum):
+        if (mode == kPoissonDisk):
+            # inNumPoints caps the number of points (0 keeps them all), which
+            # are in random order, so fewer points still cover the whole box
+            points = self.poissonPoints(seed, minimum, maximum, distance)[:count or None]
+            return points, np.arange(len(points))
+        # point i only depends on the seed and i, so a new count only
+        # generates the points that were not there before
+        units = self.pointStream(seed, randomPoints.unitPoints).points(count)
+        return randomPoints.boxPoints(units, minimum, maximum), np.arange(count)
+
+    # the points on or in the mesh and their ids. Poisson-disk points are
+    # only made inside the volume, the surface always uses uniform points.
+    def meshPoints(self, data, count, seed, mode, distance, shape):
+        sampler = self.meshSampler(data)
+        if (shape == kMeshVolume and mode == kPoissonDisk):
+            points = self.poissonPoints(seed, tuple(sampler.low), tuple(sampler.high), distance,
+                                        sampler)[:count or None]
+            return points, np.arange(len(points))
+        if (mode == kPoissonDisk):
+            sys.stderr.write("%s: Poisson-disk points are not supported on the mesh surface, "
+                             "using %d uniform points\n" % (kPluginNodeTypeName, count))
+        generate = sampler.surfacePoints if shape == kMeshSurface else sampler.volumePoints
+        points = self.pointStream(seed, generate).points(count)
+        # volume points that found no place inside the mesh are left out
+        ids = np.flatnonzero(~np.isnan(points[:, 0]))
+        return points[ids], ids
+
+    # the point stream of a seed and generator, kept while they stay the same
+    def pointStream(self, seed, generate):
+        if (self.stream is None or self.stream.seed != seed or self.stream.generate != generate):
+            self.stream = randomPoints.PointStream(seed, generate)
+        return self.stream
+
+    # the Poisson-disk points of a box, or of the part of it inside the mesh
+    # of a sampler, generated again only when the inputs change
+    def poissonPoints(self, seed, minimum, maximum, distance, sampler=None):
+        key = (seed, minimum, maximum, distance, sampler is None)
+        if (self.poisson is None or self.poisson[0] != key):
+            try:
+                points = randomPoints.poissonPoints(minimum, maximum, distance, seed)
+            except ValueError as error:
+                sys.stderr.write("%s: %s\n" % (kPluginNodeTypeName, error))
+                points = np.zeros((0, 3))
+            if (sampler is not None):
+                points = points[sampler.contains(points)]
+            self.poisson = (key, points)
+        return self.poisson[1]
+
+    # the plug connected to inDensityMap (e.g. "noise1.outColor"), or an empty
+    # string. The connection dirties outPoints when the texture changes, and
+    # its source is sampled as a shading network.
+    def densityMapSource(self):
+        sources = OpenMaya.MPlugArray()
+        OpenMaya.MPlug(self.thisMObject(), randomNode.inDensityMap).connectedTo(sources, True, False)
+        if (sources.length() == 0):
+            return ''
+        return sources[0].name()
+
+    # the density map sampled at the points: the average of its color
+    # channels. 2D textures are sampled with u and v from x and z across the
+    # bounds of the points, 3D textures at the points themselves.
+    def densities(self, densityMap, points, low, high):
+        if (len(points) == 0):
+            return np.zeros(0)
+        low = np.asarray(low, dtype=np.float64)
+        uvs = (points - low) / np.maximum(np.asarray(high, dtype=np.float64) - low, 1e-30)
+        colors = OpenMaya.MFloatVectorArray()
+        transparencies = OpenMaya.MFloatVectorArray()
+        try:
+            OpenMayaRender.MRenderUtil.sampleShadingNetwork(
+                densityMap, len(points), False, False, OpenMaya.MFloatMatrix(), LSystemArrays.floatPointArray(points),
+                LSystemArrays.floatArray(uvs[:, 0]), LSystemArrays.floatArray(uvs[:, 2]),
+                None, None, None, None, None, colors, transparencies)
+        except RuntimeError:
+            sys.stderr.write("%s: Failed to sample the density map %s\n" % (kPluginNodeTypeName, densityMap))
+            return np.ones(len(points))
+        return LSystemArrays.floatVectorArrayValues(colors).mean(axis=1)
+
+    # the sampler of inMesh, read and built once per mesh. Mesh data has no
+    # transform, so connect a worldMesh plug to sample in world space.
+    def meshSampler(self, data):
+        if (self.sampler is None):
+            vertices, triangles = np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+            meshObject = data.inputValue(randomNode.inMesh).asMesh()
+            if (not meshObject.isNull()):
+                meshFn = OpenMaya.MFnMesh(meshObject)
+                points = OpenMaya.MPointArray()
+                meshFn.getPoints(points, OpenMaya.MSpace.kObject)
+                counts = OpenMaya.MIntArray()
+                vertexIds = OpenMaya.MIntArray()
+                meshFn.getTriangles(counts, vertexIds)
+                vertices = LSystemArrays.pointArrayValues(points)
+                triangles = LSystemArrays.intArrayValues(vertexIds)
+            self.sampler = randomMesh.MeshSampler(vertices, triangles)
+        return self.sampler
+
 # initializer
 def nodeInitializer():
-    # TODO:: initialize the input and output attributes. Be sure to use the
-    #         MAKE_INPUT and MAKE_OUTPUT functions.
-
     tAttr = OpenMaya.MFnTypedAttribute()
     nAttr = OpenMaya.MFnNumericAttribute()
+    eAttr = OpenMaya.MFnEnumAttribute()
 
+    # the number of points. Poisson-disk points are as many as fit, and this
+    # only caps them: 0 keeps them all.
     randomNode.inNumPoints = nAttr.create('inNumPoints', 'n', OpenMaya.MFnNumericData.kInt, 0)
     MAKE_INPUT(nAttr)
 
+    randomNode.inSeed = nAttr.create('inSeed', 'sd', OpenMaya.MFnNumericData.kInt, 0)
+    MAKE_INPUT(nAttr)
+
+    randomNode.inMode = eAttr.create('inMode', 'mo', kUniform)
+    eAttr.addField('uniform', kUniform)
+    eAttr.addField('poissonDisk', kPoissonDisk)
+    MAKE_INPUT(eAttr)
+    randomNode.inMinDistance = nAttr.create('inMinDistance', 'md', OpenMaya.MFnNumericData.kFloat, 1.0)
+    nAttr.setMin(0.0)
+    MAKE_INPUT(nAttr)
+
+    randomNode.inShape = eAttr.create('inShape', 'sh', kBox)
+    eAttr.addField('box', kBox)
+    eAttr.addField('meshSurface', kMeshSurface)
+    eAttr.addField('meshVolume', kMeshVolume)
+    MAKE_INPUT(eAttr)
+    randomNode.inMesh = tAttr.create('inMesh', 'ime', OpenMaya.MFnData.kMesh)
+    MAKE_INPUT(tAttr)
+    tAttr.setKeyable(False)
+
+    # range of the random uniform scales, the rotations of the points, and the
+    # chance that a point is kept: the average of the channels of a texture
+    # connected to inDensityMap (e.g. noise1.outColor), sampled at the points,
+    # or of its color when nothing is connected
+    randomNode.inScaleMin = nAttr.create('inScaleMin', 'smn', OpenMaya.MFnNumericData.kFloat, 1.0)
+    MAKE_INPUT(nAttr)
+    randomNode.inScaleMax = nAttr.create('inScaleMax', 'smx', OpenMaya.MFnNumericData.kFloat, 1.0)
+    MAKE_INPUT(nAttr)
+    randomNode.inRotation = eAttr.create('inRotation', 'rt', kRotationNone)
+    eAttr.addField('none', kRotationNone)
+    eAttr.addField('random', kRotationRandom)
+    eAttr.addField('surfaceNormal', kRotationNormal)
+    MAKE_INPUT(eAttr)
+    randomNode.inDensityMap = nAttr.createColor('inDensityMap', 'dm')
+    nAttr.setDefault(1.0, 1.0, 1.0)
+    MAKE_INPUT(nAttr)
+
     randomNode.inXMax = nAttr.create('inXMax', 'xa', OpenMaya.MFnNumericData.kFloat, 0.0)
     MAKE_INPUT(nAttr)
     randomNode.inYMax = nAttr.create('inYMax', 'ya', OpenMaya.MFnNumericData.kFloat, 0.0)
@@ -114,15 +334,31 @@ def nodeInitializer():
     MAKE_OUTPUT(tAttr)
 
     try:
-        # TODO:: add the attributes to the node and set up the
-        #         attributeAffects (addAttribute, and attributeAffects)
         randomNode.addAttribute(randomNode.inNumPoints)
+        randomNode.addAttribute(randomNode.inSeed)
+        randomNode.addAttribute(randomNode.inMode)
+        randomNode.addAttribute(randomNode.inMinDistance)
+        randomNode.addAttribute(randomNode.inShape)
+        randomNode.addAttribute(randomNode.inMesh)
+        randomNode.addAttribute(randomNode.inScaleMin)
+        randomNode.addAttribute(randomNode.inScaleMax)
+        randomNode.addAttribute(randomNode.inRotation)
+        randomNode.addAttribute(randomNode.inDensityMap)
         randomNode.addAttribute(randomNode.inMax)
 
         randomNode.addAttribute(randomNode.inMin)
         randomNode.addAttribute(randomNode.outPoints)
 
         randomNode.attributeAffects(randomNode.inNumPoints, randomNode.outPoints)
+        randomNode.attributeAffects(randomNode.inSeed, randomNode.outPoints)
+        randomNode.attributeAffects(randomNode.inMode, randomNode.outPoints)
+        randomNode.attributeAffects(randomNode.inMinDistance, randomNode.outPoints)
+        randomNode.attributeAffects(randomNode.inShape, randomNode.outPoints)
+        randomNode.attributeAffects(randomNode.inMesh, randomNode.outPoints)
+        randomNode.attributeAffects(randomNode.inScaleMin, randomNode.outPoints)
+        randomNode.attributeAffects(randomNode.inScaleMax, randomNode.outPoints)
+        randomNode.attributeAffects(randomNode.inRotation, randomNode.outPoints)
+        randomNode.attributeAffects(randomNode.inDensityMap, randomNode.outPoints)
         randomNode.attributeAffects(randomNode.inMax, randomNode.outPoints)
         randomNode.attributeAffects(randomNode.inMin, randomNode.outPoints)
 
@@ -0,0 +1,229 @@
+# randomPoints.py
+#   Generates the points of randomNode for the whole point count at once, with
+#   numpy. Nothing here uses Maya, so the generation can be timed and checked
+#   on its own.
+#
+#   Random numbers come from a counter-based generator: coordinate k of point
+#   i is a hash of (seed, k, i), the same as LSystemGrammar.unitHash(seed, k,
+#   i). A point never depends on the points before it, so the same seed gives
+#   the same points in every session and on every machine, and more points
+#   only add to the end of the ones already there.
+
+import numpy as np
+
+MASK = (1 << 64) - 1
+
+# uniform numbers in [0, 1) for the given seed, level and indices, computed
+# like LSystemGrammar.unitHash in wrapping 64-bit arithmetic
+def unitHashes(seed, level, indices):
+    with np.errstate(over='ignore'):
+        z = np.asarray(indices, dtype=np.uint64) * np.uint64(0x94D049BB133111EB)
+        z += np.uint64((seed * 0x9E3779B97F4A7C15 + level * 0xBF58476D1CE4E5B9 + 1) & MASK)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z ^= z >> np.uint64(31)
+    return (z >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+# points start to stop - 1 of the unit cube for a seed, as an N x 3 array
+def unitPoints(seed, start, stop):
+    indices = np.arange(start, max(stop, start), dtype=np.uint64)
+    return np.column_stack([unitHashes(seed, axis, indices) for axis in range(3)])
+
+# count points uniformly distributed in the box from minimum to maximum
+# (x, y, z), as a count x 3 array
+def uniformPoints(count, minimum, maximum, seed=0):
+    return boxPoints(unitPoints(seed, 0, count), minimum, maximum)
+
+# unit cube points moved into the box from minimum to maximum
+def boxPoints(units, minimum, maximum):
+    low = np.asarray(minimum, dtype=np.float64)
+    high = np.asarray(maximum, dtype=np.float64)
+    return low + (high - low) * units
+
+# Levels of the hashes of the per-point attributes, apart from the ones the
+# positions use. Like the positions they are hashes of the point ids, so a
+# point keeps its scale, rotation and density test when the count changes.
+kScaleLevel = 1000
+kRotationLevel = 1001
+kDensityLevel = 1004
+
+# uniform scales from low to high for the points with these ids, N x 3
+def randomScales(seed, ids, low, high):
+    scales = low + (high - low) * unitHashes(seed, kScaleLevel, ids)
+    return np.repeat(scales[:, np.newaxis], 3, axis=1)
+
+# uniformly distributed orientations for the points with these ids, as
+# rotation angles in degrees for Maya's xyz rotate order (N x 3), from random
+# unit quaternions
+def randomRotations(seed, ids):
+    u1, u2, u3 = [unitHashes(seed, kRotationLevel + k, ids) for k in range(3)]
+    x = np.sqrt(1.0 - u1) * np.sin(2.0 * np.pi * u2)
+    y = np.sqrt(1.0 - u1) * np.cos(2.0 * np.pi * u2)
+    z = np.sqrt(u1) * np.sin(2.0 * np.pi * u3)
+    w = np.sqrt(u1) * np.cos(2.0 * np.pi * u3)
+    # the matrix of the rotation is Rz * Ry * Rx
+    r00 = 1.0 - 2.0 * (y * y + z * z)
+    r10 = 2.0 * (x * y + w * z)
+    r20 = 2.0 * (x * z - w * y)
+    r21 = 2.0 * (y * z + w * x)
+    r22 = 1.0 - 2.0 * (x * x + y * y)
+    return np.degrees(np.column_stack((np.arctan2(r21, r22), np.arcsin(np.clip(-r20, -1.0, 1.0)),
+                                       np.arctan2(r10, r00))))
+
+# true for the points kept by their densities, from 0 (never) to 1 (always)
+def densityMask(seed, ids, densities):
+    return unitHashes(seed, kDensityLevel, ids) < densities
+
+# The points of one seed generated so far, unit cube points by default, or
+# the points of generate(seed, start, stop) for points start to stop - 1.
+# Asking for more points only generates the new ones, and asking for fewer
+# returns a view of the first ones. The storage doubles as it grows, so
+# raising the count one point at a time stays linear overall.
+class PointStream(object):
+    def __init__(self, seed, generate=unitPoints):
+        self.seed = seed
+        self.generate = generate
+        self.values = np.zeros((0, 3))
+        self.count = 0
+
+    def points(self, count):
+        count = max(count, 0)
+        if (count > self.count):
+            if (count > len(self.values)):
+                grown = np.empty((max(count, 2 * len(self.values)), 3))
+                grown[:self.count] = self.values[:self.count]
+                self.values = grown
+            self.values[self.count:count] = self.generate(self.seed, self.count, count)
+            self.count = count
+        return self.values[:count]
+
+# Poisson-disk sampling: no two points closer than the minimum distance. The
+# box is divided into a background grid of cells of side distance / sqrt(3),
+# which can hold one point each, so a candidate only has to be checked
+# against the points of the cells around its own, as in Bridson's algorithm.
+# Instead of growing out of one point at a time, the cells are visited in 27
+# phases (their coordinates modulo 3): two cells of a phase are too far apart
+# for their points to conflict, so every cell of a phase is tried at once,
+# with up to kPoissonTrials candidates each. The phases are repeated over
+# kPoissonPasses passes, each visiting a growing random share of the cells,
+# so that the first phase does not fill a regular lattice of cells.
+kPoissonTrials = 12
+kPoissonPasses = 8
+# about 4.5 million points in a cube
+kMaxPoissonCells = 1 << 25
+kPoissonBlock = 16384
+
+# offsets of the cells that can hold a point closer than the minimum distance
+# to a point of the center cell
+def neighborOffsets():
+    steps = np.arange(-2, 3)
+    offsets = np.array(np.meshgrid(steps, steps, steps, indexing='ij')).reshape(3, -1).T
+    gaps = np.maximum(np.abs(offsets) - 1, 0)
+    return offsets[((gaps * gaps).sum(axis=1) < 3) & (np.abs(offsets).sum(axis=1) > 0)]
+
+# points in the box from minimum to maximum at least distance apart, as an
+# N x 3 array. The points are in random order, so the first ones of the array
+# are spread over the whole box too.
+def poissonPoints(minimum, maximum, distance, seed=0, trials=kPoissonTrials, passes=kPoissonPasses):
+    low = np.asarray(minimum, dtype=np.float64)
+    high = np.asarray(maximum, dtype=np.float64)
+    size = np.maximum(high - low, 0.0)
+    side = distance / np.sqrt(3.0)
+    cellCounts = np.where(size > 0.0, np.ceil(size / side), 1.0)
+    if (not distance > 0.0 or np.prod(cellCounts) > kMaxPoissonCells):
+        raise ValueError('the minimum distance %g is too small for the box' % distance)
+    dims = cellCounts.astype(np.int64)
+    extent = np.where(size > 0.0, side, 0.0)
+
+    # the grid holds the index of the point of every cell, or -1, with a
+    # margin of two empty cells so neighbors never fall outside
+    padded = dims + 4
+    strides = np.array([padded[1] * padded[2], padded[2], 1])
+    grid = np.full(int(np.prod(padded)), -1, dtype=np.int32)
+    offsets = neighborOffsets().dot(strides)
+    # cells with a point, or left empty after their trials
+    done = np.zeros(int(np.prod(dims)), dtype=bool)
+    coordinates = [np.zeros(1024) for axis in range(3)]
+    count = 0
+    squared = distance * distance
+
+    for visit in range(passes):
+        phases = np.argsort(unitHashes(seed, 4, np.arange(27 * visit, 27 * visit + 27)))
+        for phase in phases:
+            start = np.unravel_index(phase, (3, 3, 3))
+            phaseCells = np.ravel_multi_index(np.mgrid[start[0]:dims[0]:3, start[1]:dims[1]:3,
+                                                  start[2]:dims[2]:3].reshape(3, -1), dims)
+            phaseCells = phaseCells[~done[phaseCells]]
+            if (visit < passes - 1):
+                share = unitHashes(seed, 5, phaseCells.astype(np.uint64) * np.uint64(passes) + np.uint64(visit))
+                phaseCells = phaseCells[share < (visit + 1.0) / passes]
+            # a few thousand cells at a time, which keeps the grid and points
+            # they look at in the processor's cache
+            for first in range(0, len(phaseCells), kPoissonBlock):
+                cells = phaseCells[first:first + kPoissonBlock]
+                corners = np.unravel_index(cells, dims)
+                flat = (corners[0] + 2) * strides[0] + (corners[1] + 2) * strides[1] + corners[2] + 2
+
+                # (cell, point) pairs of the cells and the points around them
+                pairCells, pairPoints = [], []
+                for offset in offsets:
+                    neighbors = grid[flat + offset]
+                    found = np.flatnonzero(neighbors >= 0)
+                    pairCells.append(found)
+                    pairPoints.append(neighbors[found])
+                pairCells = np.concatenate(pairCells)
+                pairPoints = np.concatenate(pairPoints)
+
+                # one trial at a time for the cells still without a point
+                waiting = np.arange(len(cells))
+                paired = len(cells)
+                pairCoordinates = [coordinates[axis][pairPoints] for axis in range(3)]
+                accepted = []
+                chosen = []
+                for attempt in range(trials):
+                    # the pairs of cells that got a point are only dropped once
+                    # there are enough of them, until then they point to a last
+                    # candidate that is infinitely far away
+                    if (2 * len(waiting) < paired):
+                        keep = np.zeros(len(cells), dtype=bool)
+                        keep[waiting] = True
+                        keep = keep[pairCells]
+                        pairCells = pairCells[keep]
+                        pairCoordinates = [values[keep] for values in pairCoordinates]
+                        paired = len(waiting)
+                    slots = np.full(len(cells), len(waiting), dtype=np.int64)
+                    slots[waiting] = np.arange(len(waiting))
+                    pairSlots = slots[pairCells]
+
+                    trial = cells[waiting].astype(np.uint64) * np.uint64(trials) + np.uint64(attempt)
+                    candidates = [np.append(low[axis] + (corners[axis][waiting] + unitHashes(seed, axis, trial)) *
+                                            extent[axis], np.inf) for axis in range(3)]
+                    blocked = np.zeros(len(waiting) + 1, dtype=bool)
+                    for axis in range(3):
+                        blocked |= candidates[axis] > high[axis]
+                    nearest = np.zeros(len(pairSlots))
+                    for axis in range(3):
+                        gap = candidates[axis][pairSlots] - pairCoordinates[axis]
+                        nearest += gap * gap
+                    blocked[pairSlots[nearest < squared]] = True
+                    free = np.flatnonzero(~blocked[:-1])
+                    accepted.append(waiting[free])
+                    chosen.append(np.column_stack([candidates[axis][free] for axis in range(3)]))
+                    waiting = waiting[blocked[:-1]]
+                    if (not len(waiting)):
+                        break
+                accepted = np.concatenate(accepted)
+                chosen = np.concatenate(chosen)
+                added = len(accepted)
+                if (count + added > len(coordinates[0])):
+                    capacity = max(count + added, 2 * len(coordinates[0]))
+                    coordinates = [np.concatenate((values[:count], np.zeros(capacity - count))) for values in coordinates]
+                for axis in range(3):
+                    coordinates[axis][count:count + added] = chosen[:, axis]
+                grid[flat[accepted]] = np.arange(count, count + added)
+                done[cells] = True
+                count += added
+
+    points = np.column_stack([values[:count] for values in coordinates])
+    order = np.argsort(unitHashes(seed, 6, np.arange(count)))
+    return points[order]
@@ -0,0 +1,9 @@
+# conftest.py
+#   Lets the tests import the plug-in modules from the directory above. The
+#   tested modules do not need Maya; the Maya arrays are replaced by the
+#   stand-ins of LSystemBenchmark.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,34 @@
+# test_LSystemArrays.py
+#   Copies into Maya arrays, with the OpenMaya stand-ins of LSystemBenchmark.
+
+import numpy as np
+import pytest
+
+import LSystemArrays
+import LSystemBenchmark
+
+@pytest.fixture(autouse=True)
+def standIn(monkeypatch):
+    monkeypatch.setattr(LSystemArrays, 'OpenMaya', LSystemBenchmark.OpenMayaStandIn)
+
+# the values copied into a stand-in array
+def copied(array):
+    return list(array.values.values)
+
+def test_fill_vector_array():
+    values = np.arange(12, dtype=np.float32).reshape(4, 3)[::-1] * 0.5
+    vectorArray = LSystemBenchmark.MArray()
+    LSystemArrays.fillVectorArray(vectorArray, values)
+    assert copied(vectorArray) == values.ravel().tolist()
+
+def test_fill_int_and_double_arrays():
+    intArray, doubleArray = LSystemBenchmark.MArray(), LSystemBenchmark.MArray()
+    LSystemArrays.fillIntArray(intArray, np.array([3, -1, 7], dtype=np.int64))
+    LSystemArrays.fillDoubleArray(doubleArray, [0.25, 1e10, -3.0])
+    assert copied(intArray) == [3, -1, 7]
+    assert copied(doubleArray) == [0.25, 1e10, -3.0]
+
+def test_fill_empty_clears():
+    vectorArray = LSystemBenchmark.MArray([1, 2])
+    LSystemArrays.fillVectorArray(vectorArray, np.zeros((0, 3)))
+    assert vectorArray.length() == 0
@@ -0,0 +1,40 @@
+# test_LSystemBaked.py
+#   Baked files and the disk cache made of them.
+
+import os
+
+import numpy as np
+import pytest
+
+import LSystemBaked
+
+BLOCKS = [(u'branchPositions', np.arange(12, dtype=np.float32).reshape(4, 3)),
+          (u'branchScales', np.linspace(0.0, 1.0, 15).reshape(5, 3)),
+          (u'flowerPositions', np.zeros((0, 3)))]
+INFO = {u'grammar': u'F\nF->F[+F]F', u'iterations': 3, u'angle': 25.7}
+
+def test_written_file_reads_back(tmp_path):
+    path = str(tmp_path / ('tree' + LSystemBaked.EXTENSION))
+    LSystemBaked.write(path, BLOCKS, INFO)
+    baked = LSystemBaked.read(path)
+    assert baked.info == INFO
+    assert list(baked.blocks) == [name for name, values in BLOCKS]
+    for name, values in BLOCKS:
+        np.testing.assert_array_equal(baked.blocks[name], values.astype(np.float32))
+    assert [entry for entry in os.listdir(str(tmp_path))] == ['tree' + LSystemBaked.EXTENSION]
+
+def test_truncated_file_is_rejected(tmp_path):
+    path = str(tmp_path / ('tree' + LSystemBaked.EXTENSION))
+    LSystemBaked.write(path, BLOCKS, INFO)
+    with open(path, 'r+b') as bakedFile:
+        bakedFile.truncate(os.path.getsize(path) - 16)
+    with pytest.raises(ValueError):
+        LSystemBaked.read(path)
+
+def test_cache_keeps_the_newest_files_within_its_limit(tmp_path):
+    cache = LSystemBaked.BakedCache(str(tmp_path), 1)
+    cache.put(u'first', BLOCKS, INFO)
+    assert cache.get(u'first') is None
+    cache = LSystemBaked.BakedCache(str(tmp_path), 1 << 20)
+    cache.put(u'second', BLOCKS, INFO)
+    assert cache.get(u'second').info == INFO
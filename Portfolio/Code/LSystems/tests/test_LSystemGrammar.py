@@ -0,0 +1,31 @@
+# test_LSystemGrammar.py
+#   Parsing of duplicate productions, and loading programs into an engine.
+
+import LSystemGrammar
+import LSystemPy
+
+def test_unweighted_duplicates_keep_the_last(capsys):
+    grammar = LSystemGrammar.parseGrammar(u'F\nF->F+F\nF->F[-F]F')
+    assert not grammar.extended
+    assert grammar.rules == {u'F': u'F[-F]F'}
+    assert u'unweighted productions for F' in capsys.readouterr().err
+
+def test_weighted_duplicates_are_stochastic():
+    grammar = LSystemGrammar.parseGrammar(u'F\nF->(1)F+F\nF->(2)F[-F]F')
+    assert grammar.stochastic
+    assert [production.weight for production in grammar.productions[u'F']] == [1.0, 2.0]
+
+def test_conditional_productions_are_kept():
+    grammar = LSystemGrammar.parseGrammar(u'A(1)\nA(x):x<2->A(x+1)\nA(x):x>=2->F(x)\nA(x)->F')
+    assert len(grammar.productions[u'A']) == 3
+
+# an engine built without loadProgramFromString
+class FileEngine(object):
+    def loadProgram(self, path):
+        with open(path, 'rb') as programFile:
+            self.program = programFile.read().decode('utf-8')
+
+def test_program_is_loaded_from_a_file_without_load_from_string():
+    engine = FileEngine()
+    LSystemPy.loadProgramText(engine, u'F\nF->F[+F]F')
+    assert engine.program == u'F\nF->F[+F]F'
@@ -0,0 +1,40 @@
+# test_LSystemGrowth.py
+#   Birth times against the turtle, which ignores a "]" with nothing to pop.
+
+import numpy as np
+import pytest
+
+import LSystemGrowth
+import LSystemPy
+
+PROGRAMS = [u'F[+F]F[-F]F', u'F]F[+F]F', u']]F[F[+F]F]F', u'F[F[+F*', u'F[+F*]F]]F*[F]F']
+
+# the number of segments on the path to every F and *, from a turtle stack
+def turtleCounts(program):
+    counts, stack, count = [], [], 0
+    for symbol in program:
+        if (symbol == u'F'):
+            counts.append(count)
+            count += 1
+        elif (symbol == u'*'):
+            counts.append(count)
+        elif (symbol == u'['):
+            stack.append(count)
+        elif (symbol == u']' and stack):
+            count = stack.pop()
+    return counts
+
+@pytest.mark.parametrize('program', PROGRAMS)
+def test_births_match_turtle(program):
+    branchBirths, flowerBirths = LSystemGrowth.birthTimes(program)
+    branches, flowers = [], []
+    LSystemPy.LSystem().interpret(program, branches, flowers)
+    assert len(branchBirths) == len(branches)
+    assert len(flowerBirths) == len(flowers)
+
+    counts = turtleCounts(program)
+    segments = [count for count, symbol in zip(counts, [s for s in program if s in u'F*']) if symbol == u'F']
+    opened = [count for count, symbol in zip(counts, [s for s in program if s in u'F*']) if symbol == u'*']
+    np.testing.assert_array_equal(branchBirths[:, 0], segments)
+    np.testing.assert_array_equal(branchBirths[:, 1], np.asarray(segments) + 1.0)
+    np.testing.assert_array_equal(flowerBirths, opened)
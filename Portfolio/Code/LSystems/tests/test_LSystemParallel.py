@@ -0,0 +1,41 @@
+# test_LSystemParallel.py
+#   Interpreting on a process pool against interpreting on one process.
+
+import numpy as np
+import pytest
+
+import LSystemBenchmark
+import LSystemGrammar
+import LSystemParallel
+import LSystemPy
+
+GRAMMARS = [
+    (u'X\nX->F-[[X]+X]+F[+FX]-X\nF->FF', 22.5, 4),
+    (u'A\nA->[&FA*]/////[&FA*]///////[&FA*]\nF->S/////F\nS->F', 22.5, 5),
+]
+
+@pytest.fixture
+def pool():
+    yield
+    LSystemParallel.closePool()
+
+@pytest.mark.parametrize('text, angle, iterations', GRAMMARS)
+@pytest.mark.parametrize('processes', [2, 3])
+def test_parallel_equals_serial(pool, text, angle, iterations, processes):
+    program = LSystemBenchmark.expand(LSystemGrammar.parseGrammar(text), iterations, 0)
+    lsystem = LSystemPy.LSystem()
+    lsystem.setDefaultAngle(angle)
+    lsystem.setDefaultStep(1.0)
+    branches, flowers = LSystemPy.FloatBuffer(6), LSystemPy.FloatBuffer(3)
+    lsystem.interpret(program, branches, flowers)
+
+    parallelBranches, parallelFlowers = LSystemPy.FloatBuffer(6), LSystemPy.FloatBuffer(3)
+    LSystemParallel.interpret(program, angle, 1.0, processes, parallelBranches, parallelFlowers)
+
+    # the chunks start from frames found on the top-level symbols only, which
+    # can round differently in the last bits
+    assert len(parallelBranches) == len(branches) and len(parallelFlowers) == len(flowers)
+    np.testing.assert_allclose(np.frombuffer(parallelBranches.data, dtype=np.float32),
+                               np.frombuffer(branches.data, dtype=np.float32), atol=1e-5)
+    np.testing.assert_allclose(np.frombuffer(parallelFlowers.data, dtype=np.float32),
+                               np.frombuffer(flowers.data, dtype=np.float32), atol=1e-5)
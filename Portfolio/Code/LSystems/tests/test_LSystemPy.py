@@ -0,0 +1,40 @@
+# test_LSystemPy.py
+#   The depth-first engine against the level by level rewrite of the grammar.
+
+import numpy as np
+import pytest
+
+import LSystemBenchmark
+import LSystemGrammar
+import LSystemPy
+
+# every grammar of the benchmark corpus at its smallest iteration count
+CASES = [(text, angle, iterations[0]) for name, text, angle, iterations in LSystemBenchmark.CORPUS]
+IDS = [name for name, text, angle, iterations in LSystemBenchmark.CORPUS]
+
+def rows(buffer, columns):
+    return np.asarray(list(buffer), dtype=np.float64).reshape(-1, columns)
+
+# the symbols streamed by processPy draw the same tree as the expanded string
+@pytest.mark.parametrize('text, angle, iterations', CASES, ids=IDS)
+def test_streamed_equals_rewritten(text, angle, iterations):
+    seed = 7
+    lsystem = LSystemPy.LSystem()
+    lsystem.setDefaultAngle(angle)
+    lsystem.setDefaultStep(1.0)
+    lsystem.setSeed(seed)
+    lsystem.loadProgramFromString(text)
+    branches, flowers = LSystemPy.FloatBuffer(6), LSystemPy.FloatBuffer(3)
+    lsystem.processPy(iterations, branches, flowers)
+
+    grammar = LSystemGrammar.parseGrammar(text)
+    expanded = LSystemBenchmark.expand(grammar, iterations, seed)
+    expandedBranches, expandedFlowers = LSystemBenchmark.turtle(grammar, expanded, angle, 1.0, seed, swapYZ=False)
+
+    assert len(branches) > 0
+    np.testing.assert_allclose(rows(branches, 6), rows(expandedBranches, 6), rtol=1e-5, atol=1e-4)
+    np.testing.assert_allclose(rows(flowers, 3), rows(expandedFlowers, 3), rtol=1e-5, atol=1e-4)
+
+def test_invalid_expression_is_a_grammar_error():
+    with pytest.raises(LSystemGrammar.GrammarError):
+        LSystemGrammar.parseGrammar(u'A(1)\nA(x)->F(__import__(x))')
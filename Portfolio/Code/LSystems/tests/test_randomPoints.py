@@ -0,0 +1,23 @@
+# test_randomPoints.py
+#   The Poisson-disk points of randomNode.
+
+import numpy as np
+import pytest
+
+import randomPoints
+
+@pytest.mark.parametrize('maximum', [(4.0, 3.0, 2.0), (6.0, 6.0, 0.0)])
+@pytest.mark.parametrize('seed', [0, 5])
+def test_poisson_minimum_distance(maximum, seed):
+    distance = 0.5
+    points = randomPoints.poissonPoints((0.0, 0.0, 0.0), maximum, distance, seed)
+    assert len(points) > 10
+    assert np.all(points >= 0.0) and np.all(points <= maximum)
+    gaps = points[:, np.newaxis, :] - points[np.newaxis, :, :]
+    squared = (gaps * gaps).sum(axis=2)
+    np.fill_diagonal(squared, np.inf)
+    assert squared.min() >= distance * distance * (1.0 - 1e-9)
+
+def test_poisson_too_many_cells():
+    with pytest.raises(ValueError):
+        randomPoints.poissonPoints((0.0, 0.0, 0.0), (1000.0, 1000.0, 1000.0), 0.001)